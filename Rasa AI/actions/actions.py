@@ -1,20 +1,34 @@
-import firebase_admin
+import logging
 import uuid
-import pytz
-import re  # Add this for regex pattern matching
-from firebase_admin import credentials
-from firebase_admin import db
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
-import json
+import heapq
+import itertools
+from collections import deque
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk import Action, Tracker
 from rasa_sdk.events import SlotSet
 from rasa_sdk.events import AllSlotsReset, Restarted
-import pandas as pd
 from math import radians, cos, sin, asin, sqrt
 from . import map_cal as city_map  # This is correct, no change needed
-import requests  # Add requests library for HTTP calls
+from . import rtdb
+from .availability import get_availability_engine
+from .booking_config import get_booking_config
+from .booking_writes import SLOT_TAKEN, book_slot, booking_fee_transaction, release_slot
+from .expertise_index import get_expertise_index
+from .handyman_directory import get_handyman_directory
+from .io_pool import ThreadedAction
+from .job_index import get_busy_slot_index
+from .log import get_logger
+from .message_parser import parse_booking_message
+from .nlu_client import get_nlu_client
+from .spatial_index import get_handyman_spatial_index
+from .town_resolver import resolve_town, town_distance
+from .turn_reads import TurnReads
+from .user_profiles import get_user_profiles
+from .job_queries import assigned_to_date_key
+
+log = get_logger(__name__)
 
 # Define expertise mapping globally so all action classes can access it
 expertise_mapping = {
@@ -35,69 +49,43 @@ expertise_mapping = {
     'report_issue_cleaner': 'Cleaner',
 }
 
-# Initialize Firebase with credentials based on environment
-# This allows both local development (with service account file)
-# and production deployment (with environment variables)
-try:
-    # First try to use environment variables if they exist (for production)
-    if os.environ.get('FIREBASE_CONFIG'):
-        firebase_config = json.loads(os.environ.get('FIREBASE_CONFIG'))
-        cred = credentials.Certificate(firebase_config)
-        firebase_database_url = os.environ.get('FIREBASE_DATABASE_URL', 
-                               "https://your-default-database-url.firebaseio.com/")
-    else:
-        # Fall back to local file (for development)
-        cred = credentials.Certificate("config/serviceAccountKey.json")
-        firebase_database_url = "https://your-default-database-url.firebaseio.com/"
-    
-    # Initialize the app with a service account
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': firebase_database_url
-    })
-    print("Firebase initialization successful")
-except Exception as e:
-    print(f"Firebase initialization error: {e}")
+# Firebase is initialized on the first database call (see rtdb.reference), not on import
 
 # Define helper function for intent classification using Rasa HTTP API
 def classify_text_with_rasa_server(problem_text):
     """
-    Use Rasa's HTTP API to classify text using the currently loaded model
+    Use Rasa's HTTP API to classify text using the currently loaded model.
+
+    Goes through the shared NLU client (pooled connection, timeouts, cache
+    per model, coalesced duplicate requests), see nlu_client.py.
     """
-    try:
-        response = requests.post(
-            "http://localhost:5005/model/parse", 
-            json={"text": problem_text}
-        )
-        parsed_data = response.json()
-        return parsed_data['intent']['name'], parsed_data['intent'].get('confidence', 0)
-    except Exception as e:
-        print(f"Error calling Rasa NLU: {e}")
-        return "unknown", 0
+    return get_nlu_client().classify(problem_text)
 
-class ActionInitializeUserSession(Action):
+class ActionInitializeUserSession(ThreadedAction, Action):
     def name(self):
         return "action_initialize_user_session"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain):
+    def run_sync(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain):
         # Extract user ID and other metadata
         metadata = tracker.latest_message.get("metadata", {})
         user_id = metadata.get("user_id") or tracker.sender_id
         user_name = metadata.get("user_name", "User")
 
-        # Store user information in Firebase
-        ref = db.reference(f'/users/{user_id}')
-        user_data = ref.get()
+        # A new session reads the profile fresh (it may have changed in the app),
+        # and the rest of the conversation uses the cached copy
+        profiles = get_user_profiles()
+        profile = profiles.get(user_id, refresh=True)
         
-        if not user_data:
-            # If user doesn't exist, create a basic entry
-            ref.update({
+        if not profile.exists:
+            # If user doesn't exist, create a basic entry (written through the cache)
+            profiles.update(user_id, {
                 'id': user_id,
                 'name': user_name,
                 'createdAt': int(datetime.now().timestamp() * 1000)
             })
-            print(f"Created new user: {user_id} ({user_name})")
+            log.info("Created new user: %s (%s)", user_id, user_name)
         else:
-            print(f"User session initialized: {user_id} ({user_name})")
+            log.info("User session initialized: %s (%s)", user_id, user_name)
 
         # No need for a response message as this is just initialization
         return []
@@ -106,15 +94,15 @@ class ActionResetConversation(Action):
     def name(self):
         return "action_reset_conversation"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         # Reset all slots and restart the conversation
         return [AllSlotsReset(), Restarted()]
 
-class ActionSuggestHandyman(Action):
+class ActionSuggestHandyman(ThreadedAction, Action):
     def name(self):
         return "action_suggest_handyman"
 
-    def run(self, dispatcher, tracker, domain):
+    def run_sync(self, dispatcher, tracker, domain):
         # Initialize the response variable at the beginning
         response = "I couldn't find any handyman matching your requirements."
         user_problem = tracker.latest_message.get("text", "")
@@ -123,13 +111,8 @@ class ActionSuggestHandyman(Action):
         # Get user ID from sender ID
         user_id = tracker.sender_id
         
-        # Get user's city from Firebase
-        user_ref = db.reference(f'/users/{user_id}')
-        user_data = user_ref.get()
-        
-        user_city = None
-        if user_data and 'primaryAddress' in user_data:
-            user_city = user_data['primaryAddress'].get('city')
+        # Get user's city from the cached profile
+        user_city = get_user_profiles().get(user_id).city
         
         if not user_city:
             # Try to get from slot as fallback
@@ -164,8 +147,9 @@ class ActionSuggestHandyman(Action):
             dispatcher.utter_message(text=response)
             return []
 
-        # Use the helper function to find matching handymen
-        city_handymen, other_handymen = get_matching_handymen(problem, user_city)
+        # Use the helper function to find matching handymen: the top 3 in the
+        # user's city and the top 5 elsewhere are all this action shows
+        city_handymen, other_handymen = get_matching_handymen(problem, user_city, city_limit=3, other_limit=5)
         
         if not (city_handymen or other_handymen):
             response = "There seems to be an issue fetching handyman data. Please try again later."
@@ -174,9 +158,6 @@ class ActionSuggestHandyman(Action):
 
         # First check if we have handymen in the user's city
         if city_handymen:
-            # Sort handymen by rating in descending order
-            city_handymen = sorted(city_handymen, key=lambda x: x.get("average_rating", 0) or x.get("rating", 0), reverse=True)
-            
             # Create a text response for platforms that don't support cards
             response = f"Here are some recommended {problem.lower()} experts in {user_city}:\n"
             for h in city_handymen[:3]:  # Show top 3 handymen
@@ -220,7 +201,6 @@ class ActionSuggestHandyman(Action):
                 ]
             )
             # Save the filtered handymen list for later use if user decides to look outside location
-            other_handymen = sorted(other_handymen, key=lambda x: x.get("average_rating", 0) or x.get("rating", 0), reverse=True)
             return [
                 SlotSet("problem", user_problem),
                 SlotSet("handymen_from_other_locations", [h.get('id') for h in other_handymen[:5]])
@@ -239,12 +219,12 @@ class ActionSuggestHandyman(Action):
         # Add expertise_type to returned slots to be used by ActionShowOtherLocations
         return [SlotSet("problem", user_problem), SlotSet("expertise_type", problem)]
 
-class ActionShowOtherLocations(Action):
+class ActionShowOtherLocations(ThreadedAction, Action):
     def name(self):
         return "action_show_other_locations"
 
 
-    def run(self, dispatcher, tracker, domain):
+    def run_sync(self, dispatcher, tracker, domain):
         SlotSet("handyman_name", None),
         SlotSet("handyman_id", None),
         SlotSet("chosen_date", None),
@@ -254,11 +234,10 @@ class ActionShowOtherLocations(Action):
         required_expertise = tracker.get_slot("expertise_type")
         user_location = tracker.get_slot("user_location") or "Unknown"
         
-        print(f"Looking for handymen outside user location: {user_location}")
+        log.debug("Looking for handymen outside user location: %s", user_location)
         
-        # Reference to handymen in the database
-        ref = db.reference('/handymen')
-        handymen_data = ref.get()
+        # Handymen are served from the shared in-process directory
+        handymen_data = get_handyman_directory().all()
         
         if not handymen_data:
             dispatcher.utter_message(text="Sorry, I couldn't access the handyman database right now.")
@@ -288,36 +267,22 @@ class ActionShowOtherLocations(Action):
             if not required_expertise:
                 required_expertise = "Handyman"
         
-        print(f"Using expertise: {required_expertise} for searching handymen in other locations")
+        log.debug("Using expertise: %s for searching handymen in other locations", required_expertise)
             
-        # Find handymen from other locations who match the expertise
-        other_handymen = []
-        for h_id, h_data in handymen_data.items():
-            # Add handyman ID to the data
-            h_data['id'] = h_id
-            
-            # Check if handyman matches the expertise and is from a different location
-            handyman_expertises = h_data.get('expertise', [])
-            
-            if (h_data.get('city', '').lower() != user_location.lower() and
-                isinstance(handyman_expertises, list) and
-                any(required_expertise.lower() in exp.lower() for exp in handyman_expertises if isinstance(exp, str))):
-                other_handymen.append(h_data)
-                
-        # Sort handymen by rating
-        other_handymen = sorted(
-            other_handymen, 
-            key=lambda x: x.get("average_rating", 0) or x.get("rating", 0), 
-            reverse=True
-        )
+        # Find handymen from other locations who match the expertise, best rated
+        # first (merged from the per-city leaderboards, no sorting needed)
+        directory = get_handyman_directory()
+        handymen_ids = get_expertise_index().top(required_expertise, exclude_city=user_location)
                 
-        if other_handymen:
+        if handymen_ids:
             # First send a text message
             dispatcher.utter_message(text=f"Here are {required_expertise.lower()} experts available in other areas:")
             
             # Create structured data for card display
             handyman_cards = []
-            for h in other_handymen[:3]:  # Limit to 3 handymen
+            for h in map(directory.get, handymen_ids[:3]):  # Limit to 3 handymen
+                if not h:
+                    continue
                 handyman_cards.append({
                     "name": h.get('name', 'Unknown'),
                     "rating": h.get('average_rating') or h.get('rating', 0),
@@ -337,9 +302,6 @@ class ActionShowOtherLocations(Action):
                 }
             )
             
-            # Set slot with handymen IDs from other locations
-            handymen_ids = [h['id'] for h in other_handymen]
-            
             # Send follow-up message separately with explicit instruction to SELECT the handyman
             dispatcher.utter_message(text="Please select one of these experts to view their availability.")
             
@@ -354,11 +316,11 @@ class ActionShowOtherLocations(Action):
             dispatcher.utter_message(text=response)
             return []
     
-class ActionBookHandyman(Action):
+class ActionBookHandyman(ThreadedAction, Action):
     def name(self):
         return "action_book_handyman"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain):
+    def run_sync(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain):
         # First check if we have a handyman ID from previous selections or from entity
         handyman_id = tracker.get_slot("handyman_id")
         handyman_id_entity = next(tracker.get_latest_entity_values("handyman_id"), None)
@@ -374,11 +336,10 @@ class ActionBookHandyman(Action):
                 # Fall back to getting text if no entity was extracted
                 handyman_name = tracker.latest_message.get("text")
             
-        print(f"Looking up handyman - ID: {handyman_id}, Name: {handyman_name}")
+        log.debug("Looking up handyman - ID: %s, Name: %s", handyman_id, handyman_name)
         
-        # Reference to handymen in the database
-        ref = db.reference('/handymen')
-        handymen_data = ref.get()
+        # Handymen are served from the shared in-process directory
+        handymen_data = get_handyman_directory().all()
         
         if not handymen_data:
             dispatcher.utter_message(text="Sorry, I couldn't access the handyman database right now.")
@@ -390,7 +351,7 @@ class ActionBookHandyman(Action):
             # Direct lookup by ID is most reliable
             handyman = handymen_data[handyman_id]
             handyman["id"] = handyman_id
-            print(f"Found handyman by ID: {handyman.get('name')}")
+            log.debug("Found handyman by ID: %s", handyman.get('name'))
         elif handyman_name:
             # Fallback to name lookup if ID not available
             for h_id, h_data in handymen_data.items():
@@ -400,7 +361,7 @@ class ActionBookHandyman(Action):
                     handyman = h_data
                     handyman["id"] = h_id
                     handyman_id = h_id
-                    print(f"Found handyman by name: {handyman_name} → {handyman.get('name')}")
+                    log.debug("Found handyman by name: %s → %s", handyman_name, handyman.get('name'))
                     break
                 
         if handyman:
@@ -409,94 +370,28 @@ class ActionBookHandyman(Action):
                      SlotSet("handyman_id", handyman['id'])]
             
             # Always check availability regardless of which handyman was selected
-            busy_slots = {}
-            
-            # Check the handyman's existing jobs to determine availability
-            jobs_ref = db.reference('/jobs')
-            jobs_data = jobs_ref.get() or {}
-
-            # Define standard time slots
-            slots = {
-                "Slot 1": ("08:00 AM", "12:00 PM"),
-                "Slot 2": ("01:00 PM", "05:00 PM"),
-                "Slot 3": ("06:00 PM", "10:00 PM"),
-            }
-
-            # Find existing jobs for this handyman
-            if jobs_data:
-                for job_id, job in jobs_data.items():
-                    if job.get("assigned_to") == handyman_id and job.get("status") in ["Pending", "In-Progress"]:
-                        try:
-                            job_timestamp = job.get("starttimestamp", "")
-                            if not job_timestamp:
-                                continue
-                                
-                            # Parse the timestamp properly
-                            if "T" in job_timestamp:
-                                job_date_str = job_timestamp.split("T")[0]
-                                job_date = datetime.strptime(job_date_str, "%Y-%m-%d").date()
-                                job_slot = job.get("assigned_slot")
-                                
-                                if job_date not in busy_slots:
-                                    busy_slots[job_date] = []
-                                busy_slots[job_date].append(job_slot)
-                        except Exception as e:
-                            print(f"Error processing job timestamp: {e}")
-
-            # Generate availability for the next 7 days
-            today = datetime.today()
-            available_schedule = []
-
-            for i in range(7):  # Next 7 days
-                current_date = today + timedelta(days=i)
-                day_name = current_date.strftime("%A")
-                
-                # Default: all slots available
-                available_slots = list(slots.keys())
-                
-                # Check if any slots are already booked for this date
-                if current_date.date() in busy_slots:
-                    for booked_slot in busy_slots[current_date.date()]:
-                        if booked_slot in available_slots:
-                            available_slots.remove(booked_slot)
-
-                # For today, remove slots that have already passed
-                if current_date.date() == today.date():
-                    current_hour = today.hour
-                    if current_hour >= 12:  # After 12:00 PM
-                        if "Slot 1" in available_slots:
-                            available_slots.remove("Slot 1")
-                    if current_hour >= 17:  # After 5:00 PM
-                        if "Slot 2" in available_slots:
-                            available_slots.remove("Slot 2")
-                    if current_hour >= 22:  # After 10:00 PM
-                        if "Slot 3" in available_slots:
-                            available_slots.remove("Slot 3")
-
-                if available_slots:
-                    date_str = current_date.strftime('%Y-%m-%d')
-                    available_schedule.append({
-                        "day": day_name,
-                        "date": date_str,
-                        "slots": available_slots
-                    })
+            # Free slots for the next 7 days come from the shared availability engine
+            available_schedule = [
+                {
+                    "day": day.strftime("%A"),
+                    "date": day.isoformat(),
+                    "slots": free_slots
+                }
+                for day, free_slots in get_availability_engine().weekly_schedule(handyman_id)
+            ]
     
-class ActionCheckHandymanSchedule(Action):
+class ActionCheckHandymanSchedule(ThreadedAction, Action):
     def name(self):
         return "action_check_availability"
 
-    def run(self, dispatcher, tracker, domain):
+    def run_sync(self, dispatcher, tracker, domain):
         handyman_name = tracker.get_slot("handyman_name")
         if not handyman_name:
             dispatcher.utter_message(text="Please specify which handyman you'd like to check.")
             return []
 
         # Database references
-        handymen_ref = db.reference('/handymen')
-        jobs_ref = db.reference('/jobs')
-        
-        handymen_data = handymen_ref.get()
-        jobs_data = jobs_ref.get() or {}
+        handymen_data = get_handyman_directory().all()
 
         # Find the handyman by name
         handyman = None
@@ -508,84 +403,17 @@ class ActionCheckHandymanSchedule(Action):
                 break
                 
         # Debug print to see what data we're working with
-        print(f"DEBUG - Handyman data: {handyman}")
-        print(f"DEBUG - Jobs data: {len(jobs_data) if jobs_data else 0} jobs found")
+        log.debug("Handyman data: %s", handyman)
                 
         if not handyman:
             dispatcher.utter_message(text=f"Sorry, I couldn't find any handyman named {handyman_name}.")
             return []
 
-        # Define standard time slots
-        slots = {
-            "Slot 1": ("08:00 AM", "12:00 PM"),
-            "Slot 2": ("01:00 PM", "05:00 PM"),
-            "Slot 3": ("06:00 PM", "10:00 PM"),
-        }
-
-        # Find existing jobs for this handyman
-        busy_slots = {}
-        if jobs_data:
-            for job_id, job in jobs_data.items():
-                if job.get("assigned_to") == handyman_id and job.get("status") in ["Pending", "In-Progress"]:
-                    try:
-                        job_timestamp = job.get("starttimestamp", "")
-                        if not job_timestamp:
-                            continue
-                            
-                        # Parse the timestamp properly
-                        if "T" in job_timestamp:
-                            job_date_str = job_timestamp.split("T")[0]
-                            job_date = datetime.strptime(job_date_str, "%Y-%m-%d").date()
-                            job_slot = job.get("assigned_slot")
-                            
-                            if job_date not in busy_slots:
-                                busy_slots[job_date] = []
-                            busy_slots[job_date].append(job_slot)
-                    except Exception as e:
-                        print(f"Error processing job timestamp: {e}")
-
-        # Debug print
-        print(f"DEBUG - Busy slots: {busy_slots}")
-
-        # Generate availability for the next 7 days
-        today = datetime.today()
-        available_schedule = []
-
-        # First check if you have any available slots at all
-        has_available_slots = False
-
-        for i in range(7):  # Next 7 days
-            current_date = today + timedelta(days=i)
-            day_name = current_date.strftime("%A")
-            
-            # Default: all slots available
-            available_slots = list(slots.keys())
-            
-            # Check if any slots are already booked for this date
-            if current_date.date() in busy_slots:
-                for booked_slot in busy_slots[current_date.date()]:
-                    if booked_slot in available_slots:
-                        available_slots.remove(booked_slot)
-
-            # For today, remove slots that have already passed
-            if current_date.date() == today.date():
-                current_hour = today.hour
-                if current_hour >= 12:  # After 12:00 PM
-                    if "Slot 1" in available_slots:
-                        available_slots.remove("Slot 1")
-                if current_hour >= 17:  # After 5:00 PM
-                    if "Slot 2" in available_slots:
-                        available_slots.remove("Slot 2")
-                if current_hour >= 22:  # After 10:00 PM
-                    if "Slot 3" in available_slots:
-                        available_slots.remove("Slot 3")
-
-            if available_slots:
-                has_available_slots = True
-                date_str = current_date.strftime('%Y-%m-%d')
-                available_schedule.append(
-                    f"{day_name} ({date_str}): {', '.join(available_slots)}"
-                )
+        # Free slots for the next 7 days (booked and already passed slots removed)
+        available_schedule = [
+            f"{day.strftime('%A')} ({day.isoformat()}): {', '.join(free_slots)}"
+            for day, free_slots in get_availability_engine().weekly_schedule(handyman_id)
+        ]
 
         # Format response
         if available_schedule:
@@ -596,11 +424,11 @@ class ActionCheckHandymanSchedule(Action):
         dispatcher.utter_message(text=response)
         return [SlotSet("handyman_name", handyman_name)]
 
-class ActionConfirmBooking(Action):
+class ActionConfirmBooking(ThreadedAction, Action):
     def name(self):
         return "action_confirm_booking"
 
-    def run(self, dispatcher, tracker, domain):
+    def run_sync(self, dispatcher, tracker, domain, reads=None):
         chosen_slot = tracker.get_slot("chosen_slot")
         chosen_date = tracker.get_slot("chosen_date")
         handyman_name = tracker.get_slot("handyman_name")
@@ -612,76 +440,30 @@ class ActionConfirmBooking(Action):
             dispatcher.utter_message(text="I'm missing some information for your booking. Please specify the date, time slot, handyman, and service needed.")
             return []
 
-        # Map slots to times
-        slot_times = {
-            "Slot 1": ("08:00", "12:00"),
-            "Slot 2": ("13:00", "17:00"),
-            "Slot 3": ("18:00", "22:00")
-        }
+        # Start the independent reads together (reusing the caller's, if it passed them)
+        reads = reads or TurnReads()
+        reads.fetch(('profile', user_id), get_user_profiles().get, user_id)
+        reads.fetch(('handyman', handyman_id), get_handyman_directory().get, handyman_id)
 
-        if chosen_slot in slot_times:
-            start_time, end_time = slot_times[chosen_slot]
+        # Slot times and the fare come from the booking configuration snapshot
+        config = get_booking_config()
+        slot_times = config.schedule.times
 
+        if chosen_slot in slot_times:
             # Convert chosen_date and slot times to ISO 8601 format without milliseconds
             try:
-                date_format = "%Y-%m-%d"
-                start_datetime = datetime.strptime(chosen_date, date_format).replace(
-                    hour=int(start_time.split(":")[0]),
-                    minute=int(start_time.split(":")[1])
-                )
-                end_datetime = datetime.strptime(chosen_date, date_format).replace(
-                    hour=int(end_time.split(":")[0]),
-                    minute=int(end_time.split(":")[1])
-                )
-                
-                # Format timestamps to match the expected format (with .000Z)
-                start_timestamp = start_datetime.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-                end_timestamp = end_datetime.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                # Timestamps match the expected format (with .000Z)
+                start_timestamp, end_timestamp = config.schedule.timestamps(chosen_slot, chosen_date)
+                booking_day = datetime.strptime(chosen_date, "%Y-%m-%d")
                 
-                # Get user's address from Firebase if available
-                user_ref = db.reference(f'/users/{user_id}')
-                user_data = user_ref.get() or {}
+                # Get user's address from the cached profile
+                profile = reads.result(('profile', user_id), get_user_profiles().get, user_id)
                 
-                address = "Default Address"
-                latitude = 3.1751817
-                longitude = 101.6173767
-                
-                # Fix address parsing in ActionShowBookingDetails 
-                if user_data and 'primaryAddress' in user_data:
-                    address_data = user_data['primaryAddress']
-                    address_parts = []
-                    
-                    # Use the actual field names from your Firebase structure
-                    if 'unitName' in address_data and address_data['unitName']:
-                        address_parts.append(address_data['unitName'])
-                    
-                    if 'buildingName' in address_data and address_data['buildingName']:
-                        address_parts.append(address_data['buildingName'])
-                    
-                    if 'streetName' in address_data and address_data['streetName']:
-                        address_parts.append(address_data['streetName'])
-                    
-                    if 'city' in address_data and address_data['city']:
-                        address_parts.append(address_data['city'])
-                    
-                    if 'postalCode' in address_data and address_data['postalCode']:
-                        address_parts.append(address_data['postalCode'])
-                    
-                    if 'country' in address_data and address_data['country']:
-                        address_parts.append(address_data['country'])
-                    
-                    if address_parts:
-                        address = ", ".join(address_parts)
-                    
-                    # Get coordinates if available
-                    if 'latitude' in address_data and 'longitude' in address_data:
-                        latitude = address_data['latitude']
-                        longitude = address_data['longitude']
+                address = profile.address or "Default Address"
+                latitude, longitude = profile.coordinates or (3.1751817, 101.6173767)
                 
                 # Get handyman's expertise that matches the user's problem
-                handymen_ref = db.reference('/handymen')
-                handymen_data = handymen_ref.get() or {}
-                handyman_data = handymen_data.get(handyman_id, {})
+                handyman_data = reads.result(('handyman', handyman_id), get_handyman_directory().get, handyman_id) or {}
                 
                 # Get the expertise array or create empty list if not found
                 expertise_list = handyman_data.get("expertise", [])
@@ -713,6 +495,7 @@ class ActionConfirmBooking(Action):
                     "booking_id": booking_id,
                     "assigned_slot": chosen_slot,
                     "assigned_to": handyman_id,  # This was missing in your original code
+                    "assigned_to_date": assigned_to_date_key(handyman_id, booking_day),
                     "description": problem,
                     "category": category,
                     "endtimestamp": end_timestamp,
@@ -726,27 +509,17 @@ class ActionConfirmBooking(Action):
                     "longitude": longitude
                 }
                 
-                # Save the booking to Firebase
-                ref = db.reference(f"/jobs/{booking_id}")
-                ref.set(booking_data)
-                
-                # Add booking fee transaction
-                txn_ref = db.reference("/walletTransactions")
+                # Booking fee transaction
                 txn_id = str(uuid.uuid4())
 
-                # Get standard booking fee from fare table
-                fare_ref = db.reference('/fare')
-                fare_data = fare_ref.get() or {}
-                booking_fee = fare_data.get('amount', 20)  # Default to 20 if not found
-
-                txn_ref.child(txn_id).set({
-                    "amount": -booking_fee,  # Use the value from fare table instead of hardcoded -20
-                    "bookingId": booking_id,
-                    "description": f"Processing fee for booking {booking_id}",
-                    "timestamp": int(datetime.now().timestamp() * 1000),
-                    "transactionType": "booking-fee",
-                    "userId": user_id
-                })
+                # Standard booking fee from the fare table
+                booking_fee = config.fare
+                txn_data = booking_fee_transaction(booking_id, user_id, booking_fee)
+
+                # Reserve the slot, then save the booking and the fee together
+                if book_slot(booking_id, booking_data, txn_id, txn_data) == SLOT_TAKEN:
+                    dispatcher.utter_message(text=slot_taken_message(handyman_name, chosen_date, chosen_slot))
+                    return [SlotSet("chosen_slot", None), SlotSet("booking_confirmed", False)]
 
                 confirmation_message = (
                     f"✅ Your booking is confirmed!\n\n"
@@ -761,7 +534,7 @@ class ActionConfirmBooking(Action):
                 return [SlotSet("booking_confirmed", True), SlotSet("booking_id", booking_id)]
             
             except Exception as e:
-                print(f"Error creating booking: {e}")
+                log.exception("Error creating booking: %s", e)
                 dispatcher.utter_message(text="Sorry, there was a problem creating your booking. Please try again.")
                 return []
 
@@ -769,20 +542,22 @@ class ActionConfirmBooking(Action):
             dispatcher.utter_message(text=f"I couldn't find a handyman named '{handyman_name}'. Could you please choose from the list of available experts?")
             return []
     
-class ActionCancelBooking(Action):
+class ActionCancelBooking(ThreadedAction, Action):
     def name(self):
         return "action_cancel_booking"
 
-    def run(self, dispatcher, tracker, domain):
+    def run_sync(self, dispatcher, tracker, domain):
         booking_id = tracker.get_slot("booking_id")
         
         if booking_id:
             # Update the booking status in Firebase
-            ref = db.reference(f"/jobs/{booking_id}")
+            ref = rtdb.reference(f"/jobs/{booking_id}")
             booking_data = ref.get()
             
             if booking_data:
                 ref.update({"status": "Cancelled"})
+                get_busy_slot_index().release_job(booking_id)
+                release_slot(booking_id, booking_data)
                 dispatcher.utter_message(text=f"Your booking has been canceled. The booking fee is non-refundable.")
             else:
                 dispatcher.utter_message(text="I couldn't find your booking in the system.")
@@ -799,11 +574,11 @@ class ActionCancelBooking(Action):
             SlotSet("booking_id", None),
         ]
 
-class ActionShowBookingDetails(Action):
+class ActionShowBookingDetails(ThreadedAction, Action):
     def name(self):
         return "action_show_booking_details"
 
-    def run(self, dispatcher, tracker, domain):
+    def run_sync(self, dispatcher, tracker, domain):
         # Get slot values
         chosen_slot = tracker.get_slot("chosen_slot")
         chosen_date = tracker.get_slot("chosen_date")
@@ -812,71 +587,38 @@ class ActionShowBookingDetails(Action):
         problem = tracker.get_slot("problem")
         user_id = tracker.sender_id
         
-        # Map slots to readable time
-        slot_times = {
-            "Slot 1": "8:00 AM - 12:00 PM",
-            "Slot 2": "1:00 PM - 5:00 PM",
-            "Slot 3": "6:00 PM - 10:00 PM"
-        }
+        # Readable slot times and the fare come from the booking configuration snapshot
+        config = get_booking_config()
+        slot_times = config.schedule.display
         
         # If handyman_id is missing but we have the name, try to find the ID
         if not handyman_id and handyman_name:
             # Look up the handyman ID from the name
-            handymen_ref = db.reference('/handymen')
-            handymen_data = handymen_ref.get() or {}
+            handymen_data = get_handyman_directory().all()
             
             for h_id, h_data in handymen_data.items():
                 if handyman_name.lower() in h_data.get("name", "").lower():
                     handyman_id = h_id
-                    print(f"Retrieved handyman_id: {handyman_id} for {handyman_name}")
+                    log.debug("Retrieved handyman_id: %s for %s", handyman_id, handyman_name)
                     break
         
         if not all([chosen_slot, chosen_date, handyman_name]):
             dispatcher.utter_message(text="I'm missing some booking information. Please provide the handyman name, date, and time slot.")
             return []
         
-        # Get the standard booking fee from the database
-        fare_ref = db.reference('/fare')
-        fare_data = fare_ref.get() or {}
-        booking_fee = fare_data.get('amount', 20)  # Default to 20 if not specified
+        # Standard booking fee
+        booking_fee = config.fare
         
-        # Get user's wallet balance
-        user_ref = db.reference(f'/users/{user_id}')
-        user_data = user_ref.get() or {}
-        wallet_balance = user_data.get('wallet', 0)
+        # Wallet balance and address from the cached profile
+        profiles = get_user_profiles()
+        profile = profiles.get(user_id)
+        if profile.wallet < booking_fee:
+            # Don't turn the user away on a cached balance: they may just have topped up
+            profile = profiles.get(user_id, refresh=True)
+        wallet_balance = profile.wallet
         
         # Get user's address for display
-        address = "Default Address"
-        if user_data and 'primaryAddress' in user_data:
-            address_data = user_data['primaryAddress']
-            address_parts = []
-            
-            # Use the actual field names from your Firebase structure
-            if 'unitName' in address_data and address_data['unitName']:
-                address_parts.append(address_data['unitName'])
-            
-            if 'buildingName' in address_data and address_data['buildingName']:
-                address_parts.append(address_data['buildingName'])
-            
-            if 'streetName' in address_data and address_data['streetName']:
-                address_parts.append(address_data['streetName'])
-            
-            if 'city' in address_data and address_data['city']:
-                address_parts.append(address_data['city'])
-            
-            if 'postalCode' in address_data and address_data['postalCode']:
-                address_parts.append(address_data['postalCode'])
-            
-            if 'country' in address_data and address_data['country']:
-                address_parts.append(address_data['country'])
-            
-            if address_parts:
-                address = ", ".join(address_parts)
-            
-            # Get coordinates if available
-            if 'latitude' in address_data and 'longitude' in address_data:
-                latitude = address_data['latitude']
-                longitude = address_data['longitude']
+        address = profile.address or "Default Address"
         
         # Format the booking details
         time_display = slot_times.get(chosen_slot, chosen_slot)
@@ -924,7 +666,7 @@ class ActionShowBookingDetails(Action):
         # Always return the handyman_id to ensure it's available for ActionConfirmBooking
         return [SlotSet("handyman_id", handyman_id)]
 
-class ActionEasyBook(Action):
+class ActionEasyBook(ThreadedAction, Action):
     """
     Handles the "easy booking" flow - a streamlined one-step booking process
     where the AI extracts all needed information from a single user message
@@ -945,27 +687,19 @@ class ActionEasyBook(Action):
         if not city_graph:
             return False
             
-        # Normalize city names to lowercase for case-insensitive comparison
-        city1_lower = city1.lower() if city1 else ""
-        city2_lower = city2.lower() if city2 else ""
+        # Resolve free-text names (case, accents, aliases like "PJ", partial names)
+        # to towns of the graph, then it's a direct lookup
+        distance = town_distance(city1, city2, city_graph)
         
         # Debug output
-        print(f"Checking if {city2_lower} is near {city1_lower}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Checking if %s (%s) is near %s (%s)", city2, resolve_town(city2), city1, resolve_town(city1))
         
-        # First try direct lookup
-        if city1_lower in city_graph and city2_lower in city_graph[city1_lower]:
-            print(f"Direct match found: {city2_lower} is {city_graph[city1_lower][city2_lower]} km from {city1_lower}")
+        if distance is not None:
+            log.debug("Match found: %s is %s km from %s", city2, distance, city1)
             return True
-            
-        # If no match, check for partial matches (e.g., "Petaling Jaya" might be stored as "petaling jaya")
-        for graph_city in city_graph:
-            if city1_lower in graph_city or graph_city in city1_lower:
-                for nearby_city in city_graph[graph_city]:
-                    if city2_lower in nearby_city or nearby_city in city2_lower:
-                        print(f"Partial match found: {nearby_city} is {city_graph[graph_city][nearby_city]} km from {graph_city}")
-                        return True
-        
-        print(f"No proximity match found between {city1_lower} and {city2_lower}")
+        
+        log.debug("No proximity match found between %s and %s", city1, city2)
         return False
         
     def get_distance(self, city_graph, city1, city2):
@@ -973,22 +707,8 @@ class ActionEasyBook(Action):
         if not city_graph:
             return float('inf')
             
-        # Normalize city names to lowercase
-        city1_lower = city1.lower() if city1 else ""
-        city2_lower = city2.lower() if city2 else ""
-        
-        # First try direct lookup
-        if city1_lower in city_graph and city2_lower in city_graph[city1_lower]:
-            return city_graph[city1_lower][city2_lower]
-            
-        # If no direct match, check for partial matches
-        for graph_city in city_graph:
-            if city1_lower in graph_city or graph_city in city1_lower:
-                for nearby_city in city_graph[graph_city]:
-                    if city2_lower in nearby_city or nearby_city in city2_lower:
-                        return city_graph[graph_city][nearby_city]
-        
-        return float('inf')
+        distance = town_distance(city1, city2, city_graph)
+        return distance if distance is not None else float('inf')
         
     def _add_handyman_with_city_distance(self, h_data, user_city, nearby_handymen, other_handymen):
         """Helper method to add handyman with city-based distance calculation"""
@@ -1011,7 +731,7 @@ class ActionEasyBook(Action):
                 nearby_handymen.append(h_data)
                 return
         except Exception as e:
-            print(f"Error checking city proximity: {e}")
+            log.error("Error checking city proximity: %s", e)
             
         # If all checks fail, calculate an approximate distance based on Selangor/KL region average
         # This ensures we still consider handymen without exact matches but in general area
@@ -1049,155 +769,136 @@ class ActionEasyBook(Action):
         km = 6371 * c  # Earth radius in kilometers
         return km
         
-    def run(self, dispatcher, tracker, domain):
+    # How many candidates' schedules to load concurrently before checking them in order
+    availability_prefetch = 2
+
+    def _busy_slots(self, reads, handyman_id, booking_date):
+        """Busy slots of a handyman on booking_date, sharing this turn's read if one is in flight"""
+        busy_index = get_busy_slot_index()
+        return reads.result(("busy", handyman_id, booking_date), busy_index.busy_slots, handyman_id, booking_date)
+
+    @staticmethod
+    def _nearby_rank(h):
+        """Sort key of nearby handymen: nearest first, then highest rated"""
+        return (h.get("distance", 100), -(h.get("average_rating", 0) or h.get("rating", 0)))
+
+    def _ranked(self, handymen, key=None):
+        """
+        Yield handymen in key order (ties keep list order), one heap pop at a time.
+
+        Heapifying is linear, so when the first few candidates are available
+        the rest of the list is never sorted.
+        """
+        key = key or self._nearby_rank
+        heap = [(key(h), i, h) for i, h in enumerate(handymen)]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[2]
+
+    def _located_candidates(self, directory, spatial_index, user_coordinates, required_expertise):
+        """
+        Yield handymen with coordinates in (distance, -rating) order, lazily.
+
+        The spatial index yields nearest first; handymen at the same (rounded)
+        distance are held back until the distance changes and then ordered by
+        rating, so only the part of the index that is consumed is searched.
+        """
+        group = []
+        group_distance = None
+        for h_id, distance in spatial_index.iter_nearest(user_coordinates[0], user_coordinates[1], required_expertise):
+            h_data = directory.get(h_id)
+            if not h_data:
+                continue
+            if distance != group_distance:
+                yield from self._ranked(group)
+                group = []
+                group_distance = distance
+            h_data["distance"] = distance
+            group.append(h_data)
+        yield from self._ranked(group)
+
+    def _prefetched_ids(self, reads, candidates, booking_date, by_id):
+        """
+        Yield candidate ids, keeping the next few candidates' schedules loading.
+
+        Args:
+            candidates: Handyman records, best first (any iterable)
+            by_id: Filled with {id: record} for every candidate pulled
+        """
+        busy_index = get_busy_slot_index()
+        pending = deque()
+        for candidate in candidates:
+            handyman_id = candidate.get("id")
+            by_id[handyman_id] = candidate
+            log.debug("Considering %s in %s (Distance: %s km, Rating: %s)", candidate.get('name', 'Unknown'), candidate.get('city'),
+                          candidate.get('distance', 'unknown'), candidate.get('average_rating', 0) or candidate.get('rating', 0))
+            reads.fetch(("busy", handyman_id, booking_date), busy_index.busy_slots, handyman_id, booking_date)
+            pending.append(handyman_id)
+            if len(pending) > self.availability_prefetch:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    def _first_available(self, reads, candidates, booking_date, slot):
+        """
+        First candidate, in order, who is free at (booking_date, slot), or None.
+
+        Candidates are pulled lazily; schedules are read through this turn's
+        reads and slots that have already passed today count as taken (see
+        availability.py).
+        """
+        def busy_slots(handyman_id, day):
+            busy = self._busy_slots(reads, handyman_id, day)
+            if slot in busy:
+                log.debug("Handyman %s is busy on %s for %s", handyman_id, day, slot)
+            return busy
+
+        by_id = {}
+        free = get_availability_engine().first_free(
+            self._prefetched_ids(reads, candidates, booking_date, by_id), booking_date, slot, busy_slots=busy_slots
+        )
+        if not free:
+            return None
+        selected_handyman = by_id[free[0]]
+        log.info("Found available handyman: %s", selected_handyman.get('name', 'Unknown'), handyman_id=selected_handyman.get('id'))
+        return selected_handyman
+
+    def run_sync(self, dispatcher, tracker, domain):
         # Extract user input
         user_message = tracker.latest_message.get("text", "")
-        print(f"Processing easy book request: {user_message}")
-        
-        # STEP 0: Preprocess user message to extract problem separately
-        # First, let's remove date/time patterns that interfere with problem detection
-        # Common date patterns: DD/MM, MM/DD, DD-MM
-        date_time_patterns = [
-            r'\d{1,2}[/-]\d{1,2}',                # Date patterns like 29/5 or 5-29
-            r'\d{1,2}(?::\d{2})?\s*(?:am|pm|AM|PM)?', # Time patterns like 3pm, 15:00, etc
-            r'(?:at|on)\s+\d{1,2}[/-]\d{1,2}',    # "at 29/5"
-            r'(?:at|on)\s+\d{1,2}(?::\d{2})?\s*(?:am|pm|AM|PM)?', # "at 3pm"
-            r'tomorrow',
-            r'today',
-            r'next week',
-            r'next month'
-        ]
+        log.debug("Processing easy book request: %s", user_message)
         
-        # Save original message for date/time extraction later
-        original_message = user_message
-        
-        # Remove date/time patterns for problem identification
-        problem_only_text = user_message
-        for pattern in date_time_patterns:
-            problem_only_text = re.sub(pattern, '', problem_only_text, flags=re.IGNORECASE)
-        
-        # Also remove booking-related phrases that aren't relevant to the problem
-        booking_phrases = [
-            r'i want to book',
-            r'i wanna book',
-            r'i need to book',
-            r'book a',
-            r'book an',
-            r'schedule a',
-            r'schedule an',
-            r'i want to schedule',
-            r'i need a handyman',
-            r'i need a',
-            r'please book'
-            r'please schedule',
-            r'Book Handyman',
-            r'Book a handyman',
-            r'Book an expert',
-            r'Book a service',
-            r'Book a technician',
-            r'Book a repair',
-        ]
-        
-        for phrase in booking_phrases:
-            problem_only_text = re.sub(phrase, '', problem_only_text, flags=re.IGNORECASE)
-            
-        # Clean up extra spaces
-        problem_only_text = re.sub(r'\s+', ' ', problem_only_text).strip()
-        
-        print(f"Extracted problem text: {problem_only_text}")
-        
-        # STEP 1: Extract date from the original message
-        # Extract date from message (looking for patterns like DD/MM, MM/DD)
-        date_match = re.search(r'(\d{1,2})[/-](\d{1,2})', original_message)
-        extracted_date = None
-        if date_match:
-            day, month = int(date_match.group(1)), int(date_match.group(2))
-            # Assume current year
-            current_year = datetime.now().year
-            try:
-                extracted_date = datetime(current_year, month, day).strftime('%Y-%m-%d')
-                print(f"Extracted date: {extracted_date}")
-            except ValueError:
-                # Try swapping day and month in case of different format
-                try:
-                    extracted_date = datetime(current_year, day, month).strftime('%Y-%m-%d')
-                    print(f"Swapped date: {extracted_date}")
-                except ValueError:
-                    pass
-        
-        # If no date found, default to tomorrow
-        if not extracted_date:
-            tomorrow = datetime.now() + timedelta(days=1)
-            extracted_date = tomorrow.strftime('%Y-%m-%d')
-            print(f"Using default date (tomorrow): {extracted_date}")
-        
-        # STEP 2: Extract time with higher priority on AM/PM format
-        # First look for explicit time with AM/PM indicator (like 10:30am)
-        time_match = re.search(r'\b(\d{1,2})(?::(\d{2}))?\s*([aApP][mM])\b', original_message)
-        
-        if not time_match:
-            # Fallback: Try 24-hour format only if no AM/PM format found
-            time_match = re.search(r'\b(\d{1,2}):(\d{2})\b', original_message)
-            
-        slot = None
-        extracted_time = None
-        if time_match:
-            hour = int(time_match.group(1))
-            # Handle different capturing groups based on which regex matched
-            if len(time_match.groups()) > 2 and time_match.group(3):  # AM/PM format matched
-                minute = int(time_match.group(2)) if time_match.group(2) else 0
-                am_pm = time_match.group(3)
-                print(f"Matched AM/PM format time: {hour}:{minute:02d} {am_pm}")
-            else:  # 24-hour format matched
-                minute = int(time_match.group(2))
-                am_pm = None
-                print(f"Matched 24-hour format time: {hour}:{minute:02d}")
-            
-            # Convert to 24-hour format if am/pm specified
-            if am_pm and am_pm.lower() == 'pm' and hour < 12:
-                hour += 12
-            elif am_pm and am_pm.lower() == 'am' and hour == 12:
-                hour = 0
-                
-            # Now hour is in 24-hour format
-            hour_24 = hour
-            print(f"Converted to 24-hour: {hour_24}:{minute:02d}")
-            
-            # Format the extracted time for debugging
-            minute_str = f":{minute:02d}"
-            period = "AM" if hour < 12 else "PM"
-            display_hour = hour if hour <= 12 else hour - 12
-            display_hour = 12 if display_hour == 0 else display_hour
-            extracted_time = f"{display_hour}{minute_str} {period}"
-            print(f"Extracted time: {extracted_time}")
-            
-            # Determine slot based on hour, with clearer boundaries
-            if 8 <= hour_24 < 12:
-                slot = "Slot 1"  # 8am-12pm
-                print(f"Selected Slot 1 (morning) for {extracted_time}")
-            elif 12 <= hour_24 < 17:
-                slot = "Slot 2"  # 1pm-5pm
-                print(f"Selected Slot 2 (afternoon) for {extracted_time}")
-            elif 17 <= hour_24 < 22:
-                slot = "Slot 3"  # 6pm-10pm
-                print(f"Selected Slot 3 (evening) for {extracted_time}")
-            else:
-                print(f"Time {extracted_time} is outside booking hours, using default")
-                
-        # If no specific time found, pick Slot 2 (afternoon) as default
-        if not slot:
-            slot = "Slot 2"
-            print(f"Using default slot: {slot}")
-        
-        # Define readable slot time ranges for display
-        slot_display_times = {
-            "Slot 1": "8:00 AM - 12:00 PM",
-            "Slot 2": "1:00 PM - 5:00 PM",
-            "Slot 3": "6:00 PM - 10:00 PM"
-        }
+        # The profile and handyman directory don't depend on the message,
+        # so read them in the background while the message is parsed and classified
+        user_id = tracker.sender_id
+        reads = TurnReads()
+        reads.fetch(('profile', user_id), get_user_profiles().get, user_id)
+        reads.fetch('handymen', get_handyman_directory().records)
+
+        # Fare and slot schedule (cached, no read per turn)
+        config = get_booking_config()
+        
+        # STEP 0-2: Split the message into the problem, the date and the time slot
+        parsed = parse_booking_message(user_message, schedule=config.schedule)
+        problem_only_text = parsed.problem_text
+        extracted_date = parsed.date
+        slot = parsed.slot
+        log.debug("Extracted problem text: %s", problem_only_text)
+
+        if parsed.date_source == "default":
+            log.debug("Using default date (tomorrow): %s", extracted_date)
+        else:
+            log.debug("Extracted date: %s", extracted_date)
+
+        if parsed.time:
+            log.debug("Extracted time: %s", parsed.time)
+        if parsed.slot_defaulted:
+            log.debug("Using default slot: %s", slot)
+        else:
+            log.debug("Selected %s for %s", slot, parsed.time)
         
         # Get the slot time display for the selected slot
-        slot_time_display = slot_display_times.get(slot, slot)
+        slot_time_display = config.schedule.display.get(slot, slot)
         
         # STEP 3: Identify the problem type using intent classification
         # Use the problem_only_text instead of full message for intent classification
@@ -1209,7 +910,7 @@ class ActionEasyBook(Action):
         
         # If we couldn't determine the expertise from intent or confidence is too low
         if not required_expertise or intent_name == 'easy_book' or intent_confidence < 0.5:
-            print(f"Intent detection insufficient ({intent_name}, confidence: {intent_confidence}), trying secondary intents")
+            log.debug("Intent detection insufficient (%s, confidence: %s), trying secondary intents", intent_name, intent_confidence)
             
             # Check for secondary intents (like ActionSuggestHandyman does)
             intent_ranking = tracker.latest_message.get('intent_ranking', [])
@@ -1218,180 +919,78 @@ class ActionEasyBook(Action):
                 confidence = ranked_intent.get('confidence', 0)
                 if intent_id.startswith('report_issue_') and confidence > 0.3:
                     required_expertise = expertise_mapping.get(intent_id)
-                    print(f"Found secondary intent {intent_id} with confidence {confidence}")
+                    log.debug("Found secondary intent %s with confidence %s", intent_id, confidence)
                     break
         
         # If still no expertise found, use General
         if not required_expertise:
             required_expertise = "General"
-            print(f"No specific expertise detected, using General")
+            log.debug("No specific expertise detected, using General")
             
         # STEP 4: Find the best available handyman based on:
         # - Expertise match
         # - User's location (prioritize by actual distance using coordinates)
         # - Rating (highest first)
-        user_id = tracker.sender_id
-        
-        # Get user's location data from Firebase
-        user_ref = db.reference(f'/users/{user_id}')
-        user_data = user_ref.get() or {}
-        
-        user_city = None
-        user_latitude = None
-        user_longitude = None
-        
-        if user_data and 'primaryAddress' in user_data:
-            user_city = user_data['primaryAddress'].get('city')
-            user_latitude = user_data['primaryAddress'].get('latitude')
-            user_longitude = user_data['primaryAddress'].get('longitude')
+        # Get user's location from the cached profile
+        profile = reads.result(('profile', user_id), get_user_profiles().get, user_id)
+        user_city = profile.city
+        user_latitude, user_longitude = profile.coordinates or (None, None)
             
         if not user_city:
             user_city = tracker.get_slot("location")
         
-        print(f"User location - City: {user_city}, Coordinates: {user_latitude}, {user_longitude}")
+        log.debug("User location - City: %s, Coordinates: %s, %s", user_city, user_latitude, user_longitude)
             
         # Find handymen of the required expertise
-        ref = db.reference('/handymen')
-        handymen_data = ref.get() or {}
+        reads.result('handymen', get_handyman_directory().records)
+        directory = get_handyman_directory()
+        spatial_index = get_handyman_spatial_index()
         
         # Group handymen by distance categories
-        nearby_handymen = []  # Handymen with calculable distance
+        city_nearby = []      # Handymen without coordinates but in or near the user's city
         other_handymen = []   # Handymen with unknown distance
         
-        for h_id, h_data in handymen_data.items():
-            if (h_data.get("expertise") and 
-                h_data.get("status") == "active" and
-                isinstance(h_data["expertise"], list) and
-                any(required_expertise.lower() in exp.lower() for exp in h_data["expertise"] if isinstance(exp, str))):
-                
-                h_data["id"] = h_id  # Add ID to the data
-                
-                # Calculate distance if we have coordinates for both user and handyman
-                if user_latitude and user_longitude and h_data.get('latitude') and h_data.get('longitude'):
-                    try:
-                        distance = self.haversine(
-                            float(user_latitude), 
-                            float(user_longitude), 
-                            float(h_data.get('latitude')), 
-                            float(h_data.get('longitude'))
-                        )
-                        h_data["distance"] = round(distance, 2)
-                        nearby_handymen.append(h_data)
-                        print(f"Calculated distance to {h_data.get('name')}: {h_data['distance']} km")
-                    except (ValueError, TypeError) as e:
-                        print(f"Error calculating distance for {h_data.get('name')}: {e}")
-                        # Even if distance calculation fails, still consider them based on city
-                        self._add_handyman_with_city_distance(h_data, user_city, nearby_handymen, other_handymen)
-                else:
-                    # Fall back to city-based grouping if coordinates are missing
-                    self._add_handyman_with_city_distance(h_data, user_city, nearby_handymen, other_handymen)
-                    
-        # Sort all nearby handymen by a combined score of rating and distance
-        if nearby_handymen:
-            # Debug print all nearby handymen
-            print(f"DEBUG: Found {len(nearby_handymen)} handymen with distance:")
-            for h in nearby_handymen:
-                print(f"  - {h.get('name')} in {h.get('city')} (Distance: {h.get('distance', 'unknown')} km, Rating: {h.get('average_rating', 0) or h.get('rating', 0)})")
-            
-            # Sort by actual distance first, then by rating as tiebreaker
-            nearby_handymen = sorted(
-                nearby_handymen,
-                key=lambda x: (x.get("distance", 100), -(x.get("average_rating", 0) or x.get("rating", 0)))
-            )
-            
-            # After sorting, check for availability instead of just picking the first one
-            # Check the handymen's existing jobs to determine availability
-            jobs_ref = db.reference('/jobs')
-            jobs_data = jobs_ref.get() or {}
-            
-            # Convert requested booking date to datetime.date object for comparison
-            booking_date = datetime.strptime(extracted_date, "%Y-%m-%d").date()
-            print(f"Looking for handymen available on {booking_date} for {slot}")
-            
-            # Find an available handyman by checking each one's schedule
-            selected_handyman = None
-            for candidate in nearby_handymen:
-                handyman_id = candidate.get("id")
-                handyman_name = candidate.get("name", "Unknown")
-                print(f"Checking availability for {handyman_name} (ID: {handyman_id})")
-                
-                # Find existing jobs for this handyman
-                handyman_busy_slots = {}
-                is_available = True
-                
-                if jobs_data:
-                    for job_id, job in jobs_data.items():
-                        if job.get("assigned_to") == handyman_id and job.get("status") in ["Pending", "In-Progress"]:
-                            try:
-                                job_timestamp = job.get("starttimestamp", "")
-                                if not job_timestamp:
-                                    continue
-                                    
-                                # Parse the timestamp properly
-                                if "T" in job_timestamp:
-                                    job_date_str = job_timestamp.split("T")[0]
-                                    job_date = datetime.strptime(job_date_str, "%Y-%m-%d").date()
-                                    job_slot = job.get("assigned_slot")
-                                    
-                                    if job_date not in handyman_busy_slots:
-                                        handyman_busy_slots[job_date] = []
-                                    handyman_busy_slots[job_date].append(job_slot)
-                                    
-                                    # If this job conflicts with our requested date and slot
-                                    if job_date == booking_date and job_slot == slot:
-                                        is_available = False
-                                        print(f"Handyman {handyman_name} is busy on {job_date} for {job_slot}")
-                            except Exception as e:
-                                print(f"Error processing job timestamp: {e}")
-                
-                # Check if handyman is available for the requested date/slot
-                if is_available:
-                    print(f"Found available handyman: {handyman_name}")
-                    selected_handyman = candidate
-                    break
+        user_coordinates = None
+        if user_latitude and user_longitude:
+            try:
+                user_coordinates = (float(user_latitude), float(user_longitude))
+            except (ValueError, TypeError) as e:
+                log.warning("Error reading user coordinates: %s", e)
+        
+        if user_coordinates:
+            # Handymen with coordinates stream from the spatial index, nearest first
+            located = self._located_candidates(directory, spatial_index, user_coordinates, required_expertise)
+            # Fall back to city-based grouping for handymen without coordinates
+            city_candidates = spatial_index.unlocated(required_expertise)
+        else:
+            # Fall back to city-based grouping if the user's coordinates are missing
+            located = iter(())
+            city_candidates = get_expertise_index().ids(required_expertise, active=True)
+        
+        for h_id in city_candidates:
+            h_data = directory.get(h_id)
+            if h_data:
+                self._add_handyman_with_city_distance(h_data, user_city, city_nearby, other_handymen)
+
+        # Nearby handymen in (distance, -rating) order: both streams are ordered,
+        # so merging them lazily gives the same order as sorting everything
+        nearby_handymen = heapq.merge(located, self._ranked(city_nearby), key=self._nearby_rank)
+        first_nearby = next(nearby_handymen, None)
+
+        # Convert requested booking date to datetime.date object for comparison
+        booking_date = datetime.strptime(extracted_date, "%Y-%m-%d").date()
+        
+        if first_nearby is not None:
+            # Walk candidates best first and stop at the first available one:
+            # no later candidate can rank higher, so the rest are never looked at
+            log.debug("Looking for handymen available on %s for %s, nearest first", booking_date, slot)
+            nearby_handymen = itertools.chain([first_nearby], nearby_handymen)
+            selected_handyman = self._first_available(reads, nearby_handymen, booking_date, slot)
                     
             # If we couldn't find any available handyman in nearby_handymen, check other_handymen
             if not selected_handyman and other_handymen:
-                print("No nearby handymen available, checking handymen from other locations")
-                for candidate in other_handymen:
-                    handyman_id = candidate.get("id")
-                    handyman_name = candidate.get("name", "Unknown")
-                    print(f"Checking availability for {handyman_name} (ID: {handyman_id})")
-                    
-                    # Find existing jobs for this handyman
-                    handyman_busy_slots = {}
-                    is_available = True
-                    
-                    if jobs_data:
-                        for job_id, job in jobs_data.items():
-                            if job.get("assigned_to") == handyman_id and job.get("status") in ["Pending", "In-Progress"]:
-                                try:
-                                    job_timestamp = job.get("starttimestamp", "")
-                                    if not job_timestamp:
-                                        continue
-                                        
-                                    # Parse the timestamp properly
-                                    if "T" in job_timestamp:
-                                        job_date_str = job_timestamp.split("T")[0]
-                                        job_date = datetime.strptime(job_date_str, "%Y-%m-%d").date()
-                                        job_slot = job.get("assigned_slot")
-                                        
-                                        if job_date not in handyman_busy_slots:
-                                            handyman_busy_slots[job_date] = []
-                                        handyman_busy_slots[job_date].append(job_slot)
-                                        
-                                        # If this job conflicts with our requested date and slot
-                                        if job_date == booking_date and job_slot == slot:
-                                            is_available = False
-                                            print(f"Handyman {handyman_name} is busy on {job_date} for {job_slot}")
-                                except Exception as e:
-                                    print(f"Error processing job timestamp: {e}")
-                    
-                    # Check if handyman is available for the requested date/slot
-                    if is_available:
-                        print(f"Found available handyman: {handyman_name}")
-                        selected_handyman = candidate
-                        break
+                log.debug("No nearby handymen available, checking handymen from other locations")
+                selected_handyman = self._first_available(reads, other_handymen, booking_date, slot)
             
             # If still no available handyman found
             if not selected_handyman:
@@ -1400,60 +999,10 @@ class ActionEasyBook(Action):
                 )
                 return []
         elif other_handymen:
-            other_handymen = sorted(other_handymen, 
-                                   key=lambda x: x.get("average_rating", 0) or x.get("rating", 0), 
-                                   reverse=True)
-                                   
-            # After sorting, check for availability instead of just picking the first one
-            # Check the handymen's existing jobs to determine availability
-            jobs_ref = db.reference('/jobs')
-            jobs_data = jobs_ref.get() or {}
-            
-            # Convert requested booking date to datetime.date object for comparison
-            booking_date = datetime.strptime(extracted_date, "%Y-%m-%d").date()
-            print(f"Looking for handymen available on {booking_date} for {slot}")
-            
-            # Find an available handyman by checking each one's schedule
-            selected_handyman = None
-            for candidate in other_handymen:
-                handyman_id = candidate.get("id")
-                handyman_name = candidate.get("name", "Unknown")
-                print(f"Checking availability for {handyman_name} (ID: {handyman_id})")
-                
-                # Find existing jobs for this handyman
-                handyman_busy_slots = {}
-                is_available = True
-                
-                if jobs_data:
-                    for job_id, job in jobs_data.items():
-                        if job.get("assigned_to") == handyman_id and job.get("status") in ["Pending", "In-Progress"]:
-                            try:
-                                job_timestamp = job.get("starttimestamp", "")
-                                if not job_timestamp:
-                                    continue
-                                    
-                                # Parse the timestamp properly
-                                if "T" in job_timestamp:
-                                    job_date_str = job_timestamp.split("T")[0]
-                                    job_date = datetime.strptime(job_date_str, "%Y-%m-%d").date()
-                                    job_slot = job.get("assigned_slot")
-                                    
-                                    if job_date not in handyman_busy_slots:
-                                        handyman_busy_slots[job_date] = []
-                                    handyman_busy_slots[job_date].append(job_slot)
-                                    
-                                    # If this job conflicts with our requested date and slot
-                                    if job_date == booking_date and job_slot == slot:
-                                        is_available = False
-                                        print(f"Handyman {handyman_name} is busy on {job_date} for {job_slot}")
-                            except Exception as e:
-                                print(f"Error processing job timestamp: {e}")
-                
-                # Check if handyman is available for the requested date/slot
-                if is_available:
-                    print(f"Found available handyman: {handyman_name}")
-                    selected_handyman = candidate
-                    break
+            # Highest rated first
+            log.debug("Looking for handymen available on %s for %s, highest rated first", booking_date, slot)
+            other_handymen = self._ranked(other_handymen, key=lambda x: -(x.get("average_rating", 0) or x.get("rating", 0)))
+            selected_handyman = self._first_available(reads, other_handymen, booking_date, slot)
             
             # If no available handyman found
             if not selected_handyman:
@@ -1466,15 +1015,14 @@ class ActionEasyBook(Action):
             return []
         
         # STEP 5: Prepare booking with the selected top-rated handyman
-        # Get the standard booking fee from the database
-        fare_ref = db.reference('/fare')
-        fare_data = fare_ref.get() or {}
-        booking_fee = fare_data.get('amount', 20)  # Default to 20 if not specified
+        # Standard booking fee from the configuration snapshot
+        booking_fee = config.fare
         
-        # Get user's wallet balance
-        user_ref = db.reference(f'/users/{user_id}')
-        user_data = user_ref.get() or {}
-        wallet_balance = user_data.get('wallet', 0)
+        # Get user's wallet balance (same profile as the location above)
+        if profile.wallet < booking_fee:
+            # Don't turn the user away on a cached balance: they may just have topped up
+            profile = get_user_profiles().get(user_id, refresh=True)
+        wallet_balance = profile.wallet
         
         # Set slots for the booking
         handyman_name = selected_handyman.get('name', 'Unknown')
@@ -1541,7 +1089,7 @@ class ActionEasyBook(Action):
             if auto_confirm:
                 # Reuse the confirm booking action
                 confirm_action = ActionConfirmBooking()
-                return events + confirm_action.run(dispatcher, tracker, domain)
+                return events + confirm_action.run_sync(dispatcher, tracker, domain, reads=reads)
             else:
                 # Otherwise ask for confirmation first
                 confirmation_message = (
@@ -1561,44 +1109,43 @@ class ActionEasyBook(Action):
 
 # Helper Functions
 
-def get_matching_handymen(required_expertise, user_city):
+def get_matching_handymen(required_expertise, user_city, city_limit=None, other_limit=None):
     """
     Find handymen that match the required expertise and sort them by location and rating.
     
     Args:
         required_expertise: The type of expertise needed (e.g. 'Plumber', 'Electrician')
         user_city: The city where the user is located
+        city_limit: Most handymen to return from the user's city (None for all)
+        other_limit: Most handymen to return from other cities (None for all)
         
     Returns:
         tuple: (city_handymen, other_handymen) - Lists of handymen sorted by rating
     """
-    # Reference to handymen in the database
-    ref = db.reference('/handymen')
-    handymen_data = ref.get() or {}
-    
-    city_handymen = []
-    other_handymen = []
-    
-    # Filter handymen based on expertise, city, and active status
-    for h_id, h_data in handymen_data.items():
-        if (h_data.get("expertise") and 
-            h_data.get("status") == "active" and
-            any(required_expertise.lower() in exp.lower() for exp in h_data["expertise"] if isinstance(exp, str))):
-            
-            h_data["id"] = h_id  # Add ID to the data
-            
-            # Check if handyman is in the same city as user
-            if user_city and h_data.get("city") and h_data.get("city").lower() == user_city.lower():
-                city_handymen.append(h_data)
-            else:
-                other_handymen.append(h_data)
+    # Active matching handymen come from the expertise index's rating
+    # leaderboards, already sorted by rating in descending order
+    directory = get_handyman_directory()
+    expertise_index = get_expertise_index()
+    if user_city:
+        city_ids = expertise_index.top(required_expertise, city_limit, active=True, city=user_city)
+        other_ids = expertise_index.top(required_expertise, other_limit, active=True, exclude_city=user_city)
+    else:
+        city_ids = []
+        other_ids = expertise_index.top(required_expertise, other_limit, active=True)
     
-    # Sort handymen by rating in descending order
-    city_handymen = sorted(city_handymen, key=lambda x: x.get("average_rating", 0) or x.get("rating", 0), reverse=True)
-    other_handymen = sorted(other_handymen, key=lambda x: x.get("average_rating", 0) or x.get("rating", 0), reverse=True)
+    city_handymen = [h for h in map(directory.get, city_ids) if h]
+    other_handymen = [h for h in map(directory.get, other_ids) if h]
     
     return city_handymen, other_handymen
 
+def slot_taken_message(handyman_name, chosen_date, chosen_slot):
+    """Message for a user who lost the race for a slot to another booking"""
+    return (
+        f"Sorry, {handyman_name} was just booked by someone else for {chosen_slot} on {chosen_date}. "
+        f"Please choose another time slot."
+    )
+
+
 def process_booking(dispatcher, tracker, user_id, handyman_id, handyman_name, chosen_date, chosen_slot, problem):
     """
     Process booking creation and store it in Firebase
@@ -1617,75 +1164,25 @@ def process_booking(dispatcher, tracker, user_id, handyman_id, handyman_name, ch
         tuple: (success, message, booking_id) - Booking status and related info
     """
     try:
-        # Map slots to times
-        slot_times = {
-            "Slot 1": ("08:00", "12:00"),
-            "Slot 2": ("13:00", "17:00"),
-            "Slot 3": ("18:00", "22:00")
-        }
+        # Slot times and the fare come from the booking configuration snapshot
+        config = get_booking_config()
+        slot_times = config.schedule.times
         
         if chosen_slot not in slot_times:
             return False, "Invalid slot selected. Please try again.", None
-            
-        start_time, end_time = slot_times[chosen_slot]
 
-        # Convert chosen_date and slot times to ISO 8601 format
-        date_format = "%Y-%m-%d"
-        start_datetime = datetime.strptime(chosen_date, date_format).replace(
-            hour=int(start_time.split(":")[0]),
-            minute=int(start_time.split(":")[1])
-        )
-        end_datetime = datetime.strptime(chosen_date, date_format).replace(
-            hour=int(end_time.split(":")[0]),
-            minute=int(end_time.split(":")[1])
-        )
-        
-        # Format timestamps
-        start_timestamp = start_datetime.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        end_timestamp = end_datetime.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        # Convert chosen_date and slot times to ISO 8601 timestamps
+        start_timestamp, end_timestamp = config.schedule.timestamps(chosen_slot, chosen_date)
+        booking_day = datetime.strptime(chosen_date, "%Y-%m-%d")
         
-        # Get user's address from Firebase if available
-        user_ref = db.reference(f'/users/{user_id}')
-        user_data = user_ref.get() or {}
+        # Get user's address from the cached profile
+        profile = get_user_profiles().get(user_id)
         
-        address = "Default Address"
-        latitude = 3.1751817
-        longitude = 101.6173767
-        
-        if user_data and 'primaryAddress' in user_data:
-            address_data = user_data['primaryAddress']
-            address_parts = []
-            
-            if 'unitName' in address_data and address_data['unitName']:
-                address_parts.append(address_data['unitName'])
-            
-            if 'buildingName' in address_data and address_data['buildingName']:
-                address_parts.append(address_data['buildingName'])
-            
-            if 'streetName' in address_data and address_data['streetName']:
-                address_parts.append(address_data['streetName'])
-            
-            if 'city' in address_data and address_data['city']:
-                address_parts.append(address_data['city'])
-            
-            if 'postalCode' in address_data and address_data['postalCode']:
-                address_parts.append(address_data['postalCode'])
-            
-            if 'country' in address_data and address_data['country']:
-                address_parts.append(address_data['country'])
-            
-            if address_parts:
-                address = ", ".join(address_parts)
-            
-            # Get coordinates if available
-            if 'latitude' in address_data and 'longitude' in address_data:
-                latitude = address_data['latitude']
-                longitude = address_data['longitude']
+        address = profile.address or "Default Address"
+        latitude, longitude = profile.coordinates or (3.1751817, 101.6173767)
         
         # Get handyman's expertise that matches the user's problem
-        handymen_ref = db.reference('/handymen')
-        handymen_data = handymen_ref.get() or {}
-        handyman_data = handymen_data.get(handyman_id, {})
+        handyman_data = get_handyman_directory().get(handyman_id) or {}
         
         expertise_list = handyman_data.get("expertise", [])
         
@@ -1712,6 +1209,7 @@ def process_booking(dispatcher, tracker, user_id, handyman_id, handyman_name, ch
             "booking_id": booking_id,
             "assigned_slot": chosen_slot,
             "assigned_to": handyman_id,
+            "assigned_to_date": assigned_to_date_key(handyman_id, booking_day),
             "description": problem,
             "category": category,
             "endtimestamp": end_timestamp,
@@ -1725,27 +1223,16 @@ def process_booking(dispatcher, tracker, user_id, handyman_id, handyman_name, ch
             "longitude": longitude
         }
         
-        # Save the booking to Firebase
-        ref = db.reference(f"/jobs/{booking_id}")
-        ref.set(booking_data)
-        
-        # Add booking fee transaction
-        txn_ref = db.reference("/walletTransactions")
+        # Booking fee transaction
         txn_id = str(uuid.uuid4())
 
-        # Get standard booking fee from fare table
-        fare_ref = db.reference('/fare')
-        fare_data = fare_ref.get() or {}
-        booking_fee = fare_data.get('amount', 20)  # Default to 20 if not found
+        # Standard booking fee from the fare table
+        booking_fee = config.fare
+        txn_data = booking_fee_transaction(booking_id, user_id, booking_fee)
 
-        txn_ref.child(txn_id).set({
-            "amount": -booking_fee,
-            "bookingId": booking_id,
-            "description": f"Processing fee for booking {booking_id}",
-            "timestamp": int(datetime.now().timestamp() * 1000),
-            "transactionType": "booking-fee",
-            "userId": user_id
-        })
+        # Reserve the slot, then save the booking and the fee together
+        if book_slot(booking_id, booking_data, txn_id, txn_data) == SLOT_TAKEN:
+            return False, slot_taken_message(handyman_name, chosen_date, chosen_slot), None
 
         confirmation_message = (
             f"✅ Your booking is confirmed!\n\n"
@@ -1759,10 +1246,10 @@ def process_booking(dispatcher, tracker, user_id, handyman_id, handyman_name, ch
         return True, confirmation_message, booking_id
         
     except Exception as e:
-        print(f"Error creating booking: {e}")
+        log.exception("Error creating booking: %s", e)
         return False, "Sorry, there was a problem creating your booking. Please try again.", None
 
-class ActionCancelRequest(Action):
+class ActionCancelRequest(ThreadedAction, Action):
     """
     Handles cancellation of booking requests or any ongoing booking process.
     This action is triggered when a user clicks "Cancel" or sends a cancel request.
@@ -1770,7 +1257,7 @@ class ActionCancelRequest(Action):
     def name(self):
         return "action_cancel_request"
 
-    def run(self, dispatcher, tracker, domain):
+    def run_sync(self, dispatcher, tracker, domain):
         # Clear all booking-related slots
         dispatcher.utter_message(text="I've cancelled your booking request. Is there anything else I can help you with?")
         
@@ -1790,55 +1277,16 @@ class ActionCancelRequest(Action):
     def load_city_proximity(self):
         """Load or create city proximity graph"""
         try:
-            # Try to import directly from map.py
-            file_dir = os.path.dirname(os.path.abspath(__file__))
-            csv_path = os.path.join(file_dir, "datamap", "daerah-working-set.csv")
-            
-            # Load the CSV file
-            if os.path.exists(csv_path):
-                df = pd.read_csv(csv_path)
-                
-                # Build graph
-                city_graph = {}
-                radius_km = 50  # Define your radius for 'nearby'
-
-                for i, row in df.iterrows():
-                    city = row['Town'].lower() if 'Town' in df.columns else None
-                    if not city:
-                        continue
-                        
-                    lat1 = row['Lat'] if 'Lat' in df.columns else None
-                    lon1 = row['Lon'] if 'Lon' in df.columns else None
-                    
-                    if not lat1 or not lon1:
-                        continue
-                        
-                    city_graph[city] = {}
-
-                    for j, other in df.iterrows():
-                        if i == j:
-                            continue
-                        other_city = other['Town'].lower() if 'Town' in df.columns else None
-                        if not other_city:
-                            continue
-                            
-                        lat2 = other['Lat'] if 'Lat' in df.columns else None
-                        lon2 = other['Lon'] if 'Lon' in df.columns else None
-                        
-                        if not lat2 or not lon2:
-                            continue
-                            
-                        distance = self.haversine(lat1, lon1, lat2, lon2)
-                        if distance <= radius_km:
-                            city_graph[city][other_city] = round(distance, 2)
-                
-                print(f"Loaded city proximity data for {len(city_graph)} cities")
+            # Use the compiled graph from map_cal (built from datamap/daerah-working-set.csv)
+            if os.path.exists(city_map.csv_path):
+                city_graph = city_map.city_graph
+                log.info("Loaded city proximity data for %s cities", len(city_graph))
                 return city_graph
             else:
-                print(f"City data file not found at {csv_path}")
+                log.warning("City data file not found at %s", city_map.csv_path)
                 return {}
         except Exception as e:
-            print(f"Error loading city proximity data: {e}")
+            log.error("Error loading city proximity data: %s", e)
             return {}
     
     def _add_handyman_with_city_distance(self, h_data, user_city, nearby_handymen, other_handymen):
@@ -1857,12 +1305,13 @@ class ActionCancelRequest(Action):
             
         # Try the city graph
         try:
-            if self.is_nearby_city(city_map.city_graph, user_city):
-                h_data["distance"] = self.get_distance(city_map.city_graph, user_city)
+            distance = town_distance(user_city, handyman_city)
+            if distance is not None:
+                h_data["distance"] = distance
                 nearby_handymen.append(h_data)
                 return
         except Exception as e:
-            print(f"Error checking city proximity: {e}")
+            log.error("Error checking city proximity: %s", e)
             
         # If all checks fail, calculate an approximate distance based on Selangor/KL region average
         # This ensures we still consider handymen without exact matches but in general area
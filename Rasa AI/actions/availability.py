@@ -0,0 +1,173 @@
+"""
+Handyman availability over the booking slots.
+
+ActionBookHandyman, ActionCheckHandymanSchedule and ActionEasyBook each built
+the 7-day x 3-slot grid with their own copy of the loops (a list of slots per
+day, .remove() for every booked or passed slot). The engine keeps each day's
+free slots as a bitmask (bit 0 = Slot 1, bit 1 = Slot 2, bit 2 = Slot 3) in a
+numpy array with one row per handyman, so a whole set of handymen is
+computed at once, and the "already passed today" rule lives in one place.
+The slots, their bit order and end times come from the slot schedule of the
+booking configuration (booking_config.py).
+
+    engine = get_availability_engine()
+    engine.weekly_schedule(handyman_id)         # [(date, ["Slot 1", ...]), ...]
+    engine.first_free(ids, date, "Slot 2", n=3)  # first 3 ids free then
+
+Busy slots come from the shared BusySlotIndex (job_index.py).
+"""
+from datetime import datetime, timedelta
+from itertools import islice
+
+from .booking_config import get_booking_config
+from .job_index import get_busy_slot_index
+from .job_queries import SCHEDULE_DAYS
+from .slot_schedule import DEFAULT_SCHEDULE
+
+# Slots of the built-in schedule, in bit order
+SLOTS = DEFAULT_SCHEDULE.names
+
+
+def slot_mask(slots, schedule=DEFAULT_SCHEDULE):
+    """Bitmask of an iterable of slot names (unknown names are ignored)"""
+    return schedule.mask(slots)
+
+
+def mask_slots(mask, schedule=DEFAULT_SCHEDULE):
+    """Slot names of a bitmask, in slot order"""
+    return schedule.slots_of(mask)
+
+
+def passed_mask(day, now=None, schedule=DEFAULT_SCHEDULE):
+    """Slots of day that have passed (only today's slots pass, at their end time)"""
+    return schedule.passed_mask(day, now)
+
+
+class AvailabilityEngine:
+    """
+    Free-slot bitmasks for many handymen and days.
+
+    Args:
+        busy_index: BusySlotIndex to read bookings from (defaults to the shared one)
+        schedule: SlotSchedule to use (defaults to the one in the current
+            booking configuration)
+    """
+
+    def __init__(self, busy_index=None, schedule=None):
+        self._busy_index = busy_index
+        self._schedule = schedule
+
+    @property
+    def busy_index(self):
+        return self._busy_index or get_busy_slot_index()
+
+    @property
+    def schedule(self):
+        return self._schedule or get_booking_config().schedule
+
+    def free_masks(self, handyman_ids, days, now=None, schedule=None):
+        """
+        Free slots of each handyman on each day.
+
+        Args:
+            handyman_ids: Handymen (rows)
+            days: Dates (columns), ascending
+            now: Current time, for the passed-slot rule
+            schedule: SlotSchedule giving the bit order (defaults to self.schedule)
+
+        Returns:
+            numpy.ndarray: uint8 array of shape (len(handyman_ids), len(days))
+        """
+        import numpy as np
+
+        handyman_ids = list(handyman_ids)
+        days = list(days)
+        schedule = schedule or self.schedule
+        if not handyman_ids or not days:
+            return np.zeros((len(handyman_ids), len(days)), dtype=np.uint8)
+
+        grid = self.busy_index.busy_slot_grid(handyman_ids, days)
+        busy = np.fromiter(
+            (schedule.mask(slots) if slots else 0 for row in grid for slots in row),
+            dtype=np.uint8,
+            count=len(handyman_ids) * len(days),
+        ).reshape(len(handyman_ids), len(days))
+
+        unavailable = np.array([schedule.passed_mask(day, now) for day in days], dtype=np.uint8)
+        return schedule.all_mask & ~(busy | unavailable)
+
+    def weekly_schedule(self, handyman_id, days=SCHEDULE_DAYS, now=None):
+        """
+        Free slots of one handyman for the next days, starting today.
+
+        Returns:
+            list: (date, [slot names]) for each day that has a free slot
+        """
+        now = now or datetime.today()
+        schedule = self.schedule
+        dates = [(now + timedelta(days=i)).date() for i in range(days)]
+        masks = self.free_masks([handyman_id], dates, now, schedule)[0]
+        return [(day, schedule.slots_of(int(mask))) for day, mask in zip(dates, masks) if mask]
+
+    def is_free(self, handyman_id, day, slot, now=None):
+        """True if handyman_id can still be booked at (day, slot)"""
+        schedule = self.schedule
+        return bool(self.free_masks([handyman_id], [day], now, schedule)[0, 0] & schedule.bits.get(slot, 0))
+
+    def first_free(self, handyman_ids, day, slot, n=1, now=None, busy_slots=None, chunk_size=256):
+        """
+        The first n handymen, in the given order, who are free at (day, slot).
+
+        Args:
+            handyman_ids: Candidates, best first
+            day: Date of the booking
+            slot: Slot name
+            n: Number of handymen wanted
+            now: Current time, for the passed-slot rule
+            busy_slots: Optional busy_slots(handyman_id, day) used instead of
+                the index, one candidate at a time (e.g. to share reads in a turn)
+            chunk_size: Most candidates looked up together when using the index
+
+        Returns:
+            list: Up to n handyman ids
+        """
+        schedule = self.schedule
+        bit = schedule.bits.get(slot, 0)
+        if not bit or schedule.passed_mask(day, now) & bit:
+            return []
+
+        found = []
+        if busy_slots is not None:
+            for handyman_id in handyman_ids:
+                if slot not in busy_slots(handyman_id, day):
+                    found.append(handyman_id)
+                    if len(found) >= n:
+                        break
+            return found
+
+        # One day and one slot: a membership test per candidate beats building
+        # masks. Look up a few candidates per wanted handyman, then more if busy.
+        busy_index = self.busy_index
+        candidates = iter(handyman_ids)
+        size = min(chunk_size, max(2 * n, 8))
+        while True:
+            chunk = list(islice(candidates, size))
+            if not chunk:
+                return found
+            for handyman_id, (busy,) in zip(chunk, busy_index.busy_slot_grid(chunk, [day])):
+                if slot not in busy:
+                    found.append(handyman_id)
+                    if len(found) >= n:
+                        return found
+            size = min(chunk_size, size * 2)
+
+
+_engine = None
+
+
+def get_availability_engine():
+    """Return the shared engine (reads the shared BusySlotIndex)"""
+    global _engine
+    if _engine is None:
+        _engine = AvailabilityEngine()
+    return _engine
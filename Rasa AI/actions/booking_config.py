@@ -0,0 +1,181 @@
+"""
+Versioned snapshot of the booking configuration: the fare and the slot schedule.
+
+ActionShowBookingDetails, ActionConfirmBooking, ActionEasyBook and
+process_booking each read /fare on every call, and the slot hours were
+hard-coded in the actions, the parser and the availability engine. Both now
+come from one immutable BookingConfig snapshot, cached in the process:
+
+    config = get_booking_config()
+    config.fare                          # booking fee in RM
+    config.schedule.display[slot]        # "8:00 AM - 12:00 PM"
+    config.schedule.timestamps(slot, day)
+
+The snapshot is built from two nodes, each followed by a listener (see
+rtdb.TreeMirror), so an edit in the console reaches every worker without a
+deploy or a read per turn:
+
+    /fare            {"amount": 20}  (shared with the backend)
+    /bookingConfig   {"version": 2,
+                      "slots": {"Slot 1": {"start": "08:00", "end": "12:00"}, ...},
+                      "defaultSlot": "Slot 2"}
+
+Any change to either node drops the cached snapshot; the next call builds a
+new one with the next version number. Without /bookingConfig (or with a
+schedule that doesn't validate) the built-in schedule of slot_schedule.py
+is used. BOOKING_CONFIG_MODE=poll and BOOKING_CONFIG_TTL switch to ETag
+polling, like the handyman directory.
+"""
+import os
+import threading
+
+from .log import get_logger
+from .rtdb import TreeMirror
+from .slot_schedule import DEFAULT_SCHEDULE, SlotSchedule
+
+log = get_logger(__name__)
+
+FARE_PATH = "/fare"
+CONFIG_PATH = "/bookingConfig"
+
+# Booking fee when /fare has no amount
+DEFAULT_FARE = 20
+
+
+class BookingConfig:
+    """
+    One immutable version of the booking configuration.
+
+    Args:
+        fare: Booking fee charged per booking
+        schedule: SlotSchedule of the bookable slots
+        version: Local version number, increasing with every change seen
+        source_version: The "version" stored in /bookingConfig, if any
+    """
+
+    __slots__ = ("fare", "schedule", "version", "source_version")
+
+    def __init__(self, fare=DEFAULT_FARE, schedule=DEFAULT_SCHEDULE, version=0, source_version=None):
+        self.fare = fare
+        self.schedule = schedule
+        self.version = version
+        self.source_version = source_version
+
+    def __repr__(self):
+        return (f"BookingConfig(fare={self.fare!r}, slots={list(self.schedule.names)!r}, "
+                f"version={self.version}, source_version={self.source_version!r})")
+
+
+def fare_amount(fare_node):
+    """Booking fee from the children of /fare (DEFAULT_FARE if missing)"""
+    amount = (fare_node or {}).get("amount", DEFAULT_FARE)
+    return DEFAULT_FARE if amount is None else amount
+
+
+def schedule_from(config_node):
+    """
+    SlotSchedule from the children of /bookingConfig.
+
+    Falls back to DEFAULT_SCHEDULE when the node has no slots or they don't
+    validate (the problem is logged).
+    """
+    config_node = config_node or {}
+    slots = config_node.get("slots")
+    if not slots:
+        return DEFAULT_SCHEDULE
+    try:
+        if isinstance(slots, dict):
+            entries = [(name, spec["start"], spec["end"]) for name, spec in slots.items()]
+        else:
+            # Stored as a list: [{"name": "Slot 1", "start": ..., "end": ...}, ...]
+            entries = [(spec["name"], spec["start"], spec["end"]) for spec in slots if spec]
+        return SlotSchedule(entries, default=config_node.get("defaultSlot"))
+    except (KeyError, TypeError, ValueError) as e:
+        log.warning("Invalid slot schedule in %s, using the default: %s", CONFIG_PATH, e)
+        return DEFAULT_SCHEDULE
+
+
+class BookingConfigStore:
+    """
+    Builds and caches BookingConfig snapshots from /fare and /bookingConfig.
+
+    Args:
+        ttl: Seconds a polled copy is served before its ETag is checked
+        use_listener: Follow the nodes with listeners (push invalidation)
+    """
+
+    def __init__(self, ttl=30, use_listener=True):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._changes = 0
+        self._version = 0
+        self._fare = TreeMirror(FARE_PATH, ttl=ttl, use_listener=use_listener)
+        self._config = TreeMirror(CONFIG_PATH, ttl=ttl, use_listener=use_listener)
+        for mirror in (self._fare, self._config):
+            mirror.subscribe(self._on_change)
+
+    def _on_change(self, key, old, new):
+        with self._lock:
+            self._changes += 1
+            self._snapshot = None
+
+    def snapshot(self):
+        """Return the current BookingConfig (built again only after a change)"""
+        # Reading the mirrors loads them, or refreshes them when polling
+        self._fare.records()
+        self._config.records()
+        with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            changes = self._changes
+        fare_node = self._fare.records()
+        config_node = self._config.records()
+        snapshot = BookingConfig(fare_amount(fare_node), schedule_from(config_node),
+                                 source_version=config_node.get("version"))
+        with self._lock:
+            if self._snapshot is None and changes == self._changes:
+                self._version += 1
+                snapshot.version = self._version
+                self._snapshot = snapshot
+                log.info("Booking config version %s: fare %s, slots %s", snapshot.version, snapshot.fare,
+                         ", ".join(snapshot.schedule.names))
+            elif self._snapshot is not None:
+                snapshot = self._snapshot
+            else:
+                # Changed while building; this call uses what it read, the next builds again
+                snapshot.version = self._version
+        return snapshot
+
+    def close(self):
+        self._fare.close()
+        self._config.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_booking_config_store():
+    """Return the shared BookingConfigStore, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BookingConfigStore(
+                    ttl=float(os.environ.get('BOOKING_CONFIG_TTL', 30)),
+                    use_listener=os.environ.get('BOOKING_CONFIG_MODE', 'listen') != 'poll',
+                )
+    return _store
+
+
+def get_booking_config():
+    """Return the current BookingConfig snapshot"""
+    return get_booking_config_store().snapshot()
+
+
+def reset_booking_config(store=None):
+    """Replace the shared store (closing the old one), e.g. after switching backends"""
+    global _store
+    if _store is not None:
+        _store.close()
+    _store = store
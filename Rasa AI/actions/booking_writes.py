@@ -0,0 +1,251 @@
+"""
+Atomic booking writes with slot reservation.
+
+Confirming a booking used to write /jobs/{booking_id} and then
+/walletTransactions/{txn_id} as two separate requests, with nothing stopping
+two users from booking the same handyman slot at the same moment. A booking
+now goes through two steps:
+
+1. A transaction on /slotLocks/{handyman_id}/{date}/{slot} claims the slot.
+   Only one client can win it; everyone else gets SLOT_TAKEN.
+2. A second transaction on the lock confirms it, but only while the lock
+   still belongs to the booking: a reservation that expired and was claimed
+   by another booking in the meantime gives SLOT_TAKEN, and nothing is
+   written.
+3. One multi-path update at the root creates the job and records the
+   booking fee, so the job never exists without its fee (or the other way
+   round).
+
+A reservation that is never confirmed (the process died between the steps)
+stops holding the slot after RESERVATION_TTL_MS. Cancelling a booking
+releases its lock with release_slot(). The backend rejects and cancels jobs
+by writing their status and never touches /slotLocks, so a confirmed lock
+only holds the slot while its job's status is one of BUSY_STATUSES; a lock
+whose job was rejected, cancelled or removed is taken over. A lock confirmed
+less than RESERVATION_TTL_MS ago holds the slot while its job is missing,
+since the job is written right after the confirmation.
+"""
+import time
+from datetime import datetime
+
+from . import rtdb
+from .job_index import BUSY_STATUSES, get_busy_slot_index, job_slot_key
+from .log import get_logger
+from .user_profiles import get_user_profiles
+
+log = get_logger(__name__)
+
+SLOT_LOCKS_PATH = "slotLocks"
+
+# How long an unconfirmed reservation holds a slot
+RESERVATION_TTL_MS = 60 * 1000
+
+# Outcomes of book_slot()
+BOOKED = "booked"
+SLOT_TAKEN = "slot_taken"
+
+
+class SlotTaken(Exception):
+    """Raised inside a reservation transaction to abort it"""
+
+
+def slot_lock_path(handyman_id, day, slot):
+    """
+    Path of the lock node for one handyman slot.
+
+    Args:
+        handyman_id: ID of the handyman
+        day: Date of the booking (a date or a "YYYY-MM-DD" string)
+        slot: Slot name, e.g. "Slot 2"
+    """
+    if not isinstance(day, str):
+        day = day.isoformat()
+    return f"{SLOT_LOCKS_PATH}/{handyman_id}/{day}/{slot}"
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _holds_slot(lock, booking_id, now_ms, released_booking_id=None):
+    """
+    True if an existing lock keeps booking_id from taking the slot.
+
+    Args:
+        lock: Current value of the lock node
+        booking_id: Booking that wants the slot
+        now_ms: Current time in milliseconds
+        released_booking_id: Booking whose job is no longer busy (see
+            _released_booking); its confirmed lock doesn't hold the slot
+    """
+    if not isinstance(lock, dict) or lock.get("booking_id") == booking_id:
+        return False
+    if lock.get("confirmed"):
+        return released_booking_id is None or lock.get("booking_id") != released_booking_id
+    return now_ms - lock.get("reserved_at", 0) < RESERVATION_TTL_MS
+
+
+def _job_status(booking_id):
+    return rtdb.reference(f"/jobs/{booking_id}/status").get()
+
+
+def _released_booking(lock, now_ms):
+    """
+    Booking ID of a confirmed lock whose job is no longer busy, else None.
+
+    The backend rejects and cancels jobs without releasing their lock, so the
+    job's status decides whether a confirmed lock still holds the slot. A
+    missing job only releases a lock confirmed more than RESERVATION_TTL_MS
+    ago; before that the booking may still be writing it.
+    """
+    if not isinstance(lock, dict) or not lock.get("confirmed") or not lock.get("booking_id"):
+        return None
+    lock_booking_id = lock["booking_id"]
+    status = _job_status(lock_booking_id)
+    if status in BUSY_STATUSES:
+        return None
+    if status is None and now_ms - lock.get("confirmed_at", 0) < RESERVATION_TTL_MS:
+        return None
+    log.info("Taking over the lock of booking %s (status %s)", lock_booking_id, status)
+    return lock_booking_id
+
+
+def booking_fee_transaction(booking_id, user_id, booking_fee):
+    """Wallet transaction record for the processing fee of a booking"""
+    return {
+        "amount": -booking_fee,
+        "bookingId": booking_id,
+        "description": f"Processing fee for booking {booking_id}",
+        "timestamp": int(datetime.now().timestamp() * 1000),
+        "transactionType": "booking-fee",
+        "userId": user_id
+    }
+
+
+def reserve_slot(handyman_id, day, slot, booking_id, user_id):
+    """
+    Claim a slot for booking_id with a transaction on its lock node.
+
+    Returns:
+        bool: True if the slot is now reserved for booking_id
+    """
+    ref = rtdb.reference(slot_lock_path(handyman_id, day, slot))
+    released_booking_id = _released_booking(ref.get(), _now_ms())
+    taken_over = []
+
+    def claim(current):
+        if _holds_slot(current, booking_id, _now_ms(), released_booking_id):
+            raise SlotTaken()
+        # The transaction may run several times; the last run is the one committed
+        replaced = current.get("booking_id") if isinstance(current, dict) and current.get("confirmed") else None
+        taken_over[:] = [replaced] if replaced is not None and replaced == released_booking_id else []
+        return {
+            "booking_id": booking_id,
+            "user_id": user_id,
+            "reserved_at": _now_ms(),
+            "confirmed": False
+        }
+
+    try:
+        ref.transaction(claim)
+    except (SlotTaken, rtdb.TransactionAbortedError):
+        return False
+
+    # The released job's status was read outside the transaction: if the
+    # backend made it busy again since, give the slot back to it
+    if taken_over and _job_status(taken_over[0]) in BUSY_STATUSES:
+        log.info("Booking %s became busy again, leaving its slot", taken_over[0])
+        _release(handyman_id, day, slot, booking_id)
+        return False
+    return True
+
+
+def confirm_slot(handyman_id, day, slot, booking_id):
+    """
+    Mark the reservation of booking_id confirmed, if the lock is still its own.
+
+    Returns:
+        bool: False if the reservation expired and another booking claimed it
+    """
+    def confirm(current):
+        if not isinstance(current, dict) or current.get("booking_id") != booking_id:
+            raise SlotTaken()
+        return dict(current, confirmed=True, confirmed_at=_now_ms())
+
+    try:
+        rtdb.reference(slot_lock_path(handyman_id, day, slot)).transaction(confirm)
+        return True
+    except (SlotTaken, rtdb.TransactionAbortedError):
+        return False
+
+
+def _release(handyman_id, day, slot, booking_id):
+    def release(current):
+        if isinstance(current, dict) and current.get("booking_id") == booking_id:
+            return None
+        # Someone else's lock (or none): leave it as it is
+        return current
+
+    rtdb.reference(slot_lock_path(handyman_id, day, slot)).transaction(release)
+
+
+def book_slot(booking_id, booking_data, txn_id, txn_data):
+    """
+    Reserve the job's slot, then write the job and its fee in one update.
+
+    Args:
+        booking_id: Key of the new job under /jobs
+        booking_data: Job record (assigned_to, starttimestamp, assigned_slot, ...)
+        txn_id: Key of the fee under /walletTransactions
+        txn_data: Wallet transaction record for the fee
+
+    Returns:
+        str: BOOKED, or SLOT_TAKEN if another booking holds the slot
+    """
+    handyman_id, day, slot = job_slot_key(booking_data)
+    index = get_busy_slot_index()
+
+    # Jobs created without a lock (older bookings, the app, the backend) still
+    # occupy their slot; the cache may not have seen one created moments ago
+    if index.is_busy_fresh(handyman_id, day, slot):
+        return SLOT_TAKEN
+    if not reserve_slot(handyman_id, day, slot, booking_id, booking_data.get("user_id")):
+        log.info("Slot %s on %s for handyman %s was taken by another booking", slot, day, handyman_id)
+        return SLOT_TAKEN
+    if not confirm_slot(handyman_id, day, slot, booking_id):
+        log.info("Reservation of booking %s expired and slot %s on %s for handyman %s was taken",
+                 booking_id, slot, day, handyman_id)
+        return SLOT_TAKEN
+
+    try:
+        rtdb.reference("/").update({
+            f"jobs/{booking_id}": booking_data,
+            f"walletTransactions/{txn_id}": txn_data,
+        })
+    except Exception:
+        # Don't hold the slot for a booking that was never written
+        _release(handyman_id, day, slot, booking_id)
+        raise
+
+    index.record_job(booking_id, booking_data)
+    # The fee comes off the wallet: the cached balance is out of date
+    get_user_profiles().invalidate(booking_data.get("user_id"))
+    return BOOKED
+
+
+def release_slot(booking_id, booking_data):
+    """
+    Free the slot lock held by a booking (e.g. after cancelling it).
+
+    Args:
+        booking_id: Key of the job under /jobs
+        booking_data: Job record as it was before cancelling
+    """
+    key = job_slot_key(booking_data)
+    if key is None:
+        return
+    handyman_id, day, slot = key
+    try:
+        _release(handyman_id, day, slot, booking_id)
+    except rtdb.TransactionAbortedError as e:
+        log.error("Error releasing slot lock for booking %s: %s", booking_id, e)
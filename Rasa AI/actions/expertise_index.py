@@ -0,0 +1,319 @@
+"""
+Handyman lookups by expertise, status and city.
+
+get_matching_handymen, ActionShowOtherLocations and ActionEasyBook each
+scanned every handyman and tested `expertise.lower() in exp.lower()` against
+every entry of their expertise list. This index keeps, per expertise the
+actions ask for, the set of handymen that match it, next to the set of active
+handymen and one set per city, so a match is a set lookup plus an intersection.
+
+The actions also sorted every match by rating on each call (sometimes twice).
+Next to each set the index keeps rating leaderboards per (status, city):
+lists kept sorted with bisect as ratings change, so the top k of a city is
+read off the front of one list and "elsewhere" is a lazy merge of the others.
+
+    index = get_expertise_index()
+    index.ids("Plumber", active=True, city="Kuala Lumpur")     # plumbers in KL
+    index.top("Plumber", 3, active=True, city="Kuala Lumpur")  # best 3 of them
+    index.top("Plumber", exclude_city="Kuala Lumpur")          # anywhere else, best first
+
+Expertise is matched the way the actions always have: a handyman matches
+"Plumber" if any of their expertise names contains "plumber". The canonical
+expertises (the values of expertise_mapping in actions.py) are the names the
+actions query, and each gets its own set on first use, kept up to date from
+then on. Any other name is answered from the distinct expertise names instead
+of the handymen.
+
+The index follows the handyman directory's change feed, like the spatial index.
+"""
+import bisect
+import heapq
+import threading
+from itertools import islice
+
+from .handyman_directory import get_handyman_directory
+
+# Most expertise names that get their own set of handymen; further names are
+# answered by scanning the distinct expertise names
+MAX_TRACKED_EXPERTISE = 64
+
+
+def handyman_rating(record):
+    """
+    Rating the handyman lists are sorted by: average_rating, else rating, else 0.
+
+    Values that aren't numbers count as 0.
+    """
+    rating = record.get("average_rating", 0) or record.get("rating", 0)
+    if isinstance(rating, bool):
+        return 0
+    if isinstance(rating, (int, float)):
+        return rating
+    try:
+        return float(rating)
+    except (TypeError, ValueError):
+        return 0
+
+
+def expertise_entry(record):
+    """
+    Return (expertise_names, active, city, rating) for a handyman the index should hold, else None.
+
+    Handymen without an expertise list are left out. expertise_names are the
+    lower-cased names, active is True for status "active", city is the
+    lower-cased city ('' if missing) and rating is handyman_rating().
+
+    Args:
+        record: Handyman record as stored under /handymen
+    """
+    if not isinstance(record, dict):
+        return None
+    expertise = record.get("expertise")
+    if not expertise or not isinstance(expertise, list):
+        return None
+    names = tuple(dict.fromkeys(exp.lower() for exp in expertise if isinstance(exp, str)))
+    if not names:
+        return None
+    city = record.get("city")
+    city = city.lower() if isinstance(city, str) else ''
+    return names, record.get("status") == "active", city, handyman_rating(record)
+
+
+class ExpertiseIndex:
+    """
+    Sets of handyman ids per expertise, per city and for active handymen,
+    with rating leaderboards per expertise, status and city.
+
+    ids() returns directory order (the order handymen were first seen);
+    top() returns rating order with ties in directory order, the way sorting
+    a scan did.
+
+    Args:
+        directory: HandymanDirectory to follow; None for an index fed only
+            through insert()/remove()
+        max_tracked: Most expertise names with their own set
+    """
+
+    def __init__(self, directory=None, max_tracked=MAX_TRACKED_EXPERTISE):
+        self.max_tracked = max_tracked
+        self._lock = threading.RLock()
+        self._entries = {}   # handyman_id -> (expertise_names, active, city, rating)
+        self._order = {}     # handyman_id -> position in the directory (every record)
+        self._next_order = 0
+        self._names = {}     # expertise name -> {handyman_id}
+        self._tracked = {}   # queried expertise -> {handyman_id}
+        self._boards = {}    # queried expertise -> {(active, city): [(-rating, order, handyman_id)], sorted}
+        self._active = set()
+        self._cities = {}    # city -> {handyman_id}
+        self._directory = directory
+        if directory is not None:
+            directory.subscribe(self._on_handyman_changed, replay=True)
+
+    # Maintenance
+
+    def insert(self, handyman_id, record):
+        """Add or update a handyman; records that aren't indexable remove it instead"""
+        with self._lock:
+            if isinstance(record, dict) and handyman_id not in self._order:
+                self._order[handyman_id] = self._next_order
+                self._next_order += 1
+            self._apply(handyman_id, expertise_entry(record))
+            if not isinstance(record, dict):
+                self._order.pop(handyman_id, None)
+
+    def remove(self, handyman_id):
+        """Drop a handyman from the index"""
+        with self._lock:
+            self._apply(handyman_id, None)
+            self._order.pop(handyman_id, None)
+
+    def _on_handyman_changed(self, handyman_id, old_record, new_record):
+        self.insert(handyman_id, new_record)
+
+    def _apply(self, handyman_id, entry):
+        old_entry = self._entries.get(handyman_id)
+        if old_entry == entry:
+            return
+        if old_entry is not None:
+            names, active, city, rating = old_entry
+            for name in names:
+                self._discard(self._names, name, handyman_id)
+            for needle, ids in self._tracked.items():
+                if handyman_id in ids:
+                    ids.discard(handyman_id)
+                    self._unrank(needle, handyman_id, old_entry)
+            self._active.discard(handyman_id)
+            self._discard(self._cities, city, handyman_id)
+            del self._entries[handyman_id]
+        if entry is None:
+            return
+
+        names, active, city, rating = entry
+        for name in names:
+            self._names.setdefault(name, set()).add(handyman_id)
+        for needle, ids in self._tracked.items():
+            if any(needle in name for name in names):
+                ids.add(handyman_id)
+                self._rank(needle, handyman_id, entry)
+        if active:
+            self._active.add(handyman_id)
+        self._cities.setdefault(city, set()).add(handyman_id)
+        self._entries[handyman_id] = entry
+
+    def _rank_key(self, handyman_id, entry):
+        return -entry[3], self._order[handyman_id], handyman_id
+
+    def _rank(self, needle, handyman_id, entry):
+        boards = self._boards.setdefault(needle, {})
+        board = boards.setdefault((entry[1], entry[2]), [])
+        bisect.insort(board, self._rank_key(handyman_id, entry))
+
+    def _unrank(self, needle, handyman_id, entry):
+        boards = self._boards.get(needle, {})
+        board = boards.get((entry[1], entry[2]))
+        if board is None:
+            return
+        rank_key = self._rank_key(handyman_id, entry)
+        i = bisect.bisect_left(board, rank_key)
+        if i < len(board) and board[i] == rank_key:
+            del board[i]
+        if not board:
+            del boards[(entry[1], entry[2])]
+
+    @staticmethod
+    def _discard(table, key, handyman_id):
+        ids = table.get(key)
+        if ids is not None:
+            ids.discard(handyman_id)
+            if not ids:
+                del table[key]
+
+    # Lookups
+
+    def _sync(self):
+        if self._directory is not None:
+            # Loads the directory on first use (or refreshes it when polling)
+            self._directory.records()
+
+    def _matching(self, needle):
+        """Set of ids matching needle (the caller holds the lock and must not modify it)"""
+        ids = self._tracked.get(needle)
+        if ids is not None:
+            return ids
+        ids = set()
+        for name, members in self._names.items():
+            if needle in name:
+                ids |= members
+        if len(self._tracked) < self.max_tracked:
+            self._tracked[needle] = ids
+            self._boards[needle] = {}
+            for handyman_id in ids:
+                self._rank(needle, handyman_id, self._entries[handyman_id])
+        return ids
+
+    def _filter(self, ids, active, city, exclude_city):
+        if active is True:
+            ids = ids & self._active
+        elif active is False:
+            ids = ids - self._active
+        if city is not None:
+            ids = ids & self._cities.get(city.lower(), set())
+        if exclude_city is not None:
+            ids = ids - self._cities.get(exclude_city.lower(), set())
+        return ids
+
+    def ids(self, expertise, active=None, city=None, exclude_city=None):
+        """
+        IDs of handymen matching expertise, in directory order.
+
+        Args:
+            expertise: Required expertise (substring match, case-insensitive)
+            active: True for active handymen only, False for inactive only,
+                None for both
+            city: Only handymen in this city (case-insensitive)
+            exclude_city: Only handymen not in this city (case-insensitive);
+                handymen without a city count as elsewhere
+        """
+        if not isinstance(expertise, str):
+            return []
+        self._sync()
+        with self._lock:
+            ids = self._filter(self._matching(expertise.lower()), active, city, exclude_city)
+            order = self._order
+            return sorted(ids, key=order.__getitem__)
+
+    def top(self, expertise, k=None, active=None, city=None, exclude_city=None):
+        """
+        IDs of the k best-rated handymen matching expertise, best first.
+
+        Takes the same filters as ids(). Reads the front of the matching
+        leaderboards, so a single city costs O(k); ties keep directory order.
+
+        Args:
+            expertise: Required expertise (substring match, case-insensitive)
+            k: Number of handymen wanted; None for all of them
+        """
+        if not isinstance(expertise, str):
+            return []
+        self._sync()
+        with self._lock:
+            needle = expertise.lower()
+            ids = self._matching(needle)
+            if needle not in self._tracked:
+                # Too many names tracked: sort this one's matches directly
+                ids = self._filter(ids, active, city, exclude_city)
+                ranked = sorted(self._rank_key(h, self._entries[h]) for h in ids)
+                return [rank_key[2] for rank_key in ranked[:k]]
+
+            statuses = (True, False) if active is None else (active,)
+            needle_boards = self._boards[needle]
+            if city is not None:
+                if exclude_city is not None and exclude_city.lower() == city.lower():
+                    return []
+                boards = [needle_boards.get((status, city.lower()), []) for status in statuses]
+            else:
+                exclude_city = exclude_city.lower() if exclude_city is not None else None
+                boards = [
+                    board for (board_active, board_city), board in needle_boards.items()
+                    if board_active in statuses and board_city != exclude_city
+                ]
+            ranked = boards[0] if len(boards) == 1 else heapq.merge(*boards)
+            return [rank_key[2] for rank_key in islice(ranked, k)]
+
+    def stats(self):
+        """Return the number of indexed handymen, cities and tracked expertise names"""
+        with self._lock:
+            return {
+                "handymen": len(self._entries),
+                "active": len(self._active),
+                "cities": len(self._cities),
+                "tracked": {needle: len(ids) for needle, ids in self._tracked.items()},
+                "leaderboards": sum(len(boards) for boards in self._boards.values()),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_expertise_index():
+    """
+    Return the shared ExpertiseIndex, creating it on first use.
+
+    It follows the shared handyman directory (and is rebuilt if that directory
+    is replaced).
+    """
+    global _index
+    directory = get_handyman_directory()
+    if _index is None or _index._directory is not directory:
+        with _index_lock:
+            if _index is None or _index._directory is not directory:
+                _index = ExpertiseIndex(directory)
+    return _index
+
+
+def reset_expertise_index(index=None):
+    """Replace the shared index, e.g. after switching backends"""
+    global _index
+    with _index_lock:
+        _index = index
@@ -0,0 +1,369 @@
+"""
+In-memory stand-in for firebase_admin.db, for running the action server offline.
+
+    from actions import rtdb
+    from actions.fake_rtdb import FakeDatabase
+
+    rtdb.use_backend(FakeDatabase({"handymen": {...}, "jobs": {...}}))
+
+Only the parts of the Reference API the actions use are implemented. Values are
+deep-copied on the way in and out, like a real round trip, and listeners get
+put/patch events shaped like firebase_admin.db.Event.
+"""
+import copy
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from firebase_admin.db import TransactionAbortedError
+
+# Same retry budget as firebase_admin.db.Reference.transaction
+TRANSACTION_MAX_RETRIES = 25
+
+
+def _split(path):
+    return [p for p in (path or "/").split("/") if p]
+
+
+def _join(parts):
+    return "/" + "/".join(parts)
+
+
+def _overlaps(a, b):
+    """True if one path is a prefix of the other"""
+    n = min(len(a), len(b))
+    return a[:n] == b[:n]
+
+
+def _prune(value):
+    """Drop None values and empty dicts, like the database does"""
+    if isinstance(value, dict):
+        pruned = {}
+        for k, v in value.items():
+            v = _prune(v)
+            if v is not None:
+                pruned[k] = v
+        return pruned or None
+    return value
+
+
+class FakeEvent:
+    """Listener event with the same attributes as firebase_admin.db.Event"""
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class FakeListenerRegistration:
+    def __init__(self, database, path, callback):
+        self._database = database
+        self.path = path
+        self.callback = callback
+
+    def close(self):
+        self._database._remove_listener(self)
+
+
+class FakeDatabase:
+    """
+    A whole Realtime Database held in one dict.
+
+    Args:
+        data: Initial contents of the root node
+        latency: Seconds each read or write blocks for, to simulate the
+            network round trip of the real database (load tests)
+    """
+
+    def __init__(self, data=None, latency=0):
+        self.latency = latency
+        self._root = _prune(copy.deepcopy(data)) or {}
+        self._lock = threading.RLock()
+        self._listeners = []
+        self.reads = 0
+        self.writes = 0
+
+    def reference(self, path="/"):
+        return FakeReference(self, _split(path))
+
+    def _round_trip(self):
+        # Outside the lock, so concurrent callers wait in parallel like real clients
+        if self.latency:
+            time.sleep(self.latency)
+
+    # Tree access (callers hold self._lock)
+
+    def _read(self, parts):
+        node = self._root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _write(self, parts, value):
+        value = _prune(copy.deepcopy(value))
+        if not parts:
+            self._root = value or {}
+            return
+        node = self._root
+        trail = []
+        for part in parts[:-1]:
+            trail.append((node, part))
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+        # Remove parents left empty by a delete
+        for parent, part in reversed(trail):
+            if parent.get(part) == {}:
+                parent.pop(part)
+
+    def _etag(self, parts):
+        value = self._read(parts)
+        encoded = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.md5(encoded).hexdigest()
+
+    # Listeners
+
+    def _add_listener(self, parts, callback):
+        registration = FakeListenerRegistration(self, parts, callback)
+        with self._lock:
+            self._listeners.append(registration)
+            initial = copy.deepcopy(self._read(parts))
+        callback(FakeEvent("put", "/", initial))
+        return registration
+
+    def _remove_listener(self, registration):
+        with self._lock:
+            if registration in self._listeners:
+                self._listeners.remove(registration)
+
+    def _events_for(self, parts, event_type, value):
+        """Build (callback, event) pairs for a write at parts"""
+        events = []
+        for registration in list(self._listeners):
+            path = registration.path
+            if parts[:len(path)] == path:
+                relative = parts[len(path):]
+                events.append((registration.callback, FakeEvent(event_type, _join(relative), copy.deepcopy(value))))
+            elif path[:len(parts)] == parts:
+                events.append((registration.callback, FakeEvent("put", "/", copy.deepcopy(self._read(path)))))
+        return events
+
+    @staticmethod
+    def _dispatch(events):
+        for callback, event in events:
+            callback(event)
+
+
+class FakeReference:
+    """Subset of firebase_admin.db.Reference backed by a FakeDatabase"""
+
+    def __init__(self, database, parts):
+        self._database = database
+        self._parts = parts
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return _join(self._parts)
+
+    def child(self, path):
+        return FakeReference(self._database, self._parts + _split(path))
+
+    def get(self, etag=False, shallow=False):
+        database = self._database
+        database._round_trip()
+        with database._lock:
+            database.reads += 1
+            value = copy.deepcopy(database._read(self._parts))
+            if shallow and isinstance(value, dict):
+                value = {k: True if isinstance(v, dict) else v for k, v in value.items()}
+            if etag:
+                return value, database._etag(self._parts)
+            return value
+
+    def get_if_changed(self, etag):
+        database = self._database
+        database._round_trip()
+        with database._lock:
+            database.reads += 1
+            current = database._etag(self._parts)
+            if current == etag:
+                return False, None, None
+            return True, copy.deepcopy(database._read(self._parts)), current
+
+    def set(self, value):
+        database = self._database
+        database._round_trip()
+        with database._lock:
+            database.writes += 1
+            database._write(self._parts, value)
+            events = database._events_for(self._parts, "put", value)
+        database._dispatch(events)
+
+    def set_if_unchanged(self, expected_etag, value):
+        database = self._database
+        database._round_trip()
+        with database._lock:
+            current = database._etag(self._parts)
+            if current != expected_etag:
+                database.reads += 1
+                return False, copy.deepcopy(database._read(self._parts)), current
+            database.writes += 1
+            database._write(self._parts, value)
+            events = database._events_for(self._parts, "put", value)
+            new_etag = database._etag(self._parts)
+        database._dispatch(events)
+        return True, copy.deepcopy(value), new_etag
+
+    def transaction(self, transaction_update):
+        # Optimistic compare-and-set loop, as firebase_admin does it: the
+        # update function runs outside the lock and is retried on conflict
+        if not callable(transaction_update):
+            raise ValueError("transaction_update must be a function.")
+        data, etag = self.get(etag=True)
+        for _ in range(TRANSACTION_MAX_RETRIES):
+            new_data = transaction_update(data)
+            success, data, etag = self.set_if_unchanged(etag, new_data)
+            if success:
+                return new_data
+        raise TransactionAbortedError("Transaction aborted after failed retries.")
+
+    def update(self, value):
+        if not isinstance(value, dict) or not value:
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        database = self._database
+        database._round_trip()
+        with database._lock:
+            database.writes += 1
+            events = []
+            for key, child_value in value.items():
+                parts = self._parts + _split(key)
+                database._write(parts, child_value)
+            for registration in list(database._listeners):
+                path = registration.path
+                if self._parts[:len(path)] == path:
+                    relative = self._parts[len(path):]
+                    event = FakeEvent("patch", _join(relative), copy.deepcopy(value))
+                    events.append((registration.callback, event))
+                elif any(_overlaps(path, self._parts + _split(key)) for key in value):
+                    # Listener below the updated node: send its new contents
+                    event = FakeEvent("put", "/", copy.deepcopy(database._read(path)))
+                    events.append((registration.callback, event))
+        database._dispatch(events)
+
+    def delete(self):
+        self.set(None)
+
+    def push(self, value=""):
+        child = self.child(str(uuid.uuid4()))
+        child.set(value)
+        return child
+
+    def listen(self, callback):
+        return self._database._add_listener(self._parts, callback)
+
+    def order_by_child(self, path):
+        return FakeQuery(self, lambda key, value: _child_value(value, _split(path)))
+
+    def order_by_key(self):
+        return FakeQuery(self, lambda key, value: key)
+
+    def order_by_value(self):
+        return FakeQuery(self, lambda key, value: value)
+
+
+def _child_value(value, parts):
+    for part in parts:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _sort_key(value):
+    # Database ordering: null, false, true, numbers, strings, objects
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, 0)
+
+
+class FakeQuery:
+    """Subset of firebase_admin.db.Query (ordering, ranges and limits)"""
+
+    def __init__(self, reference, order_key):
+        self._reference = reference
+        self._order_key = order_key
+        self._start = None
+        self._end = None
+        self._equal = None
+        self._first = None
+        self._last = None
+
+    def start_at(self, start):
+        self._start = start
+        return self
+
+    def end_at(self, end):
+        self._end = end
+        return self
+
+    def equal_to(self, value):
+        self._equal = value
+        return self
+
+    def limit_to_first(self, limit):
+        self._first = limit
+        return self
+
+    def limit_to_last(self, limit):
+        self._last = limit
+        return self
+
+    def get(self):
+        database = self._reference._database
+        database._round_trip()
+        with database._lock:
+            database.reads += 1
+            # Filter on the server side, like the real database: only matches are copied
+            children = database._read(self._reference._parts)
+            if not isinstance(children, dict):
+                return {}
+            return copy.deepcopy(self._select(children))
+
+    def _select(self, children):
+        entries = sorted(
+            ((_sort_key(self._order_key(k, v)), k, v) for k, v in children.items()),
+            key=lambda entry: (entry[0], entry[1]),
+        )
+        if self._equal is not None:
+            entries = [e for e in entries if e[0] == _sort_key(self._equal)]
+        if self._start is not None:
+            entries = [e for e in entries if e[0] >= _sort_key(self._start)]
+        if self._end is not None:
+            entries = [e for e in entries if e[0] <= _sort_key(self._end)]
+        if self._first is not None:
+            entries = entries[:self._first]
+        if self._last is not None:
+            entries = entries[-self._last:]
+        return {k: v for _, k, v in entries}
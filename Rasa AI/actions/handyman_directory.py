@@ -0,0 +1,74 @@
+"""
+Process-wide handyman directory.
+
+All actions used to download the whole /handymen tree on every chat turn. The
+directory loads it once per process and keeps it current through the change
+feed of the node (see rtdb.TreeMirror), so matching reads are served from
+memory.
+
+The node is /handymen; HANDYMAN_SOURCE=summary loads the /handymenSummary
+projection instead, which holds only the fields the actions read (see
+handyman_summary.py) but needs its sync job running.
+"""
+import os
+import threading
+
+from .handyman_summary import directory_path
+from .rtdb import TreeMirror
+
+
+class HandymanDirectory(TreeMirror):
+    """In-process copy of /handymen (or /handymenSummary)"""
+
+    def __init__(self, path=None, **kwargs):
+        super().__init__(path or directory_path(), **kwargs)
+
+    def all(self):
+        """
+        Return every handyman as {handyman_id: record}.
+
+        Each record is a shallow copy with its 'id' filled in, so callers can
+        annotate it (e.g. with a distance) without touching the cached copy.
+        """
+        return {h_id: dict(h_data, id=h_id) for h_id, h_data in self.records().items() if isinstance(h_data, dict)}
+
+    def get(self, handyman_id):
+        """Return a copy of one handyman record (with 'id'), or None"""
+        if not handyman_id:
+            return None
+        h_data = self.records().get(handyman_id)
+        if not isinstance(h_data, dict):
+            return None
+        return dict(h_data, id=handyman_id)
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_handyman_directory():
+    """
+    Return the shared HandymanDirectory, creating it on first use.
+
+    HANDYMAN_CACHE_MODE=poll disables the listener, HANDYMAN_CACHE_TTL sets
+    how many seconds a polled copy is served before its ETag is checked again,
+    and HANDYMAN_SOURCE=summary reads the summary node instead of /handymen.
+    """
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = HandymanDirectory(
+                    ttl=float(os.environ.get('HANDYMAN_CACHE_TTL', 30)),
+                    use_listener=os.environ.get('HANDYMAN_CACHE_MODE', 'listen') != 'poll',
+                )
+    return _directory
+
+
+def reset_handyman_directory(directory=None):
+    """Replace the shared directory (closing the old one), e.g. after switching backends"""
+    global _directory
+    with _directory_lock:
+        if _directory is not None:
+            _directory.close()
+        _directory = directory
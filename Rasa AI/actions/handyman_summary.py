@@ -0,0 +1,116 @@
+"""
+The /handymenSummary projection of /handymen.
+
+Matching only reads a few fields of each handyman, but /handymen holds
+everything the handyman app and backend store there (password hash, bank
+details, wallet, availability flags...), and loading the handyman directory
+downloaded all of it. /handymenSummary keeps, under the same keys, only the
+fields the action server reads (SUMMARY_FIELDS), and the directory can load
+that node instead.
+
+scripts/sync_handyman_summary.py builds the projection and keeps it consistent:
+
+    python -m scripts.sync_handyman_summary            # reconcile once
+    python -m scripts.sync_handyman_summary --follow   # reconcile, then follow /handymen
+
+The directory reads /handymen unless HANDYMAN_SOURCE=summary: nothing keeps
+the projection current unless the --follow job is deployed next to the action
+server, and an action server reading a projection nobody maintains would
+serve an empty or stale directory.
+"""
+import os
+
+from . import rtdb
+from .log import get_logger
+
+log = get_logger(__name__)
+
+HANDYMEN_PATH = "/handymen"
+SUMMARY_PATH = "/handymenSummary"
+
+# Every field of a handyman record the actions read
+SUMMARY_FIELDS = (
+    "name", "expertise", "status", "city", "latitude", "longitude",
+    "average_rating", "rating", "profile_image",
+)
+
+
+def directory_path():
+    """Node the handyman directory loads: /handymen, or /handymenSummary with HANDYMAN_SOURCE=summary"""
+    return SUMMARY_PATH if os.environ.get('HANDYMAN_SOURCE', 'full') == 'summary' else HANDYMEN_PATH
+
+
+def summarize(record):
+    """
+    Return the summary of a handyman record, or None if there is nothing to keep.
+
+    Args:
+        record: Handyman record as stored under /handymen
+    """
+    if not isinstance(record, dict):
+        return None
+    summary = {field: record[field] for field in SUMMARY_FIELDS if record.get(field) is not None}
+    return summary or None
+
+
+def summary_tree(handymen):
+    """{handyman_id: summary} for a whole /handymen tree (e.g. to seed a test database)"""
+    tree = {}
+    for handyman_id, record in (handymen or {}).items():
+        summary = summarize(record)
+        if summary is not None:
+            tree[handyman_id] = summary
+    return tree
+
+
+def summary_updates(handymen, summaries):
+    """
+    Multi-path update that makes summaries match handymen.
+
+    Args:
+        handymen: {handyman_id: record} (all of /handymen)
+        summaries: {handyman_id: summary} (all of /handymenSummary)
+
+    Returns:
+        dict: {handyman_id: summary, or None to delete} for every entry that differs
+    """
+    updates = {}
+    for handyman_id, record in handymen.items():
+        summary = summarize(record)
+        if summaries.get(handyman_id) != summary:
+            updates[handyman_id] = summary
+    for handyman_id in summaries:
+        if handyman_id not in handymen:
+            updates[handyman_id] = None
+    return updates
+
+
+class SummarySync:
+    """
+    Keeps /handymenSummary in step with a mirror of /handymen.
+
+    Every change the mirror reports is written to the projection, but only if
+    it changes the summary (a wallet or availability update doesn't).
+
+    Args:
+        mirror: rtdb.TreeMirror of /handymen
+    """
+
+    def __init__(self, mirror):
+        self.mirror = mirror
+        self.counts = {"written": 0, "deleted": 0, "ignored": 0, "failed": 0}
+        mirror.subscribe(self._on_handyman_changed)
+
+    def _on_handyman_changed(self, handyman_id, old_record, new_record):
+        summary = summarize(new_record)
+        if summary == summarize(old_record):
+            self.counts["ignored"] += 1
+            return
+        try:
+            rtdb.reference(SUMMARY_PATH).update({handyman_id: summary})
+        except Exception as e:
+            self.counts["failed"] += 1
+            log.error("Error writing summary of handyman %s: %s", handyman_id, e)
+            return
+        self.counts["deleted" if summary is None else "written"] += 1
+        log.debug("Updated summary of handyman %s", handyman_id)
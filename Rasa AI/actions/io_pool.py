@@ -0,0 +1,99 @@
+"""
+Bounded thread pool for the blocking work of actions.
+
+firebase_admin.db and requests are synchronous, and rasa_sdk awaits every
+action on a single event loop, so a synchronous run() waiting on the
+database stalls all other conversations. Actions built on ThreadedAction
+run their body on a shared ThreadPoolExecutor instead and only await the
+result, which keeps the loop free to serve other conversations.
+
+ACTION_THREADS bounds how many action bodies run at once (default 32);
+further turns wait in the pool's queue. Reads an action fans out while it
+runs (see turn_reads.py) use a second pool, sized by READ_THREADS (default
+64), so an action never waits on work queued behind other actions.
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import log, metrics
+
+_executor = None
+_read_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('ACTION_THREADS', 32)),
+                    thread_name_prefix='action-io',
+                )
+    return _executor
+
+
+def get_read_executor():
+    """Return the pool for concurrent reads issued from inside an action"""
+    global _read_executor
+    if _read_executor is None:
+        with _executor_lock:
+            if _read_executor is None:
+                _read_executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('READ_THREADS', 64)),
+                    thread_name_prefix='action-read',
+                )
+    return _read_executor
+
+
+def shutdown_executor(wait=True):
+    """Stop the shared pools; the next call starts new ones"""
+    global _executor, _read_executor
+    with _executor_lock:
+        for executor in (_executor, _read_executor):
+            if executor is not None:
+                executor.shutdown(wait=wait)
+        _executor = None
+        _read_executor = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function on the shared pool and await its result.
+
+    Args:
+        func: Function to call
+        *args, **kwargs: Arguments for func
+
+    Returns:
+        Whatever func returns (exceptions are re-raised in the caller)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+class ThreadedAction:
+    """
+    Mixin giving an Action an async run() that executes run_sync() on the pool.
+
+    Put it before Action in the bases and implement run_sync() with the
+    usual (dispatcher, tracker, domain) signature:
+
+        class ActionEasyBook(ThreadedAction, Action):
+            def run_sync(self, dispatcher, tracker, domain):
+                ...
+    """
+
+    async def run(self, dispatcher, tracker, domain):
+        # Database calls made on the pool thread are labelled with this action,
+        # and its log records with the action and the conversation
+        run_sync = log.bind_conversation(metrics.bind_action(self.run_sync, self.name()), tracker.sender_id)
+        return await run_blocking(run_sync, dispatcher, tracker, domain)
+
+    def run_sync(self, dispatcher, tracker, domain):
+        raise NotImplementedError("An action must implement run_sync")
@@ -0,0 +1,250 @@
+"""
+Busy-slot index over /jobs.
+
+Availability checks used to download all of /jobs and rescan it for every
+candidate handyman. The index maps (handyman_id, date) to the slots taken by
+Pending/In-Progress jobs, so each check is a dict lookup.
+
+There are two modes (JOBS_INDEX_MODE):
+
+- 'mirror': a TreeMirror of /jobs builds the index once and updates it from
+  the /jobs change feed, so jobs created or cancelled anywhere show up as
+  the database pushes them. This downloads all of /jobs at startup.
+- 'query' (the default): each handyman's entries are filled on first use with
+  a narrow query (see job_queries.py) and re-queried after JOBS_INDEX_TTL
+  seconds (60). No full download, so the payload stays flat as /jobs grows,
+  but this is a cache, not a change-feed index: a job created or cancelled
+  by another process (the app, the backend, another action server) can be
+  missed by is_busy(), busy_slots() and busy_slot_grid() for up to
+  JOBS_INDEX_TTL seconds. Candidate lists may be that stale; the last check
+  before a booking (is_busy_fresh() in booking_writes.book_slot) always
+  queries the database.
+
+Either way the booking actions write their own changes through, so a new
+booking is visible before the database echoes it back.
+scripts/check_busy_slot_index.py checks both modes against jobs written by
+another client.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from . import job_queries
+from .log import get_logger
+from .rtdb import TreeMirror
+
+log = get_logger(__name__)
+
+# Job statuses that occupy a handyman's slot
+BUSY_STATUSES = ("Pending", "In-Progress")
+
+
+def job_slot_key(job):
+    """
+    Return (handyman_id, date, slot) for a job that occupies a slot, else None.
+
+    Args:
+        job: Job record as stored under /jobs
+    """
+    if not isinstance(job, dict):
+        return None
+    handyman_id = job.get("assigned_to")
+    if not handyman_id or job.get("status") not in BUSY_STATUSES:
+        return None
+    job_timestamp = job.get("starttimestamp", "")
+    if not isinstance(job_timestamp, str) or "T" not in job_timestamp:
+        return None
+    try:
+        job_date = datetime.strptime(job_timestamp.split("T")[0], "%Y-%m-%d").date()
+    except ValueError as e:
+        log.warning("Error processing job timestamp: %s", e)
+        return None
+    return handyman_id, job_date, job.get("assigned_slot")
+
+
+class BusySlotIndex:
+    """
+    (handyman_id, date) -> set of busy slots.
+
+    Args:
+        mirror: TreeMirror of /jobs to follow; None loads per handyman with queries
+        ttl: Seconds a queried handyman window is trusted before it is re-queried
+    """
+
+    def __init__(self, mirror=None, ttl=60):
+        self._lock = threading.RLock()
+        self._slots = {}       # (handyman_id, date) -> {slot: set(job_ids)}
+        self._job_keys = {}    # job_id -> (handyman_id, date, slot)
+        self._handyman_jobs = {}  # handyman_id -> set(job_ids)
+        self._windows = {}     # handyman_id -> [(start_day or None, loaded_at)]
+        self._mirror = mirror
+        self.ttl = ttl
+        if mirror is not None:
+            mirror.subscribe(self._on_job_changed)
+
+    def _sync(self, handyman_id, day):
+        if self._mirror is not None:
+            # Loads the mirror on first use (or refreshes it when polling)
+            self._mirror.records()
+        elif not self._covered(handyman_id, day):
+            self._load_window(handyman_id, day)
+
+    def _covered(self, handyman_id, day):
+        now = time.monotonic()
+        with self._lock:
+            for start_day, loaded_at in self._windows.get(handyman_id, ()):
+                if now - loaded_at > self.ttl:
+                    continue
+                if start_day is None or start_day <= day < start_day + timedelta(days=job_queries.SCHEDULE_DAYS):
+                    return True
+        return False
+
+    def _load_window(self, handyman_id, day):
+        # Schedules start today, so align the window there when it covers day
+        today = datetime.today().date()
+        start_day = today if today <= day < today + timedelta(days=job_queries.SCHEDULE_DAYS) else day
+        jobs, covers_all = job_queries.jobs_for_handyman(handyman_id, start_day)
+        window_start = None if covers_all else start_day
+
+        with self._lock:
+            # Forget indexed jobs of this window that the query no longer returns
+            for job_id in list(self._handyman_jobs.get(handyman_id, ())):
+                key = self._job_keys[job_id]
+                if job_id in jobs:
+                    continue
+                if window_start is None or window_start <= key[1] < window_start + timedelta(days=job_queries.SCHEDULE_DAYS):
+                    self._apply(job_id, None)
+            for job_id, job in jobs.items():
+                self._apply(job_id, job_slot_key(job))
+
+            now = time.monotonic()
+            windows = [w for w in self._windows.get(handyman_id, ()) if now - w[1] <= self.ttl and w[0] != window_start]
+            windows.append((window_start, now))
+            self._windows[handyman_id] = windows
+
+    def busy_slots(self, handyman_id, day):
+        """Return the set of slots booked for handyman_id on day (a date)"""
+        self._sync(handyman_id, day)
+        with self._lock:
+            return set(self._slots.get((handyman_id, day), ()))
+
+    def is_busy(self, handyman_id, day, slot):
+        """O(1) check whether handyman_id already has a job at (day, slot)"""
+        self._sync(handyman_id, day)
+        with self._lock:
+            return slot in self._slots.get((handyman_id, day), ())
+
+    def is_busy_fresh(self, handyman_id, day, slot):
+        """
+        is_busy() answered from a fresh query, for the last check before a booking.
+
+        Jobs created by the app, the backend or another action server take no
+        slot lock, and the cached entries can be up to ttl seconds old, so the
+        cache alone could miss a job created moments ago.
+        """
+        if self._mirror is None:
+            # Re-query the handyman's window even if it is still covered
+            self._load_window(handyman_id, day)
+            with self._lock:
+                return slot in self._slots.get((handyman_id, day), ())
+        jobs, _ = job_queries.jobs_for_handyman(handyman_id, day, days=1)
+        return any(job_slot_key(job) == (handyman_id, day, slot) for job in jobs.values())
+
+    def busy_slot_grid(self, handyman_ids, days):
+        """
+        Busy slots of many handymen over many days, for bulk availability checks.
+
+        Args:
+            handyman_ids: Handymen to look up
+            days: Dates to look up (ascending)
+
+        Returns:
+            list: One row per handyman holding one tuple of busy slots per day
+        """
+        if self._mirror is not None:
+            self._mirror.records()
+        else:
+            # One query per handyman loads a whole window of days; the rest are covered
+            for handyman_id in handyman_ids:
+                for day in days:
+                    self._sync(handyman_id, day)
+        with self._lock:
+            slots = self._slots
+            return [[tuple(slots.get((handyman_id, day), ())) for day in days] for handyman_id in handyman_ids]
+
+    def record_job(self, job_id, job):
+        """Write-through for a job created or changed by this process"""
+        with self._lock:
+            self._apply(job_id, job_slot_key(job))
+
+    def release_job(self, job_id):
+        """Write-through for a job cancelled by this process"""
+        with self._lock:
+            self._apply(job_id, None)
+
+    def _on_job_changed(self, job_id, old_job, new_job):
+        with self._lock:
+            self._apply(job_id, job_slot_key(new_job))
+
+    def _apply(self, job_id, key):
+        old_key = self._job_keys.get(job_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            handyman_id, day, slot = old_key
+            day_slots = self._slots.get((handyman_id, day), {})
+            jobs = day_slots.get(slot)
+            if jobs is not None:
+                jobs.discard(job_id)
+                if not jobs:
+                    del day_slots[slot]
+            if not day_slots:
+                self._slots.pop((handyman_id, day), None)
+            del self._job_keys[job_id]
+            handyman_jobs = self._handyman_jobs[handyman_id]
+            handyman_jobs.discard(job_id)
+            if not handyman_jobs:
+                del self._handyman_jobs[handyman_id]
+        if key is not None:
+            handyman_id, day, slot = key
+            self._slots.setdefault((handyman_id, day), {}).setdefault(slot, set()).add(job_id)
+            self._job_keys[job_id] = key
+            self._handyman_jobs.setdefault(handyman_id, set()).add(job_id)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_busy_slot_index():
+    """
+    Return the shared BusySlotIndex, creating it on first use.
+
+    JOBS_INDEX_MODE=mirror follows all of /jobs (with the handyman directory's
+    HANDYMAN_CACHE_MODE/HANDYMAN_CACHE_TTL settings); the default 'query' mode
+    loads each handyman with a narrow query and keeps it for JOBS_INDEX_TTL
+    seconds, which is how stale it can be for jobs written by other processes.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                mirror = None
+                if os.environ.get('JOBS_INDEX_MODE', 'query') == 'mirror':
+                    mirror = TreeMirror(
+                        '/jobs',
+                        ttl=float(os.environ.get('HANDYMAN_CACHE_TTL', 30)),
+                        use_listener=os.environ.get('HANDYMAN_CACHE_MODE', 'listen') != 'poll',
+                    )
+                _index = BusySlotIndex(mirror, ttl=float(os.environ.get('JOBS_INDEX_TTL', 60)))
+    return _index
+
+
+def reset_busy_slot_index(index=None):
+    """Replace the shared index (closing the old mirror), e.g. after switching backends"""
+    global _index
+    with _index_lock:
+        if _index is not None and _index._mirror is not None:
+            _index._mirror.close()
+        _index = index
@@ -0,0 +1,107 @@
+"""
+Narrow /jobs queries for availability checks.
+
+Instead of downloading the whole /jobs table, availability reads only the
+jobs of one handyman, either by the 'assigned_to' child or by the composite
+'assigned_to_date' key ("<handyman_id>_<YYYY-MM-DD>") written at booking time,
+limited to the date window the schedule code looks at.
+
+Both need an index in the database rules. Server/database.indexes.json lists
+the .indexOn entries:
+
+    "jobs": {".indexOn": ["assigned_to", "assigned_to_date", ...]}
+
+It is not wired into firebase.json, because deploying a file there replaces
+the production rules as a whole. Merge the entries into the rules that are
+deployed (Firebase console > Realtime Database > Rules) by hand. The
+REST API rejects a query on a child without an index, so when a query fails
+jobs_for_handyman() logs it and reads all of /jobs instead (as availability
+did before these queries), trying the query again after QUERY_RETRY_SECONDS.
+
+JOBS_QUERY_INDEX selects the query. 'assigned_to' (the default) works for
+every job. 'assigned_to_date' keeps the payload to the requested window, but
+only sees jobs that carry the key - run scripts/backfill_assigned_to_date.py
+and make sure every writer sets it before switching.
+"""
+import os
+import time
+from datetime import timedelta
+
+from . import rtdb
+from .log import get_logger
+
+log = get_logger(__name__)
+
+# The schedule code looks at today plus the next six days
+SCHEDULE_DAYS = 7
+
+# After a failed query (e.g. no index in the rules), read all of /jobs for this long
+QUERY_RETRY_SECONDS = 300
+
+_query_failed_at = None
+
+
+def assigned_to_date_key(handyman_id, day):
+    """Composite key stored on each job, e.g. 'abc123_2025-05-29'"""
+    return f"{handyman_id}_{day.strftime('%Y-%m-%d')}"
+
+
+def job_assigned_to_date(job):
+    """Return the composite key a job should carry, or None if it can't have one"""
+    handyman_id = job.get("assigned_to")
+    job_timestamp = job.get("starttimestamp")
+    if not handyman_id or not isinstance(job_timestamp, str) or "T" not in job_timestamp:
+        return None
+    return f"{handyman_id}_{job_timestamp.split('T')[0]}"
+
+
+def query_index():
+    return os.environ.get("JOBS_QUERY_INDEX", "assigned_to")
+
+
+def jobs_assigned_to(handyman_id):
+    """All jobs of one handyman, via order_by_child('assigned_to').equal_to(id)"""
+    return rtdb.reference('/jobs').order_by_child('assigned_to').equal_to(handyman_id).get() or {}
+
+
+def jobs_in_window(handyman_id, start_day, days=SCHEDULE_DAYS):
+    """Jobs of one handyman starting in [start_day, start_day + days), via 'assigned_to_date'"""
+    end_day = start_day + timedelta(days=days - 1)
+    query = rtdb.reference('/jobs').order_by_child('assigned_to_date')
+    query = query.start_at(assigned_to_date_key(handyman_id, start_day))
+    query = query.end_at(assigned_to_date_key(handyman_id, end_day))
+    return query.get() or {}
+
+
+def jobs_from_full_read(handyman_id):
+    """All jobs of one handyman, filtered from a read of the whole /jobs table"""
+    jobs = rtdb.reference('/jobs').get() or {}
+    return {job_id: job for job_id, job in jobs.items()
+            if isinstance(job, dict) and job.get("assigned_to") == handyman_id}
+
+
+def jobs_for_handyman(handyman_id, start_day, days=SCHEDULE_DAYS):
+    """
+    Fetch the jobs availability needs for one handyman.
+
+    Args:
+        handyman_id: ID of the handyman
+        start_day: First date of the window (datetime.date)
+        days: Length of the window in days
+
+    Returns:
+        tuple: (jobs, covers_all_dates) - {job_id: job} and whether the result
+        holds every date of the handyman (True for the 'assigned_to' query
+        and the full read)
+    """
+    global _query_failed_at
+    if _query_failed_at is None or time.monotonic() - _query_failed_at > QUERY_RETRY_SECONDS:
+        try:
+            if query_index() == "assigned_to_date":
+                return jobs_in_window(handyman_id, start_day, days), False
+            return jobs_assigned_to(handyman_id), True
+        except Exception as e:
+            _query_failed_at = time.monotonic()
+            log.warning("Query on /jobs by %s failed (are the database.indexes.json indexes in the rules?), "
+                        "reading all of /jobs for %ss: %s", query_index(), QUERY_RETRY_SECONDS, e)
+    return jobs_from_full_read(handyman_id), True
@@ -0,0 +1,320 @@
+"""
+Structured, leveled logging for the action server.
+
+The actions used to print() every step, including one line per handyman
+considered, straight to stdout from the pool threads. Modules now log through
+get_logger(__name__):
+
+    log = get_logger(__name__)
+    log.debug("Handyman %s is busy on %s for %s", handyman_id, day, slot)
+    log.info("Booked %s", booking_id, handyman_id=handyman_id, slot=slot)
+
+- Formatting is lazy: arguments are only formatted if the record is emitted.
+  Keyword arguments become fields of the JSON record.
+- Records go through a QueueHandler; a QueueListener thread hands them to
+  the handlers they would reach by propagating to the root logger, so
+  logging never blocks an action on I/O and the server's logging setup
+  (rasa_sdk's --loglevel, --log-file, --logging-config-file) applies to the
+  actions too. Those handlers see the conversation and fields appended to
+  the message; a logging config can use JsonFormatter to get them as JSON.
+- When nothing has configured logging (scripts, benchmarks) the listener
+  writes to stdout itself, formatted as LOG_FORMAT says.
+- Each record carries the conversation (sender_id) and action it was logged
+  for (see metrics.py for how the action travels to pool threads), and the
+  file and line it was logged from.
+
+Settings come from the environment:
+
+    LOG_LEVEL      level of the actions package (default: inherited, i.e. --loglevel)
+    LOG_LEVELS     per-module levels, e.g. "actions.actions=DEBUG,actions.rtdb=WARNING"
+    LOG_FORMAT     "json" (default) or "text", when the actions write to stdout themselves
+    DEBUG_SENDERS  comma-separated sender IDs whose conversations log at DEBUG
+
+Debug output for one conversation can also be switched on at runtime with
+enable_conversation_debug(sender_id).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+
+from . import metrics
+
+PACKAGE_LOGGER = "actions"
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+_extra_handlers = []
+
+_debug_senders = {s.strip() for s in os.environ.get('DEBUG_SENDERS', '').split(',') if s.strip()}
+_context = threading.local()
+
+
+# Conversation context, per thread
+
+def current_sender():
+    """sender_id of the conversation the calling thread works for, or None"""
+    return getattr(_context, "sender_id", None)
+
+
+@contextmanager
+def conversation_context(sender_id):
+    """Attribute the records logged by this thread in the with-block to sender_id"""
+    previous = getattr(_context, "sender_id", None)
+    _context.sender_id = sender_id
+    try:
+        yield
+    finally:
+        _context.sender_id = previous
+
+
+def bind_conversation(func, sender_id=None):
+    """Wrap func so it runs in sender_id's context (default: the caller's conversation)"""
+    sender_id = sender_id or current_sender()
+    if sender_id is None:
+        return func
+
+    def bound(*args, **kwargs):
+        with conversation_context(sender_id):
+            return func(*args, **kwargs)
+    return bound
+
+
+def enable_conversation_debug(sender_id, enabled=True):
+    """Log everything at DEBUG for one conversation (or stop doing so)"""
+    if enabled:
+        _debug_senders.add(sender_id)
+    else:
+        _debug_senders.discard(sender_id)
+
+
+def conversation_debug():
+    """True if the calling thread's conversation has debug logging on"""
+    return bool(_debug_senders) and current_sender() in _debug_senders
+
+
+# Formatting
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, source line, conversation, action and fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "src": f"{record.filename}:{record.lineno}",
+        }
+        if getattr(record, "sender_id", None):
+            entry["sender_id"] = record.sender_id
+        if getattr(record, "action", None):
+            entry["action"] = record.action
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def _context_suffix(record):
+    """" [sender=... key=value ...]" for the conversation and fields of a record, or "" """
+    context = [f"{key}={value}" for key, value in (getattr(record, "fields", None) or {}).items()]
+    if getattr(record, "sender_id", None):
+        context.insert(0, f"sender={record.sender_id}")
+    return f" [{' '.join(context)}]" if context else ""
+
+
+class TextFormatter(logging.Formatter):
+    """Readable single lines for local runs"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s %(message)s")
+
+    def format(self, record):
+        return super().format(record) + _context_suffix(record)
+
+
+def parse_levels(spec):
+    """{logger name: level} from "name=LEVEL,name=LEVEL" """
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class _Propagate(logging.Handler):
+    """
+    Listener-side handler: pass records on as propagation would have.
+
+    Records go to the handlers of the package logger's ancestors (the root
+    logger's, as the server set them up), looked up for every record so a
+    setup made after the actions were imported applies, and without any to
+    the fallback handler. Handlers given to add_handler() get them as well.
+    """
+
+    def __init__(self, fallback):
+        super().__init__()
+        self.fallback = fallback
+
+    def handle(self, record):
+        handlers = []
+        logger = logging.getLogger(PACKAGE_LOGGER).parent
+        while logger is not None:
+            handlers.extend(logger.handlers)
+            if not logger.propagate:
+                break
+            logger = logger.parent
+        handlers = (handlers or [self.fallback]) + _extra_handlers
+        plain = None
+        for handler in handlers:
+            if record.levelno < handler.level:
+                continue
+            if isinstance(handler.formatter, (JsonFormatter, TextFormatter)):
+                handler.handle(record)
+                continue
+            if plain is None:
+                # Other formatters only show the message: put the context in it
+                plain = logging.makeLogRecord(record.__dict__)
+                plain.msg = record.getMessage() + _context_suffix(record)
+                plain.args = None
+            handler.handle(plain)
+
+
+def add_handler(handler):
+    """Also hand the actions' records to handler (e.g. the server's --log-file handler)"""
+    if handler not in _extra_handlers:
+        _extra_handlers.append(handler)
+
+
+def configure(stream=None, force=False):
+    """
+    Set up the queue-backed handler on the actions package logger (once).
+
+    Args:
+        stream: Where records are written when no handler is configured (default sys.stdout)
+        force: Replace an earlier configuration
+    """
+    global _configured, _listener
+    with _configure_lock:
+        if _configured and not force:
+            return
+        if _listener is not None:
+            _listener.stop()
+
+        fallback = logging.StreamHandler(stream or sys.stdout)
+        fallback.setFormatter(TextFormatter() if os.environ.get('LOG_FORMAT') == 'text' else JsonFormatter())
+        records = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(records, _Propagate(fallback), respect_handler_level=False)
+        _listener.start()
+
+        package_logger = logging.getLogger(PACKAGE_LOGGER)
+        for old in list(package_logger.handlers):
+            if isinstance(old, logging.handlers.QueueHandler):
+                package_logger.removeHandler(old)
+        package_logger.addHandler(_QueueHandler(records))
+        # The listener propagates the records itself, off the action's thread
+        package_logger.propagate = False
+        if os.environ.get('LOG_LEVEL'):
+            package_logger.setLevel(os.environ['LOG_LEVEL'].upper())
+        for name, level in parse_levels(os.environ.get('LOG_LEVELS')).items():
+            logging.getLogger(name).setLevel(level)
+        _configured = True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Render the message now (its arguments may change once we return); the
+        # JSON record is built and written on the listener thread
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def flush():
+    """Write out every queued record (stops and restarts the listener thread)"""
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def stop():
+    """
+    Write out the queued records and stop the listener thread.
+
+    Records logged afterwards wait in the queue until configure(force=True)
+    (e.g. in a forked worker, which doesn't inherit the thread).
+    """
+    global _configured, _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        _configured = False
+
+
+@atexit.register
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+class ConversationLogger:
+    """
+    Logger whose records carry the conversation and action, with keyword fields.
+
+    A DEBUG call is dropped cheaply unless the module logs at DEBUG or the
+    current conversation has debug logging switched on.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._logger = logging.getLogger(name)
+
+    def isEnabledFor(self, level):
+        return self._logger.isEnabledFor(level) or conversation_debug()
+
+    def _log(self, level, msg, args, exc_info=None, fields=None):
+        if not self._logger.isEnabledFor(level) and not conversation_debug():
+            return
+        if exc_info and not isinstance(exc_info, (tuple, BaseException)):
+            exc_info = sys.exc_info()
+        action = metrics.current_action()
+        # Skip this method and the debug()/info()/... wrapper
+        filename, lineno, func, _ = self._logger.findCaller(stacklevel=3)
+        record = self._logger.makeRecord(
+            self.name, level, filename, lineno, msg, args, exc_info, func=func,
+            extra={"sender_id": current_sender(), "action": action if action != metrics.NO_ACTION else None,
+                   "fields": fields},
+        )
+        # handle() skips the level check, so conversation debug records get through
+        self._logger.handle(record)
+
+    def debug(self, msg, *args, exc_info=None, **fields):
+        self._log(logging.DEBUG, msg, args, exc_info, fields)
+
+    def info(self, msg, *args, exc_info=None, **fields):
+        self._log(logging.INFO, msg, args, exc_info, fields)
+
+    def warning(self, msg, *args, exc_info=None, **fields):
+        self._log(logging.WARNING, msg, args, exc_info, fields)
+
+    def error(self, msg, *args, exc_info=None, **fields):
+        self._log(logging.ERROR, msg, args, exc_info, fields)
+
+    def exception(self, msg, *args, **fields):
+        self._log(logging.ERROR, msg, args, True, fields)
+
+
+def get_logger(name):
+    """Return a ConversationLogger for a module (configures logging on first use)"""
+    configure()
+    return ConversationLogger(name)
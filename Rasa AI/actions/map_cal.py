@@ -1,21 +1,27 @@
-import pandas as pd
-from math import radians, cos, sin, asin, sqrt
+import csv
+import hashlib
+import mmap
 import os
+import struct
+import sys
+import threading
+from collections.abc import Mapping
+from math import radians, cos, sin, asin, sqrt
+
+from .log import get_logger
+
+log = get_logger(__name__)
 
 # Get the directory where this script is located
 script_dir = os.path.dirname(os.path.abspath(__file__))
 # Build path to CSV file
 csv_path = os.path.join(script_dir, "datamap", "daerah-working-set.csv")
+# Compiled graph, built from the CSV by `python -m actions.map_cal --build`
+# (or on first use when it is missing or the CSV changed)
+artifact_path = os.environ.get('CITY_GRAPH_PATH', os.path.join(script_dir, "datamap", "city_graph.bin"))
 
-# Load CSV file using absolute path
-df = pd.read_csv(csv_path, encoding='latin1')
-
-# Convert 'Lat' and 'Lon' columns to float
-df['Lat'] = pd.to_numeric(df['Lat'], errors='coerce')
-df['Lon'] = pd.to_numeric(df['Lon'], errors='coerce')
-
-# Drop any rows with NaN values in Lat or Lon
-df = df.dropna(subset=['Lat', 'Lon'])
+EARTH_RADIUS_KM = 6371
+radius_km = 50  # Define your radius for 'nearby'
 
 def haversine(lat1, lon1, lat2, lon2):
     # Ensure all inputs are float
@@ -31,57 +37,368 @@ def haversine(lat1, lon1, lat2, lon2):
     km = 6371 * c
     return km
 
-# Build graph
-city_graph = {}
-radius_km = 50  # Define your radius for 'nearby'
+def read_towns(path=csv_path):
+    """
+    Read the Town/Lat/Lon columns of a town CSV.
+
+    Rows without a town name or with a Lat/Lon that isn't a number are skipped.
+
+    Returns:
+        tuple: (towns, lats, lons) as lists
+    """
+    towns, lats, lons = [], [], []
+    with open(path, newline='', encoding='latin1') as f:
+        for row in csv.DictReader(f):
+            try:
+                lat, lon = float(row['Lat']), float(row['Lon'])
+            except (TypeError, ValueError):
+                continue
+            if lat != lat or lon != lon or not row.get('Town'):
+                continue  # NaN or no name
+            towns.append(row['Town'])
+            lats.append(lat)
+            lons.append(lon)
+    return towns, lats, lons
+
+def pairwise_haversine(lats1, lons1, lats2, lons2):
+    """
+    Vectorized haversine between every point of set 1 and every point of set 2.
+
+    Args:
+        lats1, lons1: Arrays of n latitudes/longitudes in degrees
+        lats2, lons2: Arrays of m latitudes/longitudes in degrees
+
+    Returns:
+        numpy.ndarray: (n, m) matrix of distances in km
+    """
+    import numpy as np
+
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=np.float64))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def build_neighbour_arrays(lats, lons, radius_km=50, block_size=1024):
+    """
+    Find every pair of points within radius_km of each other.
+
+    Points are sorted by latitude so each block of rows is only compared with
+    the latitude band that can be within radius_km, and the distance matrix is
+    computed one block at a time to bound memory.
+
+    Args:
+        lats, lons: Arrays of latitudes/longitudes in degrees
+        radius_km: Neighbour radius
+        block_size: Rows per distance block
+
+    Returns:
+        tuple: (indptr, indices, distances) in CSR form - the neighbours of
+        point i are indices[indptr[i]:indptr[i+1]] (ascending, excluding i
+        itself) with distances in km at the same positions
+    """
+    import numpy as np
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+
+    order = np.argsort(lats, kind="stable")
+    sorted_lats = lats[order]
+    sorted_lons = lons[order]
+    # Degrees of latitude that can still be within radius_km (plus some slack)
+    lat_margin = np.degrees(radius_km / EARTH_RADIUS_KM) + 1e-6
+
+    rows, cols, dists = [], [], []
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        lo = np.searchsorted(sorted_lats, sorted_lats[start] - lat_margin, side="left")
+        hi = np.searchsorted(sorted_lats, sorted_lats[stop - 1] + lat_margin, side="right")
+        block = pairwise_haversine(sorted_lats[start:stop], sorted_lons[start:stop],
+                                   sorted_lats[lo:hi], sorted_lons[lo:hi])
+        r, c = np.nonzero(block <= radius_km)
+        keep = (r + start) != (c + lo)
+        r, c = r[keep], c[keep]
+        rows.append(order[r + start].astype(np.int32))
+        cols.append(order[c + lo].astype(np.int32))
+        dists.append(block[r, c])
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int32)
+    dists = np.concatenate(dists) if dists else np.empty(0, dtype=np.float64)
+
+    # Group by source point, neighbours in ascending order
+    sort = np.lexsort((cols, rows))
+    rows, cols, dists = rows[sort], cols[sort], dists[sort]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols, dists
+
+def build_city_graph(towns, lats, lons, radius_km=50):
+    """
+    Build {town: {nearby_town: distance_km}} for towns within radius_km.
+
+    Town names are lower-cased and distances rounded to 2 decimals. When a
+    name appears more than once, the last row wins, as in the original
+    row-by-row build.
+    """
+    towns = [str(t).lower() for t in towns]
+    indptr, indices, distances = build_neighbour_arrays(lats, lons, radius_km)
+    distances = [round(d, 2) for d in distances.tolist()]
+    indices = indices.tolist()
+
+    graph = {}
+    for i, city in enumerate(towns):
+        graph[city] = {towns[j]: d for j, d in zip(indices[indptr[i]:indptr[i + 1]], distances[indptr[i]:indptr[i + 1]])}
+    return graph
+
+# Compiled graph artifact
+#
+# Layout (little-endian), each array starting on an 8-byte boundary:
+#   header     magic, format version, sha256 of the CSV, radius, town count,
+#              link count, length of the name block
+#   names      town names joined by '\n', in first-seen CSV order (town id = position)
+#   by_name    int32[towns]      town ids sorted by name
+#   indptr     int64[towns + 1]  CSR row pointers
+#   indices    int32[links]      neighbour town ids
+#   distances  float32[links]    km (rounded to 2 decimals when read back)
+
+ARTIFACT_MAGIC = b"CITYGRPH"
+ARTIFACT_VERSION = 1
+_HEADER = struct.Struct("<8sI32sdIQQ")
+
+def csv_sha256(path=csv_path):
+    """SHA-256 of the town CSV, recorded in the artifact to detect changes"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _build_arrays(towns, lats, lons, radius_km):
+    """
+    Compile towns into (names, by_name, indptr, indices, distances) arrays.
+
+    Gives the same graph as build_city_graph: a repeated name takes the
+    neighbours of its last row, and a repeated neighbour keeps its first
+    position and its last distance.
+    """
+    import numpy as np
 
-# Print some debug info about the data
-print(f"Building city graph with {len(df)} cities")
-
-for i, row in df.iterrows():
-    city = row['Town'].lower()  # Convert to lowercase for consistency
-    lat1 = row['Lat']
-    lon1 = row['Lon']
-    city_graph[city] = {}
-
-    for j, other in df.iterrows():
-        if i == j:
-            continue
-        other_city = other['Town'].lower()
-        lat2 = other['Lat']
-        lon2 = other['Lon']
-        try:
-            distance = haversine(lat1, lon1, lat2, lon2)
-            if distance <= radius_km:
-                city_graph[city][other_city] = round(distance, 2)
-                # Debug for specific cities of interest
-                if (city == 'petaling jaya' and other_city == 'mont kiara') or \
-                   (city == 'mont kiara' and other_city == 'petaling jaya') or \
-                   (city == 'petaling jaya' and other_city == 'shah alam') or \
-                   (city == 'shah alam' and other_city == 'petaling jaya'):
-                    print(f"Distance from {city} to {other_city}: {round(distance, 2)} km")
-        except (ValueError, TypeError) as e:
-            print(f"Error calculating distance: {e}, skipping {city} to {other_city}")
-
-# Print counts of nearby cities for key locations
-for city in ['petaling jaya', 'mont kiara', 'shah alam']:
-    if city in city_graph:
-        print(f"{city.title()} has {len(city_graph[city])} nearby cities within {radius_km} km")
-        
+    row_names = [str(t).lower() for t in towns]
+    ids = {}
+    for name in row_names:
+        ids.setdefault(name, len(ids))
+    names = list(ids)
+    row_ids = np.array([ids[name] for name in row_names], dtype=np.int32)
+
+    indptr, indices, distances = build_neighbour_arrays(lats, lons, radius_km)
+    if len(names) != len(row_names):
+        # Only the last row of each name keeps its neighbours
+        last_row = np.zeros(len(names), dtype=np.int64)
+        last_row[row_ids] = np.arange(len(row_names))  # later rows overwrite earlier ones
+        sources = np.repeat(np.arange(len(row_names)), np.diff(indptr))
+        keep = last_row[row_ids[sources]] == sources
+        src = row_ids[sources[keep]]
+        dst = row_ids[indices[keep]]
+        col = indices[keep]
+        dist = distances[keep]
+        # Collapse repeated (town, neighbour) pairs: first position, last distance
+        order = np.lexsort((col, dst, src))
+        src, dst, col, dist = src[order], dst[order], col[order], dist[order]
+        first = np.ones(len(src), dtype=bool)
+        first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        starts = np.flatnonzero(first)
+        ends = np.append(starts[1:], len(src)) - 1
+        src, dst, col, dist = src[starts], dst[starts], col[starts], dist[ends]
+        order = np.lexsort((col, src))
+        src, indices, distances = src[order], dst[order], dist[order]
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(names)), out=indptr[1:])
+
+    # Round like the dict graph before narrowing to float32
+    rounded = np.empty(len(distances), dtype=np.float32)
+    for start in range(0, len(distances), 1 << 20):
+        chunk = distances[start:start + (1 << 20)].tolist()
+        rounded[start:start + len(chunk)] = [round(d, 2) for d in chunk]
+
+    by_name = np.array(sorted(range(len(names)), key=names.__getitem__), dtype=np.int32)
+    return names, by_name, indptr, indices, rounded
+
+def build_artifact(source_path=csv_path, target_path=artifact_path, radius_km=radius_km):
+    """
+    Compile the town CSV into the binary graph artifact.
+
+    The file is written under a temporary name and renamed into place, so
+    workers opening it at the same time never see a partial file.
+
+    Returns:
+        str: target_path
+    """
+    import numpy as np
+
+    digest = csv_sha256(source_path)
+    names, by_name, indptr, indices, distances = _build_arrays(*read_towns(source_path), radius_km)
+    name_block = "\n".join(names).encode("utf-8")
+
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_VERSION, digest, float(radius_km),
+                             len(names), len(indices), len(name_block)))
+        f.write(name_block)
+        for array, dtype in ((by_name, '<i4'), (indptr, '<i8'), (indices, '<i4'), (distances, '<f4')):
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+    os.replace(tmp_path, target_path)
+    log.info("Built city graph with %s towns and %s links at %s", len(names), len(indices), target_path)
+    return target_path
+
+def _read_header(buffer):
+    magic, version, digest, radius, towns, links, name_length = _HEADER.unpack_from(buffer, 0)
+    if magic != ARTIFACT_MAGIC or version != ARTIFACT_VERSION:
+        return None
+    return digest, radius, towns, links, name_length
+
+def artifact_is_current(source_path=csv_path, target_path=artifact_path, radius_km=radius_km):
+    """True if target_path was compiled from the current CSV with radius_km"""
+    try:
+        with open(target_path, 'rb') as f:
+            header = _read_header(f.read(_HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return header is not None and header[0] == csv_sha256(source_path) and header[1] == radius_km
+
+class CityGraph(Mapping):
+    """
+    Read-only {town: {nearby_town: distance_km}} view over the compiled graph.
+
+    The artifact is memory-mapped, so worker processes share one copy of it
+    through the page cache. It is opened on first access, and compiled from
+    the CSV first if it is missing or the CSV has changed. Looking up a town
+    returns a new dict of its neighbours, in the same order as the old dict
+    graph.
+    """
+
+    def __init__(self, source_path=csv_path, path=artifact_path, radius_km=radius_km):
+        self.source_path = source_path
+        self.path = path
+        self.radius_km = radius_km
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _ensure(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if sys.byteorder != 'little':
+                raise RuntimeError("The city graph artifact needs a little-endian platform")
+            if not artifact_is_current(self.source_path, self.path, self.radius_km):
+                try:
+                    build_artifact(self.source_path, self.path, self.radius_km)
+                except OSError as e:
+                    # Read-only install: compile into a temporary file and keep it in memory
+                    log.warning("Could not write city graph to %s: %s", self.path, e)
+                    self._load_in_memory()
+                    return
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._attach(memoryview(self._mmap))
+
+    def _load_in_memory(self):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = build_artifact(self.source_path, os.path.join(tmp_dir, "city_graph.bin"), self.radius_km)
+            with open(tmp_path, 'rb') as f:
+                data = f.read()
+        self._attach(memoryview(data))
+
+    def _attach(self, buffer):
+        _, _, towns, links, name_length = _read_header(buffer)
+        offset = _HEADER.size
+        self._names = bytes(buffer[offset:offset + name_length]).decode("utf-8").split("\n") if towns else []
+        offset += name_length
+
+        def take(fmt, count):
+            nonlocal offset
+            offset = _align(offset)
+            size = struct.calcsize(fmt)
+            view = buffer[offset:offset + size * count].cast(fmt)
+            offset += size * count
+            return view
+
+        self._by_name = take('i', towns)
+        self._indptr = take('q', towns + 1)
+        self._indices = take('i', links)
+        self._distances = take('f', links)
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._loaded = True
+
+    def towns_sorted(self):
+        """Town names in alphabetical order"""
+        self._ensure()
+        return [self._names[i] for i in self._by_name]
+
+    def neighbours(self, town):
+        """Return [(nearby_town, distance_km)] for a lower-case town name, or [] if unknown"""
+        self._ensure()
+        i = self._ids.get(town)
+        if i is None:
+            return []
+        start, stop = self._indptr[i], self._indptr[i + 1]
+        names = self._names
+        return [(names[j], round(d, 2)) for j, d in zip(self._indices[start:stop], self._distances[start:stop])]
+
+    def __getitem__(self, town):
+        self._ensure()
+        if town not in self._ids:
+            raise KeyError(town)
+        return dict(self.neighbours(town))
+
+    def __contains__(self, town):
+        self._ensure()
+        return town in self._ids
+
+    def __iter__(self):
+        self._ensure()
+        return iter(self._names)
+
+    def __len__(self):
+        self._ensure()
+        return len(self._names)
 
 # Now city_graph is ready to be used in your Rasa action
+city_graph = CityGraph()
 
 def get_nearby_cities(city_name, max_distance=50):
     """Get nearby cities within max_distance km"""
     city_name = city_name.lower()  # Convert to lowercase for consistency
     if city_name not in city_graph:
         return []
-    
+
     nearby = []
-    for other_city, distance in city_graph[city_name].items():
+    for other_city, distance in city_graph.neighbours(city_name):
         if distance <= max_distance:
             nearby.append((other_city, distance))
-    
+
     # Sort by distance
     nearby.sort(key=lambda x: x[1])
-    return nearby
\ No newline at end of file
+    return nearby
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile the town CSV into the city graph artifact")
+    parser.add_argument('--build', action='store_true', help="Rebuild the artifact if the CSV changed")
+    parser.add_argument('--force', action='store_true', help="Rebuild the artifact even if it is current")
+    args = parser.parse_args()
+
+    if args.force or (args.build and not artifact_is_current()):
+        print(f"Built city graph at {build_artifact()}")
+    elif artifact_is_current():
+        print(f"City graph at {artifact_path} is up to date")
+    else:
+        print(f"City graph at {artifact_path} is missing or out of date, run with --build")
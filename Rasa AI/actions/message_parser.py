@@ -0,0 +1,168 @@
+"""
+Parsing of free-text booking requests ("book a plumber tomorrow at 2pm, my sink leaks").
+
+ActionEasyBook used to rebuild its lists of date/time and booking-phrase
+patterns on every message and apply them one re.sub() at a time, then run
+separate searches for the date and the time. The patterns are now compiled
+once, each category into a single alternation, and parse_booking_message()
+returns everything the action needs in one call.
+
+The alternations reproduce the old pattern-by-pattern results:
+
+- the "at 3pm" / "on 29/5" patterns never matched (the bare time pattern had
+  already removed every digit), so they are left out
+- patterns whose matches an earlier pattern always removed first ("book an",
+  "book a handyman", "schedule an" after "book a" / "schedule a") are left
+  out, so "book an electrician" still leaves "n electrician"
+- "i need a handyman" comes before "i need a" in the alternation, so the
+  longer phrase still wins where both start
+- "please book" and "please schedule" are kept as the single pattern
+  'please bookplease schedule' they have always been (a missing comma)
+- phrases ending in "schedule" only match when not followed by " a",
+  because the old "schedule a" pass ran first and took those words away
+
+scripts/check_message_parser.py pins the outputs on the NLU examples.
+"""
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from .slot_schedule import DEFAULT_SCHEDULE, format_time
+
+# Dates, times and relative day words removed before classifying the problem.
+# Dates go before bare times, as before: "2 29/5 PM" loses the date first and
+# then "2  PM" as one time.
+DATE_REMOVAL_PATTERN = re.compile(r'\d{1,2}[/-]\d{1,2}')                        # 29/5 or 5-29
+TIME_REMOVAL_PATTERN = re.compile(r'\d{1,2}(?::\d{2})?\s*(?:am|pm)?', re.IGNORECASE)  # 3pm, 15:00
+RELATIVE_DAY_PATTERN = re.compile(r'tomorrow|today|next week|next month', re.IGNORECASE)
+
+# Booking phrases that aren't part of the problem description
+BOOKING_PHRASE_PATTERN = re.compile(
+    r'i want to book'
+    r'|i wanna book'
+    r'|i need to book'
+    r'|book a'
+    r'|schedule a'
+    r'|i want to schedule(?! a)'
+    r'|i need a handyman'
+    r'|i need a'
+    r'|please bookplease schedule(?! a)'
+    r'|book handyman',
+    re.IGNORECASE,
+)
+
+_SPACES = re.compile(r'\s+')
+
+# DD/MM (or MM/DD) anywhere in the message
+DATE_PATTERN = re.compile(r'(\d{1,2})[/-](\d{1,2})')
+
+# Explicit time with an AM/PM indicator (like 10:30am), preferred over 24-hour times
+AM_PM_TIME_PATTERN = re.compile(r'\b(\d{1,2})(?::(\d{2}))?\s*([aApP][mM])\b')
+CLOCK_TIME_PATTERN = re.compile(r'\b(\d{1,2}):(\d{2})\b')
+
+ParsedMessage = namedtuple("ParsedMessage", [
+    "problem_text",   # message without dates, times and booking phrases
+    "date",           # "YYYY-MM-DD"
+    "date_source",    # "message", "swapped" (read as MM/DD) or "default" (tomorrow)
+    "time",           # display time like "2:00 PM", or None
+    "hour",           # 24-hour hour of the time, or None
+    "minute",         # minute of the time, or None
+    "slot",           # slot of the schedule, e.g. "Slot 2"
+    "slot_defaulted", # True if no time fell within booking hours (the schedule's default slot)
+])
+
+
+def strip_problem_text(message):
+    """
+    Remove dates, times and booking phrases, leaving the problem description.
+
+    Args:
+        message: User message, e.g. "I want to book a plumber tomorrow, my sink leaks"
+
+    Returns:
+        str: e.g. "plumber , my sink leaks"
+    """
+    text = DATE_REMOVAL_PATTERN.sub('', message)
+    text = TIME_REMOVAL_PATTERN.sub('', text)
+    text = RELATIVE_DAY_PATTERN.sub('', text)
+    text = BOOKING_PHRASE_PATTERN.sub('', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def extract_date(message, now=None):
+    """
+    Return (date string, source) for the first DD/MM in message, else tomorrow.
+
+    Dates that don't exist as DD/MM are tried as MM/DD; the year is the current one.
+    """
+    now = now or datetime.now()
+    date_match = DATE_PATTERN.search(message)
+    if date_match:
+        day, month = int(date_match.group(1)), int(date_match.group(2))
+        try:
+            return datetime(now.year, month, day).strftime('%Y-%m-%d'), "message"
+        except ValueError:
+            # Try swapping day and month in case of different format
+            try:
+                return datetime(now.year, day, month).strftime('%Y-%m-%d'), "swapped"
+            except ValueError:
+                pass
+    return (now + timedelta(days=1)).strftime('%Y-%m-%d'), "default"
+
+
+def extract_time(message):
+    """
+    Return (hour, minute) in 24-hour time for the time in message, or None.
+
+    A time with AM/PM anywhere in the message wins over an HH:MM time.
+    """
+    time_match = AM_PM_TIME_PATTERN.search(message)
+    if time_match:
+        hour = int(time_match.group(1))
+        minute = int(time_match.group(2)) if time_match.group(2) else 0
+        am_pm = time_match.group(3).lower()
+        if am_pm == 'pm' and hour < 12:
+            hour += 12
+        elif am_pm == 'am' and hour == 12:
+            hour = 0
+        return hour, minute
+
+    time_match = CLOCK_TIME_PATTERN.search(message)
+    if time_match:
+        return int(time_match.group(1)), int(time_match.group(2))
+    return None
+
+
+def parse_booking_message(message, now=None, schedule=None):
+    """
+    Extract the problem, date, time and slot from a booking request.
+
+    Args:
+        message: User message as typed
+        now: Current time, for the year of DD/MM dates and the default date
+        schedule: SlotSchedule mapping times to slots (defaults to the built-in one)
+
+    Returns:
+        ParsedMessage
+    """
+    message = message or ""
+    schedule = schedule or DEFAULT_SCHEDULE
+    date, date_source = extract_date(message, now)
+
+    hour = minute = display_time = slot = None
+    parsed_time = extract_time(message)
+    if parsed_time:
+        hour, minute = parsed_time
+        display_time = format_time(hour, minute)
+        slot = schedule.slot_for_hour(hour)
+
+    return ParsedMessage(
+        problem_text=strip_problem_text(message),
+        date=date,
+        date_source=date_source,
+        time=display_time,
+        hour=hour,
+        minute=minute,
+        slot=slot or schedule.default,
+        slot_defaulted=slot is None,
+    )
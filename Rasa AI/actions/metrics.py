@@ -0,0 +1,267 @@
+"""
+Latency and payload metrics for the action server, in Prometheus text format.
+
+Recorded:
+
+    handygo_action_duration_seconds{action}                 every action run (server.py)
+    handygo_rtdb_duration_seconds{action, op, path}         every database call (rtdb.py)
+    handygo_rtdb_payload_bytes{action, path}                JSON size of sampled reads (off by default)
+    handygo_nlu_request_duration_seconds{outcome}           every call to the Rasa NLU server
+    handygo_nlu_classifications_total{source}               NLU answers by cache/server/error
+    handygo_user_profile_lookups_total{source}              user profiles by cache/database/coalesced
+
+Database calls are labelled with the action they ran for, so the share of an
+action's time spent on one path (e.g. /jobs in action_easy_book) can be read
+off the sums. The action is tracked per thread: ThreadedAction and TurnReads
+carry it to the pool threads that do the work. Paths are reduced to their
+shape (/users/{id}) to keep the number of series small.
+
+Measuring a payload means serializing it to JSON, which costs as much as a
+large read itself (all of /handymen or /jobs), so it is off unless
+METRICS_PAYLOAD_SIZES gives the share of reads to measure: 1 for every read,
+0.01 for one in a hundred.
+
+server.py exposes render() on /metrics next to the rasa_sdk webhook. The
+prometheus_client package isn't needed: this module keeps the few histograms
+itself.
+"""
+import bisect
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: 1 ms .. 30 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes: 100 B .. 100 MB
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+# Action label for work done outside any action (listeners, warm-up)
+NO_ACTION = "none"
+
+# Share of reads serialized to record their size (0: none)
+PAYLOAD_SAMPLE_RATE = float(os.environ.get('METRICS_PAYLOAD_SIZES', 0))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic count per label set.
+
+    Args:
+        name: Metric name
+        documentation: HELP text
+        labelnames: Names of the labels passed to inc()
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label set.
+
+    Args:
+        name: Metric name
+        documentation: HELP text
+        labelnames: Names of the labels passed to observe()
+        buckets: Upper bounds of the buckets, ascending (+Inf is added)
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds the with-block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """{label values: (count, sum)} for every series"""
+        with self._lock:
+            return {key: (sum(series[:-1]), series[-1]) for key, series in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in series_items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+ACTION_DURATION = Histogram(
+    "handygo_action_duration_seconds", "Time to run an action, including waiting for a pool thread",
+    ["action"])
+RTDB_DURATION = Histogram(
+    "handygo_rtdb_duration_seconds", "Time of a Realtime Database call", ["action", "op", "path"])
+RTDB_PAYLOAD = Histogram(
+    "handygo_rtdb_payload_bytes", "JSON size of a Realtime Database read", ["action", "path"],
+    buckets=SIZE_BUCKETS)
+NLU_DURATION = Histogram(
+    "handygo_nlu_request_duration_seconds", "Time of a request to the Rasa NLU server", ["outcome"])
+NLU_CLASSIFICATIONS = Counter(
+    "handygo_nlu_classifications_total", "Texts classified, by where the answer came from", ["source"])
+USER_PROFILE_LOOKUPS = Counter(
+    "handygo_user_profile_lookups_total", "User profiles looked up, by where they came from", ["source"])
+
+REGISTRY = [ACTION_DURATION, RTDB_DURATION, RTDB_PAYLOAD, NLU_DURATION, NLU_CLASSIFICATIONS, USER_PROFILE_LOOKUPS]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    """Forget every recorded value (for benchmarks)"""
+    for metric in REGISTRY:
+        metric.clear()
+
+
+# Current action, per thread
+
+_context = threading.local()
+
+
+def current_action():
+    """Name of the action the calling thread works for, or NO_ACTION"""
+    return getattr(_context, "action", None) or NO_ACTION
+
+
+@contextmanager
+def action_context(action_name):
+    """Attribute the work done by this thread in the with-block to action_name"""
+    previous = getattr(_context, "action", None)
+    _context.action = action_name
+    try:
+        yield
+    finally:
+        _context.action = previous
+
+
+def bind_action(func, action_name=None):
+    """
+    Wrap func so it runs in action_name's context (default: the caller's action).
+
+    Use it for work handed to another thread.
+    """
+    action_name = action_name or getattr(_context, "action", None)
+    if action_name is None:
+        return func
+
+    def bound(*args, **kwargs):
+        with action_context(action_name):
+            return func(*args, **kwargs)
+    return bound
+
+
+# Database paths
+
+def path_shape(path):
+    """
+    Path with its record keys replaced, e.g. /users/-ONx.../wallet -> /users/{id}/wallet.
+
+    The first segment names the tree and is kept; the second is always a record
+    key; deeper segments are kept if they look like field names (letters and
+    underscores only) and replaced otherwise.
+    """
+    segments = [s for s in str(path).split('/') if s]
+    if not segments:
+        return "/"
+    shaped = [segments[0]]
+    for i, segment in enumerate(segments[1:]):
+        if i > 0 and segment.replace('_', '').isalpha():
+            shaped.append(segment)
+        else:
+            shaped.append("{id}")
+    return "/" + "/".join(shaped)
+
+
+def payload_size(value):
+    """Bytes of value as JSON (0 when not serializable)"""
+    if value is None:
+        return 0
+    try:
+        return len(json.dumps(value, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return 0
+
+
+def observe_payload(value, action, path):
+    """Record the JSON size of a read for a PAYLOAD_SAMPLE_RATE share of the reads"""
+    if PAYLOAD_SAMPLE_RATE <= 0 or (PAYLOAD_SAMPLE_RATE < 1 and random.random() >= PAYLOAD_SAMPLE_RATE):
+        return
+    RTDB_PAYLOAD.observe(payload_size(value), action=action, path=path)
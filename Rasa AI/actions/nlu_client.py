@@ -0,0 +1,247 @@
+"""
+Client for the Rasa server's NLU parse endpoint.
+
+ActionEasyBook classifies the problem part of a message ("aircond not cold")
+through POST /model/parse on the Rasa server, while that same server is
+waiting for the action's reply. Each call used to open a new connection with
+no timeout, so a slow or stuck parse stalled the whole turn. The client keeps:
+
+- one keep-alive session with a connection pool, and strict timeouts
+- an LRU cache of results keyed on the text (with runs of whitespace
+  collapsed) and the fingerprint of the loaded model (from GET /status), so
+  a retrained model is never answered from the old model's cache. The server
+  always parses the text as it was written
+- request coalescing: concurrent parses of the same text share one request
+
+Settings come from the environment: RASA_NLU_URL (default
+http://localhost:5005), RASA_NLU_TOKEN (the server's --auth-token, if any),
+RASA_NLU_TIMEOUT (seconds to wait for a parse, default 3), NLU_CACHE_SIZE
+(default 2048) and NLU_COALESCE=0 to turn coalescing off.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from . import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_URL = "http://localhost:5005"
+
+# Result used when the server can't be reached or answers with an error
+UNKNOWN = ("unknown", 0)
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """
+    Fold text into the cache and coalescing key of NLUClient.classify().
+
+    Only whitespace is folded: "aircond  not cold " and "aircond not cold"
+    share a key, since the WhitespaceTokenizer in config.yml splits them into
+    the same tokens. Case and punctuation stay, because the RegexFeaturizer
+    is case-sensitive and the CountVectorsFeaturizers see punctuation, so
+    "Aircond not cold!" may parse differently.
+    """
+    return _SPACES.sub(" ", str(text or "")).strip()
+
+
+class NLUClient:
+    """
+    Cached, pooled access to /model/parse.
+
+    Args:
+        base_url: Rasa server URL (defaults to RASA_NLU_URL)
+        token: Auth token for the Rasa HTTP API, if it requires one
+        timeout: Seconds to wait for a parse response
+        connect_timeout: Seconds to wait for a connection
+        cache_size: Number of (model, text) results to keep; 0 disables the cache
+        fingerprint_ttl: Seconds before the loaded model's fingerprint is checked again
+        coalesce: Share one in-flight request between concurrent parses of the same text
+        pool_size: Maximum kept-alive connections to the server
+    """
+
+    def __init__(self, base_url=None, token=None, timeout=3.0, connect_timeout=1.0, cache_size=2048,
+                 fingerprint_ttl=60, coalesce=True, pool_size=32):
+        self.base_url = (base_url or os.environ.get("RASA_NLU_URL", DEFAULT_URL)).rstrip("/")
+        self.token = token
+        self.timeout = (connect_timeout, timeout)
+        self.cache_size = cache_size
+        self.fingerprint_ttl = fingerprint_ttl
+        self.coalesce = coalesce
+
+        # requests loads on first use of the client, not with the actions
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # (fingerprint, text) -> (intent, confidence)
+        self._inflight = {}           # (fingerprint, text) -> Future
+        self._fingerprint = None
+        self._fingerprint_checked = 0.0
+        self._fingerprint_lock = threading.Lock()
+
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _params(self):
+        return {"token": self.token} if self.token else None
+
+    def model_fingerprint(self):
+        """
+        Identify the model the server has loaded, or None if /status is unavailable.
+
+        Checked at most every fingerprint_ttl seconds.
+        """
+        if time.monotonic() - self._fingerprint_checked < self.fingerprint_ttl:
+            return self._fingerprint
+        with self._fingerprint_lock:
+            if time.monotonic() - self._fingerprint_checked < self.fingerprint_ttl:
+                return self._fingerprint
+            try:
+                response = self.session.get(f"{self.base_url}/status", params=self._params(), timeout=self.timeout)
+                response.raise_for_status()
+                status = response.json()
+                fingerprint = status.get("model_id") or status.get("model_file") or status.get("fingerprint")
+                self._fingerprint = str(fingerprint) if fingerprint else None
+            except Exception as e:
+                log.warning("Error reading Rasa model status: %s", e)
+                self._fingerprint = None
+            self._fingerprint_checked = time.monotonic()
+            return self._fingerprint
+
+    def _request(self, text):
+        self.requests += 1
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self.session.post(
+                f"{self.base_url}/model/parse",
+                json={"text": text},
+                params=self._params(),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            parsed_data = response.json()
+            result = parsed_data['intent']['name'], parsed_data['intent'].get('confidence', 0)
+            outcome = "ok"
+            return result
+        finally:
+            metrics.NLU_DURATION.observe(time.perf_counter() - start, outcome=outcome)
+
+    def classify(self, text):
+        """
+        Return (intent name, confidence) for text.
+
+        Args:
+            text: Text to classify
+
+        Returns:
+            tuple: (intent_name, confidence); ("unknown", 0) if the server failed
+        """
+        normalized = normalize_text(text)
+        fingerprint = self.model_fingerprint()
+        # Without a fingerprint a cached answer could belong to an older model
+        key = (fingerprint, normalized) if fingerprint and self.cache_size else None
+
+        leader = True
+        with self._lock:
+            if key is not None and key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                metrics.NLU_CLASSIFICATIONS.inc(source="cache")
+                return self._cache[key]
+            flight_key = (fingerprint, normalized)
+            future = self._inflight.get(flight_key) if self.coalesce else None
+            if future is not None:
+                leader = False
+                self.coalesced += 1
+            elif self.coalesce:
+                future = self._inflight[flight_key] = Future()
+
+        if not leader:
+            metrics.NLU_CLASSIFICATIONS.inc(source="coalesced")
+            return future.result()
+
+        try:
+            result = self._request(text)
+            metrics.NLU_CLASSIFICATIONS.inc(source="server")
+        except Exception as e:
+            log.error("Error calling Rasa NLU: %s", e)
+            self.errors += 1
+            metrics.NLU_CLASSIFICATIONS.inc(source="error")
+            result = UNKNOWN
+            key = None  # Don't remember failures
+
+        with self._lock:
+            if key is not None:
+                self._cache[key] = result
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            if self.coalesce:
+                self._inflight.pop(flight_key, None)
+        if future is not None:
+            future.set_result(result)
+        return result
+
+    def clear(self):
+        """Forget cached results and the model fingerprint"""
+        with self._lock:
+            self._cache.clear()
+        self._fingerprint_checked = 0.0
+
+    def stats(self):
+        """Counters for monitoring: requests sent, cache hits, coalesced waits, errors"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "cached": len(self._cache),
+                "fingerprint": self._fingerprint,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_nlu_client():
+    """Return the shared NLUClient, configured from the environment on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = NLUClient(
+                    token=os.environ.get("RASA_NLU_TOKEN") or None,
+                    timeout=float(os.environ.get("RASA_NLU_TIMEOUT", 3)),
+                    cache_size=int(os.environ.get("NLU_CACHE_SIZE", 2048)),
+                    coalesce=os.environ.get("NLU_COALESCE", "1") != "0",
+                    pool_size=int(os.environ.get("ACTION_THREADS", 32)),
+                )
+    return _client
+
+
+def reset_nlu_client(client=None):
+    """Replace the shared client (closing the old one), e.g. to point at another server"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = client
@@ -0,0 +1,198 @@
+"""
+Pre-forked multi-worker serving for the action server.
+
+One `python -m actions.server` process runs every action on one event loop
+and one GIL, so it uses a single core however many conversations are
+waiting. Sanic's own workers (ACTION_SERVER_SANIC_WORKERS) are started
+fresh, so each of them reads the handyman directory and builds the indexes
+again. In pre-fork mode the action server instead:
+
+1. imports the actions and loads everything they share in the parent:
+   the city graph (memory-mapped, see map_cal.py), the town resolver, the
+   handyman directory with its expertise and spatial indexes, the busy slot
+   index in mirror mode, and the booking configuration (warmup.warm_up())
+2. detaches the database mirrors, stops the log and pool threads, closes
+   the database connections and freezes the loaded objects out of the
+   garbage collector (prepare_fork())
+3. forks the workers. Each worker serves its own socket bound with
+   SO_REUSEPORT, so the kernel spreads connections over the workers (one
+   shared socket where SO_REUSEPORT is missing), and starts its own threads
+   and connections
+
+The workers share the parent's pages copy-on-write: a worker only gets a
+private copy of a page when it writes to it. Each mirror follows its node
+again on first use; the listener's first event only replaces the records
+that changed since the fork (see rtdb.TreeMirror.detach). Caches that fill
+per request (user profiles, NLU results, busy slots in query mode) and the
+metrics of /metrics are per worker.
+
+The parent supervises: a worker that dies is forked again from the same
+warm state, and SIGTERM/SIGINT stop all workers.
+
+    python -m actions.server --actions actions --port 5055 --prefork 4
+    ACTION_SERVER_PREFORK_WORKERS=4 python -m actions.server --actions actions --port 5055
+"""
+import gc
+import os
+import signal
+import socket
+import time
+
+from . import io_pool, rtdb
+from .log import configure as configure_logging
+from .log import get_logger
+from .log import stop as stop_logging
+from .warmup import warm_up
+
+log = get_logger(__name__)
+
+# A worker that exits sooner than this after starting is restarted after RESTART_DELAY
+MIN_UPTIME = 5.0
+RESTART_DELAY = 1.0
+
+
+def prepare_fork():
+    """Leave no threads, listeners or connections for the workers to inherit"""
+    detached = rtdb.detach_mirrors()
+    io_pool.shutdown_executor(wait=True)
+    rtdb.reset_connections()
+    log.info("Detached %s database mirrors before forking", detached)
+    stop_logging()
+    # Objects loaded so far live as long as the process: keep the collector
+    # from touching (and so copying) their pages in every worker
+    gc.collect()
+    gc.freeze()
+
+
+def reuse_port_available():
+    return hasattr(socket, "SO_REUSEPORT") and os.environ.get("ACTION_SERVER_REUSEPORT", "1") != "0"
+
+
+def bind_socket(host, port, reuse_port=False, backlog=100):
+    """Listening TCP socket on host:port, optionally with SO_REUSEPORT"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """
+    Forks and supervises the worker processes.
+
+    Args:
+        serve: Function run in each worker with its listening socket; it
+            serves until the worker is told to stop
+        workers: Number of worker processes
+        host: Address to listen on
+        port: Port to listen on
+        reuse_port: Give each worker its own SO_REUSEPORT socket (defaults
+            to reuse_port_available())
+    """
+
+    def __init__(self, serve, workers, host, port, reuse_port=None):
+        self.serve = serve
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port_available() if reuse_port is None else reuse_port
+        self.sock = None
+        self._children = {}     # pid -> (worker number, start time)
+        self._stopping = False
+
+    def run(self):
+        """Fork the workers and supervise them until SIGTERM or SIGINT"""
+        if self.reuse_port:
+            # Fail here, not in every worker, if the port is taken
+            bind_socket(self.host, self.port, reuse_port=True).close()
+        else:
+            self.sock = bind_socket(self.host, self.port)
+
+        prepare_fork()
+        for number in range(self.workers):
+            self._spawn(number)
+        configure_logging(force=True)
+        log.info("Serving on %s:%s with %s pre-forked workers (%s)", self.host, self.port, self.workers,
+                 "SO_REUSEPORT" if self.reuse_port else "shared socket")
+
+        signal.signal(signal.SIGTERM, self._on_stop_signal)
+        signal.signal(signal.SIGINT, self._on_stop_signal)
+        try:
+            self._supervise()
+        finally:
+            if self.sock is not None:
+                self.sock.close()
+            log.info("All workers stopped")
+
+    def stop(self, sig=signal.SIGTERM):
+        """Ask every worker to stop"""
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def _on_stop_signal(self, signum, frame):
+        self.stop(signal.SIGTERM)
+
+    def _supervise(self):
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            number, started = self._children.pop(pid, (None, 0))
+            if number is None or self._stopping:
+                continue
+            uptime = time.monotonic() - started
+            log.warning("Worker %s (pid %s) exited with status %s after %.0fs, starting it again",
+                        number, pid, os.waitstatus_to_exitcode(status), uptime)
+            if uptime < MIN_UPTIME:
+                time.sleep(RESTART_DELAY)
+            if not self._stopping:
+                self._spawn(number)
+
+    def _spawn(self, number):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = (number, time.monotonic())
+            return
+
+        # Worker: the other workers aren't its children
+        self._children = {}
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            os.environ["ACTION_SERVER_WORKER"] = str(number)
+            configure_logging(force=True)
+            sock = self.sock or bind_socket(self.host, self.port, reuse_port=True)
+            log.info("Worker %s started (pid %s)", number, os.getpid())
+            self.serve(sock)
+        except BaseException as e:
+            if not isinstance(e, (KeyboardInterrupt, SystemExit)):
+                log.exception("Worker %s failed: %s", number, e)
+                code = 1
+        finally:
+            stop_logging()
+            os._exit(code)
+
+
+def serve(serve_worker, workers, host, port):
+    """
+    Warm up, then serve with workers pre-forked processes.
+
+    Args:
+        serve_worker: Function run in each worker with its listening socket
+        workers: Number of worker processes
+        host: Address to listen on
+        port: Port to listen on
+    """
+    warm_up()
+    PreforkServer(serve_worker, workers, host, port).run()
@@ -0,0 +1,456 @@
+"""
+Realtime Database access shared by the action server.
+
+Every action goes through reference() instead of calling firebase_admin.db
+directly, so the whole server can be pointed at the in-memory stand-in in
+fake_rtdb.py for offline runs. TreeMirror keeps an in-process copy of one
+subtree current, either through a database listener or a TTL + ETag refresh.
+
+References are wrapped in TimedReference, which records the latency of every
+call and the size of every read in metrics.py.
+
+firebase_admin (with google-auth and cryptography) takes a few hundred ms to
+import, so it is only imported, and the app initialized, by the first call
+that needs the real database; the action server's background warm-up
+(warmup.py) makes that call before the first conversation does.
+"""
+import json
+import os
+import threading
+import time
+import weakref
+
+from . import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_backend = None
+_firebase_initialized = False
+_firebase_lock = threading.Lock()
+
+# Every TreeMirror, so they can be detached together before forking workers
+_mirrors = weakref.WeakSet()
+
+# Calls on a reference or query that go to the database
+TIMED_CALLS = {
+    "get", "get_if_changed", "set", "set_if_unchanged", "update", "push", "delete", "transaction",
+}
+# Query builders: the query they return is timed like a reference
+QUERY_BUILDERS = {
+    "order_by_child", "order_by_key", "order_by_value",
+    "start_at", "end_at", "equal_to", "limit_to_first", "limit_to_last",
+}
+
+
+def initialize_firebase():
+    """
+    Initialize firebase_admin with credentials based on environment.
+
+    This allows both local development (with service account file)
+    and production deployment (with environment variables). Only the first
+    call initializes the app.
+    """
+    global _firebase_initialized
+    with _firebase_lock:
+        if _firebase_initialized:
+            return
+        # Once, even if it fails: the error is logged and calls then fail on their own
+        _firebase_initialized = True
+        _initialize_app()
+
+
+def _initialize_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        # First try to use environment variables if they exist (for production)
+        if os.environ.get('FIREBASE_CONFIG'):
+            firebase_config = json.loads(os.environ.get('FIREBASE_CONFIG'))
+            cred = credentials.Certificate(firebase_config)
+            firebase_database_url = os.environ.get('FIREBASE_DATABASE_URL', 
+                                   "https://your-default-database-url.firebaseio.com/")
+        else:
+            # Fall back to local file (for development)
+            cred = credentials.Certificate("config/serviceAccountKey.json")
+            firebase_database_url = "https://your-default-database-url.firebaseio.com/"
+        
+        # Initialize the app with a service account
+        firebase_admin.initialize_app(cred, {
+            'databaseURL': firebase_database_url
+        })
+        log.info("Firebase initialization successful")
+    except Exception as e:
+        log.error("Firebase initialization error: %s", e)
+
+
+def reset_connections():
+    """
+    Close the database connections of firebase_admin and start a new app.
+
+    The new app opens its connections on first use, so a process can call
+    this before forking workers and no worker shares a connection with
+    another. Does nothing on another backend.
+    """
+    global _firebase_initialized
+    if _backend is not None or not _firebase_initialized:
+        return
+    import firebase_admin
+
+    try:
+        app = firebase_admin.get_app()
+    except ValueError:
+        return
+    firebase_admin.delete_app(app)
+    _firebase_initialized = False
+    initialize_firebase()
+
+
+def use_backend(backend):
+    """
+    Route all reference() calls to another backend.
+
+    Args:
+        backend: Object with a reference(path) method (e.g. fake_rtdb.FakeDatabase),
+            or None to go back to firebase_admin.db
+    """
+    global _backend
+    _backend = backend
+
+
+def reference(path='/'):
+    """Return a database reference for path on the active backend"""
+    if _backend is not None:
+        return TimedReference(_backend.reference(path), path)
+    if not _firebase_initialized:
+        initialize_firebase()
+    from firebase_admin import db
+
+    return TimedReference(db.reference(path), path)
+
+
+def __getattr__(name):
+    # rtdb.TransactionAbortedError, without importing firebase_admin up front
+    if name == "TransactionAbortedError":
+        from firebase_admin.db import TransactionAbortedError
+        return TransactionAbortedError
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _read_value(op, result):
+    """The data part of a read's result, for measuring its size"""
+    if op == "get" and isinstance(result, tuple):
+        return result[0]    # get(etag=True) -> (value, etag)
+    if op == "get_if_changed":
+        return result[1]    # (changed, value, etag)
+    return result
+
+
+class TimedReference:
+    """
+    Reference (or query) wrapper that records each database call in metrics.py.
+
+    Latency goes to handygo_rtdb_duration_seconds and the JSON size of
+    sampled reads to handygo_rtdb_payload_bytes, labelled with the current action and the
+    shape of the path. Everything else is passed through to the wrapped object.
+    """
+
+    def __init__(self, target, path):
+        self._target = target
+        self._path = path
+        self._shape = metrics.path_shape(path)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in TIMED_CALLS:
+            return self._timed(name, attr)
+        if name in QUERY_BUILDERS:
+            return lambda *args, **kwargs: TimedReference(attr(*args, **kwargs), self._path)
+        if name == "child":
+            return lambda path: TimedReference(attr(path), f"{self._path.rstrip('/')}/{path.lstrip('/')}")
+        return attr
+
+    def _timed(self, op, call):
+        def timed_call(*args, **kwargs):
+            action = metrics.current_action()
+            start = time.perf_counter()
+            try:
+                result = call(*args, **kwargs)
+            finally:
+                metrics.RTDB_DURATION.observe(time.perf_counter() - start, action=action, op=op, path=self._shape)
+            if op in ("get", "get_if_changed"):
+                metrics.observe_payload(_read_value(op, result), action, self._shape)
+            return result
+        return timed_call
+
+
+class TreeMirror:
+    """
+    In-process copy of the children of one RTDB node.
+
+    The first read loads the node once. After that the copy is kept current by
+    a listener on the node, or - when listeners aren't available - by a
+    get_if_changed() call once the copy is older than ttl seconds, which only
+    downloads the node again if its ETag changed.
+
+    Records are replaced, never modified in place, so a record handed out by
+    records() stays consistent even if an update arrives while it is in use.
+    """
+
+    def __init__(self, path, ttl=30, use_listener=True, listen_timeout=10):
+        self.path = path
+        self.ttl = ttl
+        self.use_listener = use_listener
+        self.listen_timeout = listen_timeout
+
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._data = {}
+        self._etag = None
+        self._loaded = False
+        self._loaded_at = 0
+        self._listener = None
+        self._reattach = False
+        self._subscribers = []
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "refreshes": 0,
+            "not_modified": 0,
+            "events": 0,
+        }
+        _mirrors.add(self)
+
+    @property
+    def mode(self):
+        return "listen" if self._listener is not None else "poll"
+
+    def records(self):
+        """Return the current {key: record} mapping. Callers must not modify it."""
+        with self._lock:
+            if self._loaded and not self._expired():
+                self._counters["hits"] += 1
+                return self._data
+
+        # Only one thread loads or refreshes; the others wait and then reuse its result
+        with self._load_lock:
+            with self._lock:
+                if not self._loaded:
+                    self._counters["misses"] += 1
+                    refresh = self._load
+                elif self._expired():
+                    self._counters["stale"] += 1
+                    refresh = self._refresh
+                else:
+                    self._counters["hits"] += 1
+                    return self._data
+            refresh()
+            return self._data
+
+    def subscribe(self, callback, replay=False):
+        """
+        Register callback(key, old_record, new_record) for every changed child.
+
+        A full reload reports each added, changed and removed child, so
+        subscribers can maintain derived indexes incrementally.
+
+        Args:
+            callback: Function called with (key, old_record, new_record)
+            replay: Also report every child already loaded as (key, None, record),
+                for subscribers that attach after the first load
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            if replay:
+                for key, record in self._data.items():
+                    callback(key, None, record)
+
+    def invalidate(self):
+        """Force the next read to check the database again"""
+        with self._lock:
+            self._loaded_at = 0
+
+    def detach(self):
+        """
+        Stop following the node but keep the copy.
+
+        The next read follows the node again: with a listener, its first event
+        only reports (and replaces) the children that changed meanwhile, and
+        polling checks the ETag. Used before forking workers (see prefork.py),
+        which inherit the copy and then follow the node themselves.
+        """
+        with self._lock:
+            if self._listener is not None:
+                try:
+                    self._listener.close()
+                except Exception as e:
+                    log.warning("Error closing listener on %s: %s", self.path, e)
+                self._listener = None
+                self._reattach = True
+            self._ready.clear()
+            self._loaded_at = 0
+
+    def close(self):
+        """Stop the listener (if any) and drop the cached copy"""
+        with self._lock:
+            if self._listener is not None:
+                try:
+                    self._listener.close()
+                except Exception as e:
+                    log.warning("Error closing listener on %s: %s", self.path, e)
+                self._listener = None
+            self._replace_all({})
+            self._loaded = False
+            self._etag = None
+            self._ready.clear()
+
+    def stats(self):
+        """Return hit/miss/staleness counters and the state of the copy"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                "path": self.path,
+                "mode": self.mode,
+                "size": len(self._data),
+                "age": round(time.monotonic() - self._loaded_at, 3) if self._loaded else None,
+            })
+            return stats
+
+    # Loading
+
+    def _expired(self):
+        return self._listener is None and (self._reattach or time.monotonic() - self._loaded_at > self.ttl)
+
+    def _load(self):
+        if self.use_listener and self._start_listener():
+            return
+        data, etag = reference(self.path).get(etag=True)
+        with self._lock:
+            self._counters["refreshes"] += 1
+            self._etag = etag
+            self._replace_all(data or {})
+            self._mark_loaded()
+
+    def _start_listener(self):
+        try:
+            self._listener = reference(self.path).listen(self._on_event)
+        except Exception as e:
+            log.warning("Listener on %s unavailable, falling back to polling: %s", self.path, e)
+            self._listener = None
+            return False
+
+        # The listener delivers the whole node as its first event
+        with metrics.RTDB_DURATION.time(action=metrics.current_action(), op="listen",
+                                        path=metrics.path_shape(self.path)):
+            ready = self._ready.wait(self.listen_timeout)
+        if ready:
+            return True
+
+        log.warning("No initial data from listener on %s, falling back to polling", self.path)
+        try:
+            self._listener.close()
+        except Exception:
+            pass
+        self._listener = None
+        return False
+
+    def _refresh(self):
+        if self._reattach:
+            self._reattach = False
+            if self._start_listener():
+                return
+        changed, data, etag = reference(self.path).get_if_changed(self._etag)
+        with self._lock:
+            if changed:
+                self._counters["refreshes"] += 1
+                self._etag = etag
+                self._replace_all(data or {})
+            else:
+                self._counters["not_modified"] += 1
+            self._loaded_at = time.monotonic()
+
+    def _mark_loaded(self):
+        self._loaded = True
+        self._loaded_at = time.monotonic()
+        self._ready.set()
+
+    # Change feed
+
+    def _on_event(self, event):
+        """Apply a listener event (put/patch relative to self.path)"""
+        base = [p for p in (event.path or "/").split("/") if p]
+        metrics.observe_payload(event.data, metrics.NO_ACTION, metrics.path_shape(self.path))
+        if event.event_type == "patch":
+            # Patch keys are paths relative to the event path
+            writes = [(base + [p for p in key.split("/") if p], value) for key, value in (event.data or {}).items()]
+        else:
+            writes = [(base, event.data)]
+
+        with self._lock:
+            self._counters["events"] += 1
+            for parts, value in writes:
+                if not parts:
+                    self._replace_all(value or {})
+                elif len(parts) == 1:
+                    self._set_child(parts[0], value)
+                else:
+                    self._set_child(parts[0], _set_nested(self._data.get(parts[0]), parts[1:], value))
+
+            if not self._ready.is_set():
+                self._mark_loaded()
+            else:
+                self._loaded_at = time.monotonic()
+
+    def _replace_all(self, data):
+        old = self._data
+        data = data if isinstance(data, dict) else {}
+        # Keep the record already held when it didn't change, so a reload
+        # doesn't allocate a second copy of it (and forked workers keep
+        # sharing the parent's)
+        self._data = {key: old[key] if old.get(key) == record else record for key, record in data.items()}
+        # Report in the node's order, then removals, so ordered indexes follow the node
+        for key in list(self._data) + [k for k in old if k not in self._data]:
+            if old.get(key) is not self._data.get(key):
+                self._notify(key, old.get(key), self._data.get(key))
+
+    def _set_child(self, key, value):
+        # Copy-on-write so readers iterating the previous mapping are unaffected
+        old = self._data.get(key)
+        data = dict(self._data)
+        if value is None:
+            data.pop(key, None)
+        else:
+            data[key] = value
+        self._data = data
+        if old != value:
+            self._notify(key, old, value)
+
+    def _notify(self, key, old, new):
+        for callback in self._subscribers:
+            try:
+                callback(key, old, new)
+            except Exception as e:
+                log.exception("Error in subscriber for %s: %s", self.path, e)
+
+
+def detach_mirrors():
+    """Detach every TreeMirror of the process (see TreeMirror.detach); return how many"""
+    mirrors = list(_mirrors)
+    for mirror in mirrors:
+        mirror.detach()
+    return len(mirrors)
+
+
+def _set_nested(record, parts, value):
+    """Return a copy of record with value written at the nested path parts"""
+    record = dict(record) if isinstance(record, dict) else {}
+    head = parts[0]
+    child = _set_nested(record.get(head), parts[1:], value) if len(parts) > 1 else value
+    if child is None or child == {}:
+        record.pop(head, None)
+    else:
+        record[head] = child
+    return record or None
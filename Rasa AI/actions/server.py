@@ -0,0 +1,137 @@
+"""
+Action server entrypoint with a Prometheus /metrics endpoint.
+
+Runs the same Sanic app as `python -m rasa_sdk` (the /webhook, /health and
+/actions routes, same command-line options) and adds:
+
+- GET /metrics: the histograms of metrics.py in Prometheus text format
+- a timed executor that records every action run in
+  handygo_action_duration_seconds
+- a background warm-up once the server is up: /health answers while the
+  indexes and heavy dependencies load (see warmup.py)
+
+Start it from the "Rasa AI" directory:
+
+    python -m actions.server --actions actions --port 5055 --cors "*"
+    curl localhost:5055/metrics
+
+--prefork N (or ACTION_SERVER_PREFORK_WORKERS=N) serves with N pre-forked
+worker processes that share the loaded indexes, see prefork.py.
+"""
+import logging
+import os
+import time
+from functools import partial
+
+from rasa_sdk import utils
+from rasa_sdk.constants import APPLICATION_ROOT_LOGGER_NAME, DEFAULT_KEEP_ALIVE_TIMEOUT
+from rasa_sdk.endpoint import create_app, create_argument_parser, create_ssl_config, load_tracer_provider
+from rasa_sdk.executor import ActionExecutor
+from sanic import Sanic, response
+from sanic.worker.loader import AppLoader
+
+from . import log, metrics, prefork, warmup
+
+logger = logging.getLogger(__name__)
+
+
+class TimedActionExecutor(ActionExecutor):
+    """ActionExecutor that records how long each action call takes"""
+
+    async def run(self, action_call, *args, **kwargs):
+        action_name = action_call.get("next_action") or "unknown"
+        start = time.perf_counter()
+        try:
+            return await super().run(action_call, *args, **kwargs)
+        finally:
+            metrics.ACTION_DURATION.observe(time.perf_counter() - start, action=action_name)
+
+
+def create_metrics_app(actions_module, cors_origins="*", auto_reload=False, endpoints=None,
+                       keep_alive_timeout=DEFAULT_KEEP_ALIVE_TIMEOUT):
+    """
+    Build the action server app with /metrics, for the primary process and each worker.
+
+    Args:
+        actions_module: Package or module with the actions (e.g. "actions")
+        cors_origins: Allowed CORS origins
+        auto_reload: Reload changed action code
+        endpoints: endpoints.yml with the tracing config, if any
+        keep_alive_timeout: Seconds to keep idle connections open
+    """
+    executor = TimedActionExecutor()
+    executor.register_package(actions_module)
+    app = create_app(executor, cors_origins=cors_origins, auto_reload=auto_reload)
+    app.config.KEEP_ALIVE_TIMEOUT = keep_alive_timeout
+    if endpoints:
+        app.register_listener(partial(load_tracer_provider, endpoints), "before_server_start")
+
+    @app.listener("after_server_start")
+    async def start_warm_up(*_):
+        # Importing the actions loads nothing heavy; load it before the first conversation asks
+        warmup.start_background_warm_up()
+
+    @app.get("/metrics")
+    async def metrics_endpoint(_):
+        return response.text(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+    return app
+
+
+def serve_worker(args, sock):
+    """Serve the action server app on sock in this (pre-forked worker) process"""
+    app = create_metrics_app(
+        args.actions_module or args.actions,
+        cors_origins=args.cors,
+        auto_reload=False,
+        endpoints=args.endpoints,
+    )
+    ssl_config = create_ssl_config(args.ssl_certificate, args.ssl_keyfile, args.ssl_password)
+    app.run(sock=sock, ssl=ssl_config, single_process=True, motd=False, access_log=False)
+
+
+def main():
+    arg_parser = create_argument_parser()
+    arg_parser.add_argument(
+        "--prefork", type=int, default=int(os.environ.get("ACTION_SERVER_PREFORK_WORKERS", 0)),
+        help="Serve with this many pre-forked worker processes sharing the loaded indexes (0 = off)")
+    args = arg_parser.parse_args()
+
+    utils.configure_colored_logging(args.loglevel)
+    utils.configure_file_logging(
+        logging.getLogger(APPLICATION_ROOT_LOGGER_NAME), args.log_file, args.loglevel, args.logging_config_file)
+    # rasa_sdk writes only its own logger to --log-file; the actions' records go there too
+    for handler in logging.getLogger(APPLICATION_ROOT_LOGGER_NAME).handlers:
+        if isinstance(handler, logging.FileHandler):
+            log.add_handler(handler)
+    utils.update_sanic_log_level()
+
+    host = os.environ.get("SANIC_HOST", "0.0.0.0")
+    if args.prefork > 0:
+        # Load the actions (and with them the database app) in the parent, so the workers inherit them
+        ActionExecutor().register_package(args.actions_module or args.actions)
+        prefork.serve(partial(serve_worker, args), args.prefork, host, args.port)
+        return
+
+    loader = AppLoader(factory=partial(
+        create_metrics_app,
+        args.actions_module or args.actions,
+        cors_origins=args.cors,
+        auto_reload=args.auto_reload,
+        endpoints=args.endpoints,
+    ))
+    app = loader.load()
+    ssl_config = create_ssl_config(args.ssl_certificate, args.ssl_keyfile, args.ssl_password)
+    logger.info(f"Action endpoint with /metrics is up on {host}:{args.port}")
+    workers = utils.number_of_sanic_workers()
+    if workers == 1 and not args.auto_reload:
+        # Serve from this process: a Sanic worker process would import the actions a second time
+        app.prepare(host=host, port=args.port, ssl=ssl_config, single_process=True)
+        Sanic.serve_single(primary=app)
+        return
+    app.prepare(host=host, port=args.port, ssl=ssl_config, workers=workers)
+    Sanic.serve(primary=app, app_loader=loader)
+
+
+if __name__ == '__main__':
+    main()
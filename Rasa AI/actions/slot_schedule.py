@@ -0,0 +1,182 @@
+"""
+The booking slot schedule and the tables derived from it.
+
+The slot names and hours used to be written out as separate dicts wherever
+they were needed: start/end times for the job timestamps, display strings
+for the booking summary, the hour ranges the message parser maps times to,
+the end hours and bit order of the availability engine. A SlotSchedule is
+built once from the list of (name, start, end) slots and precomputes all of
+them:
+
+    schedule = SlotSchedule([("Slot 1", "08:00", "12:00"), ...], default="Slot 2")
+    schedule.times["Slot 1"]           # ("08:00", "12:00")
+    schedule.display["Slot 1"]         # "8:00 AM - 12:00 PM"
+    schedule.slot_for_hour(14)         # "Slot 2"
+    schedule.timestamps("Slot 1", "2025-06-01")
+                                       # ("2025-06-01T08:00:00.000Z", "2025-06-01T12:00:00.000Z")
+
+DEFAULT_SCHEDULE is the schedule HandyGO has always used. The live schedule
+comes from the booking configuration snapshot (booking_config.py).
+"""
+from datetime import datetime, timedelta
+
+# The three bookable slots; times are 24-hour "HH:MM"
+DEFAULT_SLOTS = (
+    ("Slot 1", "08:00", "12:00"),
+    ("Slot 2", "13:00", "17:00"),
+    ("Slot 3", "18:00", "22:00"),
+)
+
+# Slot used when a booking message has no usable time
+DEFAULT_SLOT = "Slot 2"
+
+# Free slots are kept in uint8 bitmasks (see availability.py)
+MAX_SLOTS = 8
+
+
+def format_time(hour, minute):
+    """Display form of a 24-hour time, e.g. (14, 0) -> "2:00 PM" """
+    # "24:00" (a slot ending at midnight) shows as 12:00 AM
+    hour %= 24
+    period = "AM" if hour < 12 else "PM"
+    display_hour = hour if hour <= 12 else hour - 12
+    display_hour = 12 if display_hour == 0 else display_hour
+    return f"{display_hour}:{minute:02d} {period}"
+
+
+def parse_clock(value):
+    """
+    (hour, minute) of an "HH:MM" string; raises ValueError if it isn't one.
+
+    "24:00" is accepted as the midnight that ends a day (a slot's end);
+    timestamps() turns it into 00:00 of the next day.
+    """
+    hour, _, minute = str(value).partition(":")
+    hour, minute = int(hour), int(minute or 0)
+    if not (0 <= hour < 24 and 0 <= minute < 60) and (hour, minute) != (24, 0):
+        raise ValueError(f"Not a time of day: {value!r}")
+    return hour, minute
+
+
+class SlotSchedule:
+    """
+    Bookable slots of a day, with every lookup table the actions need.
+
+    Slots are ordered by start time; that order is also the bit order of the
+    availability masks.
+
+    Args:
+        slots: Iterable of (name, start "HH:MM", end "HH:MM")
+        default: Slot for booking messages without a usable time (defaults
+            to DEFAULT_SLOT if it exists, else the first slot)
+
+    Raises:
+        ValueError: If there are no slots, too many, duplicate names or bad times
+    """
+
+    def __init__(self, slots, default=None):
+        parsed = []
+        for name, start, end in slots:
+            start_hm, end_hm = parse_clock(start), parse_clock(end)
+            if end_hm <= start_hm:
+                raise ValueError(f"{name} ends before it starts")
+            parsed.append((str(name), start_hm, end_hm))
+        if not parsed:
+            raise ValueError("The schedule has no slots")
+        if len(parsed) > MAX_SLOTS:
+            raise ValueError(f"At most {MAX_SLOTS} slots are supported")
+        parsed.sort(key=lambda slot: slot[1])
+        names = tuple(name for name, _, _ in parsed)
+        if len(set(names)) != len(names):
+            raise ValueError("Slot names must be unique")
+
+        self.names = names
+        self.times = {name: (f"{s[0]:02d}:{s[1]:02d}", f"{e[0]:02d}:{e[1]:02d}") for name, s, e in parsed}
+        self.display = {name: f"{format_time(*s)} - {format_time(*e)}" for name, s, e in parsed}
+        self.bits = {name: 1 << i for i, name in enumerate(names)}
+        self.all_mask = (1 << len(names)) - 1
+        # Minute of the day at which each slot can no longer be booked
+        self.end_minutes = {name: e[0] * 60 + e[1] for name, _, e in parsed}
+        if default in self.bits:
+            self.default = default
+        else:
+            self.default = DEFAULT_SLOT if DEFAULT_SLOT in self.bits else names[0]
+
+        # Hour -> slot for booking messages: each slot takes the hours from the
+        # end of the previous slot (the first slot: its start) up to its end,
+        # so times in the gaps between slots go to the next slot
+        hour_slots = [None] * 24
+        low = parsed[0][1][0]
+        for name, _, end in parsed:
+            end_hour = min(24, end[0])
+            for hour in range(low, end_hour):
+                hour_slots[hour] = name
+            low = max(low, end_hour)
+        self.hour_slots = tuple(hour_slots)
+
+    def __eq__(self, other):
+        return isinstance(other, SlotSchedule) and (self.times, self.default) == (other.times, other.default)
+
+    def __hash__(self):
+        return hash((tuple(self.times.items()), self.default))
+
+    def __repr__(self):
+        return f"SlotSchedule({[(name,) + self.times[name] for name in self.names]!r}, default={self.default!r})"
+
+    def slot_for_hour(self, hour):
+        """Booking slot containing a 24-hour hour, or None outside booking hours"""
+        if not isinstance(hour, int) or not 0 <= hour < 24:
+            return None
+        return self.hour_slots[hour]
+
+    def timestamps(self, slot, day):
+        """
+        Job start and end timestamps of slot on day ("YYYY-MM-DD").
+
+        A slot ending at "24:00" ends at 00:00 of the next day.
+
+        Returns:
+            tuple: ("YYYY-MM-DDTHH:MM:00.000Z", ...) as stored on /jobs
+
+        Raises:
+            KeyError: If slot isn't in the schedule
+            ValueError: If day isn't a YYYY-MM-DD date
+        """
+        start, end = self.times[slot]
+        date = datetime.strptime(day, "%Y-%m-%d")
+        return tuple(
+            (date + timedelta(hours=int(clock[:2]), minutes=int(clock[3:]))).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            for clock in (start, end)
+        )
+
+    # Bitmasks (availability.py)
+
+    def mask(self, slots):
+        """Bitmask of an iterable of slot names (unknown names are ignored)"""
+        mask = 0
+        for slot in slots:
+            mask |= self.bits.get(slot, 0)
+        return mask
+
+    def slots_of(self, mask):
+        """Slot names of a bitmask, in slot order"""
+        return [name for name in self.names if mask & self.bits[name]]
+
+    def passed_mask(self, day, now=None):
+        """
+        Slots of day that can no longer be booked because they have passed.
+
+        Only today's slots pass, each at its end time; other days have none.
+
+        Args:
+            day: Date to check
+            now: Current time (defaults to datetime.today())
+        """
+        now = now or datetime.today()
+        if day != now.date():
+            return 0
+        minute_of_day = now.hour * 60 + now.minute
+        return self.mask(name for name, end in self.end_minutes.items() if minute_of_day >= end)
+
+
+DEFAULT_SCHEDULE = SlotSchedule(DEFAULT_SLOTS, default=DEFAULT_SLOT)
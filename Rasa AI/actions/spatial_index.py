@@ -0,0 +1,316 @@
+"""
+Nearest-handyman lookups by coordinates.
+
+ActionEasyBook used to compute a haversine distance to every handyman with a
+matching expertise and then sort the whole list. This index buckets active
+handymen into a lat/lon grid per expertise and answers "nearest handymen of
+expertise X to (lat, lon)" by visiting grid cells in rings around the query
+point, so only the cells near the user are touched.
+
+The index follows the handyman directory's change feed: a handyman whose
+location, status or expertise changes is moved (or removed) straight away.
+"""
+import heapq
+import math
+import os
+import threading
+
+from .handyman_directory import get_handyman_directory
+from .map_cal import EARTH_RADIUS_KM, haversine
+
+# Kilometres per degree of latitude
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def handyman_entry(record):
+    """
+    Return (expertise_keys, coords) for a handyman the index should hold, else None.
+
+    Only active handymen with an expertise list are indexed. expertise_keys are
+    the lower-cased expertise names; coords is (lat, lon) as floats, or None if
+    the record has no usable coordinates.
+
+    Args:
+        record: Handyman record as stored under /handymen
+    """
+    if not isinstance(record, dict) or record.get("status") != "active":
+        return None
+    expertise = record.get("expertise")
+    if not expertise or not isinstance(expertise, list):
+        return None
+    keys = tuple(dict.fromkeys(exp.lower() for exp in expertise if isinstance(exp, str)))
+    if not keys:
+        return None
+
+    coords = None
+    latitude, longitude = record.get("latitude"), record.get("longitude")
+    if latitude and longitude:
+        try:
+            coords = (float(latitude), float(longitude))
+        except (ValueError, TypeError):
+            coords = None
+        if coords and not all(math.isfinite(c) for c in coords):
+            coords = None
+    return keys, coords
+
+
+class HandymanSpatialIndex:
+    """
+    Grid of active handymen per expertise.
+
+    Expertise is matched the way the booking code always has: a handyman
+    matches "Plumber" if any of their expertise names contains "plumber".
+
+    Grids and their cells are replaced rather than modified, so a lookup in
+    progress keeps working on the snapshot it started with.
+
+    Args:
+        directory: HandymanDirectory to follow; None for an index fed only
+            through insert()/remove()
+        cell_deg: Size of a grid cell in degrees (0.1 is about 11 km)
+    """
+
+    def __init__(self, directory=None, cell_deg=0.1):
+        self.cell_deg = cell_deg
+        self._lock = threading.RLock()
+        self._grids = {}      # expertise -> {(row, col): {handyman_id: (lat, lon)}}
+        self._members = {}    # expertise -> {handyman_id: None}, in insertion order
+        self._unlocated = {}  # expertise -> {handyman_id: None} without coordinates
+        self._entries = {}    # handyman_id -> (expertise_keys, coords)
+        self._directory = directory
+        if directory is not None:
+            directory.subscribe(self._on_handyman_changed, replay=True)
+
+    # Maintenance
+
+    def insert(self, handyman_id, record):
+        """Add or move a handyman; records that aren't indexable remove it instead"""
+        with self._lock:
+            self._apply(handyman_id, handyman_entry(record))
+
+    def remove(self, handyman_id):
+        """Drop a handyman from the index"""
+        with self._lock:
+            self._apply(handyman_id, None)
+
+    def _on_handyman_changed(self, handyman_id, old_record, new_record):
+        self.insert(handyman_id, new_record)
+
+    def _apply(self, handyman_id, entry):
+        old_entry = self._entries.get(handyman_id)
+        if old_entry == entry:
+            return
+        if old_entry is not None:
+            keys, coords = old_entry
+            for key in keys:
+                self._members[key].pop(handyman_id, None)
+                if not self._members[key]:
+                    del self._members[key]
+                if coords is None:
+                    self._unlocated[key].pop(handyman_id, None)
+                    if not self._unlocated[key]:
+                        del self._unlocated[key]
+                else:
+                    self._move(key, handyman_id, coords, None)
+            del self._entries[handyman_id]
+        if entry is not None:
+            keys, coords = entry
+            for key in keys:
+                self._members.setdefault(key, {})[handyman_id] = None
+                if coords is None:
+                    self._unlocated.setdefault(key, {})[handyman_id] = None
+                else:
+                    self._move(key, handyman_id, None, coords)
+            self._entries[handyman_id] = entry
+
+    def _move(self, key, handyman_id, old_coords, new_coords):
+        # Copy-on-write of the grid and the touched cells
+        grid = dict(self._grids.get(key, {}))
+        if old_coords is not None:
+            cell = self._cell(*old_coords)
+            points = dict(grid.get(cell, {}))
+            points.pop(handyman_id, None)
+            if points:
+                grid[cell] = points
+            else:
+                grid.pop(cell, None)
+        if new_coords is not None:
+            cell = self._cell(*new_coords)
+            points = dict(grid.get(cell, {}))
+            points[handyman_id] = new_coords
+            grid[cell] = points
+        if grid:
+            self._grids[key] = grid
+        else:
+            self._grids.pop(key, None)
+
+    def _cell(self, latitude, longitude):
+        return math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg)
+
+    # Lookups
+
+    def _sync(self):
+        if self._directory is not None:
+            # Loads the directory on first use (or refreshes it when polling)
+            self._directory.records()
+
+    def _matching_keys(self, expertise, table):
+        needle = expertise.lower()
+        return [key for key in table if needle in key]
+
+    def matching(self, expertise):
+        """IDs of all active handymen matching expertise, with or without coordinates"""
+        self._sync()
+        with self._lock:
+            ids = {}
+            for key in self._matching_keys(expertise, self._members):
+                ids.update(self._members[key])
+            return list(ids)
+
+    def unlocated(self, expertise):
+        """IDs of active handymen matching expertise that have no usable coordinates"""
+        self._sync()
+        with self._lock:
+            ids = {}
+            for key in self._matching_keys(expertise, self._unlocated):
+                ids.update(self._unlocated[key])
+            return list(ids)
+
+    def iter_nearest(self, latitude, longitude, expertise, radius_km=None):
+        """
+        Yield (handyman_id, distance_km) for matching handymen, nearest first.
+
+        Cells are visited in square rings around the query point. A handyman is
+        yielded once no unvisited cell can hold anyone closer, so taking the
+        first k results only touches the cells around those k handymen.
+        Distances are rounded to 2 decimals, like the booking code's own.
+
+        Args:
+            latitude, longitude: Query point in degrees
+            expertise: Required expertise (substring match, case-insensitive)
+            radius_km: Stop after this distance; None yields every match
+        """
+        self._sync()
+        with self._lock:
+            grids = [self._grids[key] for key in self._matching_keys(expertise, self._grids)]
+        remaining = sum(len(grid) for grid in grids)
+
+        row0, col0 = self._cell(latitude, longitude)
+        heap = []
+        seen = set()
+
+        def push(points):
+            for handyman_id, (h_lat, h_lon) in points.items():
+                if handyman_id not in seen:
+                    seen.add(handyman_id)
+                    distance = haversine(latitude, longitude, h_lat, h_lon)
+                    heapq.heappush(heap, (distance, handyman_id))
+
+        ring = 0
+        while remaining:
+            bound = self._ring_bound(latitude, ring)
+            while heap and heap[0][0] <= bound:
+                distance, handyman_id = heapq.heappop(heap)
+                if radius_km is not None and distance > radius_km:
+                    return
+                yield handyman_id, round(distance, 2)
+            if radius_km is not None and bound > radius_km:
+                break
+
+            if 8 * ring > remaining:
+                # Fewer occupied cells left than cells in the ring: visit them directly
+                for grid in grids:
+                    for (row, col), points in grid.items():
+                        if max(abs(row - row0), abs(col - col0)) >= ring:
+                            push(points)
+                remaining = 0
+                break
+
+            for cell in self._ring_cells(row0, col0, ring):
+                for grid in grids:
+                    points = grid.get(cell)
+                    if points:
+                        remaining -= 1
+                        push(points)
+            ring += 1
+
+        while heap:
+            distance, handyman_id = heapq.heappop(heap)
+            if radius_km is not None and distance > radius_km:
+                return
+            yield handyman_id, round(distance, 2)
+
+    def nearest(self, latitude, longitude, expertise, k=None, radius_km=None):
+        """
+        Return up to k (handyman_id, distance_km) pairs within radius_km, nearest first.
+
+        Args:
+            latitude, longitude: Query point in degrees
+            expertise: Required expertise (substring match, case-insensitive)
+            k: Maximum number of results; None for no limit
+            radius_km: Maximum distance; None for no limit
+        """
+        results = []
+        for result in self.iter_nearest(latitude, longitude, expertise, radius_km):
+            if k is not None and len(results) >= k:
+                break
+            results.append(result)
+        return results
+
+    def _ring_bound(self, latitude, ring):
+        """Lower bound (km) on the distance to any point in ring or beyond"""
+        if ring <= 1:
+            return 0.0
+        # Points in ring r are more than r - 1 cells away along one axis. Along
+        # a parallel a degree is shortest at the ring's highest latitude.
+        degrees = (ring - 1) * self.cell_deg
+        highest = min(abs(latitude) + (ring + 1) * self.cell_deg, 90.0)
+        return min(degrees, 180.0) * KM_PER_DEGREE * math.cos(math.radians(highest))
+
+    @staticmethod
+    def _ring_cells(row0, col0, ring):
+        if ring == 0:
+            yield row0, col0
+            return
+        for col in range(col0 - ring, col0 + ring + 1):
+            yield row0 - ring, col
+            yield row0 + ring, col
+        for row in range(row0 - ring + 1, row0 + ring):
+            yield row, col0 - ring
+            yield row, col0 + ring
+
+    def stats(self):
+        """Return the number of indexed handymen and occupied cells per expertise"""
+        with self._lock:
+            return {
+                "handymen": len(self._entries),
+                "unlocated": len({h for ids in self._unlocated.values() for h in ids}),
+                "cells": {key: len(grid) for key, grid in self._grids.items()},
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_handyman_spatial_index():
+    """
+    Return the shared HandymanSpatialIndex, creating it on first use.
+
+    It follows the shared handyman directory (and is rebuilt if that directory
+    is replaced). HANDYMAN_GRID_DEG sets the grid cell size in degrees.
+    """
+    global _index
+    directory = get_handyman_directory()
+    if _index is None or _index._directory is not directory:
+        with _index_lock:
+            if _index is None or _index._directory is not directory:
+                _index = HandymanSpatialIndex(directory, cell_deg=float(os.environ.get('HANDYMAN_GRID_DEG', 0.1)))
+    return _index
+
+
+def reset_handyman_spatial_index(index=None):
+    """Replace the shared index, e.g. after switching backends"""
+    global _index
+    with _index_lock:
+        _index = index
@@ -0,0 +1,209 @@
+"""
+Free-text town names to towns of the city graph.
+
+Addresses and handyman profiles spell towns freely ("PJ", "Petaling Jaya,
+Selangor", "Sg. Petani", "Alor Star"). Proximity checks used to scan every
+town of map_cal.city_graph and every neighbour with substring tests. The
+resolver maps a string to one graph town with dictionary lookups instead:
+
+1. exact match after folding accents, case and punctuation, with common
+   abbreviations expanded ("sg" -> "sungai") and an alias table ("pj")
+2. the longest run of words that is a town ("taman tun, petaling jaya")
+3. a unique-ish prefix ("petaling" -> "petaling jaya"), by binary search
+4. trigram similarity for misspellings ("kuching" <- "kucing")
+
+Results are memoized, so repeated names cost one dict lookup.
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+# Words commonly abbreviated in Malaysian addresses
+ABBREVIATIONS = {
+    "sg": "sungai",
+    "sgi": "sungai",
+    "bt": "batu",
+    "bkt": "bukit",
+    "kg": "kampung",
+    "kpg": "kampung",
+    "tmn": "taman",
+    "jln": "jalan",
+    "presint": "precinct",
+}
+
+# Other names for graph towns (keys are normalized, values are graph towns)
+TOWN_ALIASES = {
+    "kl": "klcc",
+    "kuala lumpur": "klcc",
+    "kl city centre": "klcc",
+    "pj": "petaling jaya",
+    "jb": "johor bahru",
+    "johor baharu": "johor bahru",
+    "george town": "georgetown",
+    "penang": "georgetown",
+    "pulau pinang": "georgetown",
+    "alor star": "alor setar",
+    "malacca": "melaka city",
+    "melaka": "melaka city",
+    "bandar melaka": "melaka city",
+    "air keroh": "ayer keroh",
+    "kk": "kota kinabalu",
+    "kb": "kota bharu",
+    "kt": "kuala terengganu",
+    "pd": "port dickson",
+    "putrajaya": "precinct 1",
+    "cameron highland": "cameron highlands",
+    "nusajaya": "iskandar puteri",
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_town(text):
+    """
+    Fold a town string for matching.
+
+    Accents are stripped (NFKD), case is folded, punctuation becomes spaces
+    and common abbreviations are expanded, e.g. "Sg. Pétani " -> "sungai petani".
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    words = _NON_WORD.sub(" ", text).split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TownResolver:
+    """
+    Resolve free-text names to a fixed list of towns.
+
+    Args:
+        towns: Town names as used by the city graph (lower case)
+        aliases: Extra {name: town} entries; aliases for unknown towns are ignored
+        min_similarity: Minimum trigram (Dice) similarity for a fuzzy match
+        cache_size: Number of resolved strings to memoize
+    """
+
+    def __init__(self, towns, aliases=TOWN_ALIASES, min_similarity=0.6, cache_size=4096):
+        self.towns = list(towns)
+        self.min_similarity = min_similarity
+
+        self._exact = {}
+        for town in self.towns:
+            self._exact.setdefault(normalize_town(town), town)
+        known = set(self.towns)
+        for alias, town in aliases.items():
+            if town in known:
+                self._exact.setdefault(normalize_town(alias), town)
+
+        # Sorted keys for prefix search, trigram postings for fuzzy search
+        self._keys = sorted(self._exact)
+        self._longest = max((len(key.split()) for key in self._keys), default=0)
+        self._postings = defaultdict(list)
+        for key in self._keys:
+            for gram in _trigrams(key):
+                self._postings[gram].append(key)
+
+        self.resolve = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def _resolve(self, text):
+        """
+        Return the graph town for text, or None if nothing matches.
+
+        Args:
+            text: Free-text town, e.g. a primaryAddress.city value
+        """
+        key = normalize_town(text)
+        if not key:
+            return None
+
+        town = self._exact.get(key)
+        if town:
+            return town
+
+        # Longest run of words naming a town, e.g. "taman tun dr ismail petaling jaya selangor"
+        words = key.split()
+        for length in range(min(len(words), self._longest), 0, -1):
+            for start in range(len(words) - length + 1):
+                town = self._exact.get(" ".join(words[start:start + length]))
+                if town:
+                    return town
+
+        # Shortest town starting with the text, e.g. "petaling" -> "petaling jaya"
+        if len(key) >= 3:
+            i = bisect.bisect_left(self._keys, key)
+            candidates = []
+            while i < len(self._keys) and self._keys[i].startswith(key):
+                candidates.append(self._keys[i])
+                i += 1
+            if candidates:
+                return self._exact[min(candidates, key=lambda k: (len(k), k))]
+
+        return self._fuzzy(key)
+
+    def _fuzzy(self, key):
+        grams = _trigrams(key)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                shared[candidate] += 1
+        best, best_score = None, self.min_similarity
+        for candidate, count in shared.items():
+            score = 2 * count / (len(grams) + len(_trigrams(candidate)))
+            if score > best_score or (score == best_score and best is not None and candidate < best):
+                best, best_score = candidate, score
+        return self._exact[best] if best else None
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_town_resolver():
+    """Return the shared resolver over the towns of map_cal.city_graph"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                from .map_cal import city_graph
+                _resolver = TownResolver(city_graph)
+    return _resolver
+
+
+def resolve_town(text):
+    """Map a free-text town name to its city graph town, or None"""
+    if not text:
+        return None
+    return get_town_resolver().resolve(text)
+
+
+def town_distance(city1, city2, city_graph=None):
+    """
+    Distance in km between two free-text towns.
+
+    Args:
+        city1, city2: Town names as typed (any case, aliases, partial names)
+        city_graph: Graph to look the distance up in (defaults to map_cal.city_graph)
+
+    Returns:
+        float or None: 0 for the same town, the graph distance if the towns
+        are neighbours, None if either is unknown or they are not nearby
+    """
+    town1, town2 = resolve_town(city1), resolve_town(city2)
+    if not town1 or not town2:
+        return None
+    if town1 == town2:
+        return 0
+    if city_graph is None:
+        from .map_cal import city_graph
+    neighbours = city_graph.get(town1) or {}
+    return neighbours.get(town2)
@@ -0,0 +1,85 @@
+"""
+Per-turn read planner.
+
+An action usually needs several independent reads (the user's profile, a
+handyman record, a job, schedules) and used to issue them one after
+another, sometimes reading the same path twice. A TurnReads object lives for
+one action invocation: the action announces what it will need up front,
+the reads run concurrently on the read pool, and later requests for the
+same path or key wait on the read already in flight instead of issuing a
+new one. Turn latency becomes roughly that of the slowest read.
+
+    reads = TurnReads()
+    reads.fetch(('profile', user_id), get_user_profiles().get, user_id)
+    reads.prefetch(f'/jobs/{booking_id}')
+    ...
+    profile = reads.result(('profile', user_id), get_user_profiles().get, user_id)
+    job = reads.get(f'/jobs/{booking_id}') or {}
+"""
+import threading
+
+from . import log, metrics, rtdb
+from .io_pool import get_read_executor
+
+
+def _read(path):
+    return rtdb.reference(path).get()
+
+
+class TurnReads:
+    """
+    Deduplicated, concurrent reads for one action invocation.
+
+    Values are shared between callers asking for the same key, so treat them
+    as read-only. Call forget() after writing a path that will be read again.
+
+    Args:
+        executor: Pool to run reads on (defaults to io_pool's read pool)
+    """
+
+    def __init__(self, executor=None):
+        self._executor = executor or get_read_executor()
+        self._lock = threading.Lock()
+        self._futures = {}
+        self.issued = 0
+        self.deduped = 0
+
+    def fetch(self, key, func, *args, **kwargs):
+        """
+        Start func(*args, **kwargs) in the background unless key was already started.
+
+        Args:
+            key: Identifies the read within this turn (a path, or a tuple)
+            func: Blocking function that performs the read
+
+        Returns:
+            concurrent.futures.Future: The read's future (new or existing)
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                # The read counts towards the action (and conversation) that asked for it
+                future = self._executor.submit(log.bind_conversation(metrics.bind_action(func)), *args, **kwargs)
+                self._futures[key] = future
+                self.issued += 1
+            else:
+                self.deduped += 1
+            return future
+
+    def result(self, key, func, *args, **kwargs):
+        """Like fetch(), but wait for and return the value (exceptions are re-raised)"""
+        return self.fetch(key, func, *args, **kwargs).result()
+
+    def prefetch(self, *paths):
+        """Start reading each database path concurrently"""
+        for path in paths:
+            self.fetch(path, _read, path)
+
+    def get(self, path):
+        """Value at a database path, from this turn's read if there is one"""
+        return self.result(path, _read, path)
+
+    def forget(self, key):
+        """Drop a finished or pending read so the next request reads again"""
+        with self._lock:
+            self._futures.pop(key, None)
@@ -0,0 +1,228 @@
+"""
+Per-sender cache of parsed user profiles.
+
+/users/{sender_id} was read by ActionInitializeUserSession,
+ActionSuggestHandyman, ActionShowBookingDetails, ActionConfirmBooking and
+process_booking, and twice in one ActionEasyBook run, and each of them
+rebuilt the address string and coordinates from primaryAddress. A booking
+flow of four or five turns read the same record four or five times.
+
+The cache keeps one parsed UserProfile per sender for a short time:
+
+    profile = get_user_profiles().get(user_id)
+    profile.address        # "Unit 3, Jalan 1, Cheras, 56000" (None without one)
+    profile.coordinates    # (latitude, longitude), or None
+    profile.city, profile.wallet
+
+- Entries expire after USER_PROFILE_TTL seconds (default 60) and the least
+  recently used are dropped beyond USER_PROFILE_CACHE_SIZE (default 10000).
+- Writes the action server makes go through update(), which writes the
+  database and the cached profile together (write-through).
+- A booking charges its fee to the wallet, so book_slot() drops the
+  booker's profile (invalidate()). Wallet top-ups and address changes made
+  in the app are picked up when the entry expires, when a new session
+  starts (ActionInitializeUserSession reads the profile fresh), and before
+  the actions turn a user away for insufficient funds (get(refresh=True)).
+- Concurrent lookups of the same sender share one read.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from . import metrics, rtdb
+
+USERS_PATH = "/users"
+
+# primaryAddress fields joined into the display address, in order
+ADDRESS_FIELDS = ("unitName", "buildingName", "streetName", "city", "postalCode", "country")
+
+
+def format_address(address_data):
+    """Display address from a primaryAddress record, or None if it has no parts"""
+    parts = [address_data[field] for field in ADDRESS_FIELDS if address_data.get(field)]
+    return ", ".join(str(part) for part in parts) if parts else None
+
+
+class UserProfile:
+    """
+    The parts of a /users record the actions use, parsed once.
+
+    Args:
+        user_id: Key of the user under /users
+        record: The user's record, or None if there is none
+    """
+
+    __slots__ = ("user_id", "record", "exists", "name", "address", "city", "coordinates", "wallet")
+
+    def __init__(self, user_id, record):
+        record = record if isinstance(record, dict) else {}
+        address_data = record.get("primaryAddress")
+        address_data = address_data if isinstance(address_data, dict) else {}
+
+        self.user_id = user_id
+        # Shared between callers: treat as read-only
+        self.record = record
+        self.exists = bool(record)
+        self.name = record.get("name")
+        self.address = format_address(address_data)
+        self.city = address_data.get("city")
+        # Only when both are stored, as the actions always required
+        if "latitude" in address_data and "longitude" in address_data:
+            self.coordinates = (address_data["latitude"], address_data["longitude"])
+        else:
+            self.coordinates = None
+        self.wallet = record.get("wallet", 0)
+
+    def __repr__(self):
+        return (f"UserProfile({self.user_id!r}, exists={self.exists}, city={self.city!r}, "
+                f"wallet={self.wallet!r})")
+
+
+class UserProfileCache:
+    """
+    TTL + LRU cache of UserProfile objects keyed on the user ID.
+
+    Args:
+        ttl: Seconds a profile is served before it is read again; 0 disables the cache
+        max_entries: Number of profiles to keep
+    """
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # user_id -> (expires_at, UserProfile)
+        self._inflight = {}             # user_id -> Future
+
+        self.reads = 0
+        self.hits = 0
+        self.coalesced = 0
+
+    def get(self, user_id, refresh=False):
+        """
+        Return the UserProfile of user_id (exists=False if there is no record).
+
+        Args:
+            user_id: Key of the user under /users
+            refresh: Read the database even if a cached profile is still fresh
+        """
+        leader = True
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and not refresh and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                metrics.USER_PROFILE_LOOKUPS.inc(source="cache")
+                return entry[1]
+            future = self._inflight.get(user_id)
+            if future is not None:
+                leader = False
+                self.coalesced += 1
+            else:
+                future = self._inflight[user_id] = Future()
+
+        if not leader:
+            metrics.USER_PROFILE_LOOKUPS.inc(source="coalesced")
+            return future.result()
+
+        try:
+            self.reads += 1
+            metrics.USER_PROFILE_LOOKUPS.inc(source="database")
+            profile = UserProfile(user_id, rtdb.reference(f"{USERS_PATH}/{user_id}").get())
+        except Exception as e:
+            with self._lock:
+                if self._inflight.get(user_id) is future:
+                    del self._inflight[user_id]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            # An invalidate() or update() while reading makes this read stale: don't keep it
+            if self._inflight.get(user_id) is future:
+                del self._inflight[user_id]
+                self._store(user_id, profile)
+        future.set_result(profile)
+        return profile
+
+    def update(self, user_id, changes):
+        """
+        Write changes to /users/{user_id} and to the cached profile.
+
+        Args:
+            user_id: Key of the user under /users
+            changes: Children to set, as for Reference.update(); keys with a
+                "/" (nested paths) drop the cached profile instead
+        """
+        rtdb.reference(f"{USERS_PATH}/{user_id}").update(changes)
+        with self._lock:
+            self._inflight.pop(user_id, None)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            # An expired record may be out of date in fields this write doesn't touch
+            if entry[0] <= time.monotonic() or any("/" in key for key in changes):
+                del self._entries[user_id]
+                return
+            record = dict(entry[1].record)
+            for key, value in changes.items():
+                if value is None:
+                    record.pop(key, None)
+                else:
+                    record[key] = value
+            self._store(user_id, UserProfile(user_id, record))
+
+    def invalidate(self, user_id):
+        """Drop the cached profile of user_id (e.g. after its wallet changed)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._inflight.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._inflight.clear()
+
+    def _store(self, user_id, profile):
+        # Called with the lock held
+        if not self.ttl or not self.max_entries:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """Counters for monitoring: database reads, cache hits, coalesced waits"""
+        with self._lock:
+            return {
+                "reads": self.reads,
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "cached": len(self._entries),
+            }
+
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def get_user_profiles():
+    """Return the shared UserProfileCache, configured from the environment on first use"""
+    global _profiles
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = UserProfileCache(
+                    ttl=float(os.environ.get("USER_PROFILE_TTL", 60)),
+                    max_entries=int(os.environ.get("USER_PROFILE_CACHE_SIZE", 10000)),
+                )
+    return _profiles
+
+
+def reset_user_profiles(profiles=None):
+    """Replace the shared cache, e.g. after switching backends"""
+    global _profiles
+    with _profiles_lock:
+        _profiles = profiles
@@ -0,0 +1,84 @@
+"""
+Warm-up of the data and dependencies the actions share.
+
+Importing the actions package only defines things: the heavy dependencies
+(firebase_admin, numpy, requests) are imported where they are first used
+and the indexes load on first use, so the action server binds its port and
+answers /health right away. warm_up() then does that first use ahead of the
+first conversation:
+
+- the pre-forked server runs it in the parent before forking (prefork.py)
+- the single-process server and each pre-forked worker run it on a
+  background thread once the server has started (server.py), so a worker
+  also follows its database mirrors again before its first conversation
+
+ACTION_SERVER_WARMUP=0 turns the background warm-up off.
+"""
+import importlib
+import os
+import threading
+import time
+
+from .log import get_logger
+
+log = get_logger(__name__)
+
+# Imported lazily by the modules that use them
+LAZY_MODULES = ("numpy", "requests", "firebase_admin.db")
+
+
+def warm_up():
+    """
+    Load the data every action shares.
+
+    Returns:
+        dict: Seconds spent on each part
+    """
+    from .availability import get_availability_engine
+    from .booking_config import get_booking_config
+    from .expertise_index import get_expertise_index
+    from .handyman_directory import get_handyman_directory
+    from .job_index import get_busy_slot_index
+    from .map_cal import city_graph
+    from .nlu_client import get_nlu_client
+    from .spatial_index import get_handyman_spatial_index
+    from .town_resolver import get_town_resolver
+
+    steps = [
+        ("imports", lambda: [importlib.import_module(name) for name in LAZY_MODULES]),
+        ("city_graph", lambda: len(city_graph)),
+        ("town_resolver", get_town_resolver),
+        ("nlu_client", get_nlu_client),
+        ("handyman_directory", lambda: get_handyman_directory().records()),
+        ("expertise_index", get_expertise_index),
+        ("spatial_index", get_handyman_spatial_index),
+        ("busy_slot_index", get_busy_slot_index),
+        ("booking_config", get_booking_config),
+        ("availability_engine", get_availability_engine),
+    ]
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            # Loaded again on first use
+            log.error("Error warming up %s: %s", name, e)
+        timings[name] = time.perf_counter() - start
+    index = get_busy_slot_index()
+    if index._mirror is not None:
+        start = time.perf_counter()
+        index._mirror.records()
+        timings["busy_slot_index"] += time.perf_counter() - start
+    log.info("Warmed up in %.2fs: %s", sum(timings.values()),
+             ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
+
+
+def start_background_warm_up():
+    """Run warm_up() on a daemon thread (unless ACTION_SERVER_WARMUP=0); return the thread or None"""
+    if os.environ.get("ACTION_SERVER_WARMUP", "1") == "0":
+        return None
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,139 @@
+"""
+Benchmark handyman availability.
+
+Seeds the in-memory database (actions/fake_rtdb.py) with synthetic handymen
+and jobs over the next week, follows /jobs with a BusySlotIndex, then times:
+
+    weekly    7-day free-slot grid for every handyman: the original per-handyman
+              loop (slot lists and .remove()) vs one AvailabilityEngine.free_masks call
+    first-N   the first N handymen, in rating order, free at one (date, slot):
+              checking candidates one by one vs AvailabilityEngine.first_free
+
+and checks that both ways give the same answers.
+
+Run from the "Rasa AI" directory:
+
+    python -m benchmarks.availability
+    python -m benchmarks.availability --handymen 5000 --jobs 200000 --first 10
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from actions import rtdb
+from actions.availability import AvailabilityEngine, SLOTS, mask_slots
+from actions.fake_rtdb import FakeDatabase
+from actions.job_index import BusySlotIndex
+from actions.rtdb import TreeMirror
+
+STATUSES = ["Pending", "Pending", "Pending", "In-Progress", "Completed", "Cancelled"]
+
+
+def seed(handymen, jobs, rng):
+    today = datetime.now().date()
+    data = {"jobs": {}}
+    for i in range(jobs):
+        day = today + timedelta(days=rng.randrange(7))
+        slot = rng.choice(SLOTS)
+        hour = {"Slot 1": "08", "Slot 2": "13", "Slot 3": "18"}[slot]
+        data["jobs"][f"j{i}"] = {
+            "assigned_to": f"h{rng.randrange(handymen)}",
+            "status": rng.choice(STATUSES),
+            "starttimestamp": f"{day.isoformat()}T{hour}:00:00.000Z",
+            "assigned_slot": slot,
+        }
+    return data
+
+
+def original_weekly(busy_index, handyman_id, today):
+    """The per-handyman loop the actions used to run"""
+    available_schedule = []
+    for i in range(7):
+        current_date = today + timedelta(days=i)
+        available_slots = list(SLOTS)
+        for booked_slot in busy_index.busy_slots(handyman_id, current_date.date()):
+            if booked_slot in available_slots:
+                available_slots.remove(booked_slot)
+        if current_date.date() == today.date():
+            current_hour = today.hour
+            if current_hour >= 12:
+                if "Slot 1" in available_slots:
+                    available_slots.remove("Slot 1")
+            if current_hour >= 17:
+                if "Slot 2" in available_slots:
+                    available_slots.remove("Slot 2")
+            if current_hour >= 22:
+                if "Slot 3" in available_slots:
+                    available_slots.remove("Slot 3")
+        if available_slots:
+            available_schedule.append((current_date.strftime('%Y-%m-%d'), available_slots))
+    return available_schedule
+
+
+def original_first_free(busy_index, handyman_ids, day, slot, n):
+    found = []
+    for handyman_id in handyman_ids:
+        if slot not in busy_index.busy_slots(handyman_id, day):
+            found.append(handyman_id)
+            if len(found) >= n:
+                break
+    return found
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handymen', type=int, default=5000)
+    parser.add_argument('--jobs', type=int, default=200000)
+    parser.add_argument('--first', type=int, default=10, help="N for the first-N query")
+    parser.add_argument('--queries', type=int, default=50, help="Number of first-N queries")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"Seeding {args.handymen} handymen and {args.jobs} jobs...", flush=True)
+    rtdb.use_backend(FakeDatabase(seed(args.handymen, args.jobs, rng)))
+    busy_index = BusySlotIndex(TreeMirror('/jobs'))
+    load_time, _ = timed(busy_index.busy_slots, "h0", datetime.now().date())
+    print(f"Index loaded in {load_time:.2f}s")
+    engine = AvailabilityEngine(busy_index)
+    handyman_ids = [f"h{i}" for i in range(args.handymen)]
+
+    # Weekly grid for every handyman
+    now = datetime.today()
+    dates = [(now + timedelta(days=i)).date() for i in range(7)]
+    old_time, old_weekly = timed(lambda: [original_weekly(busy_index, h, now) for h in handyman_ids])
+    new_time, masks = timed(engine.free_masks, handyman_ids, dates, now)
+    new_weekly = [
+        [(day.isoformat(), mask_slots(int(mask))) for day, mask in zip(dates, row) if mask]
+        for row in masks
+    ]
+    weekly_ok = old_weekly == new_weekly
+
+    # First N free handymen at random (date, slot), candidates in a random "rating" order
+    queries = []
+    for _ in range(args.queries):
+        order = handyman_ids[:]
+        rng.shuffle(order)
+        queries.append((order, rng.choice(dates[1:]), rng.choice(SLOTS)))
+    old_first_time, old_first = timed(
+        lambda: [original_first_free(busy_index, ids, day, slot, args.first) for ids, day, slot in queries])
+    new_first_time, new_first = timed(
+        lambda: [engine.first_free(ids, day, slot, n=args.first, now=now) for ids, day, slot in queries])
+    first_ok = old_first == new_first
+
+    print(f"{'query':>8} {'original':>10} {'engine':>10} {'speedup':>8}  same answers")
+    print(f"{'weekly':>8} {old_time:>9.3f}s {new_time:>9.3f}s {old_time / new_time:>7.1f}x  {weekly_ok}")
+    print(f"{'first-N':>8} {old_first_time:>9.3f}s {new_first_time:>9.3f}s "
+          f"{old_first_time / new_first_time:>7.1f}x  {first_ok}")
+    print(f"weekly: {args.handymen} handymen x 7 days; first-N: {args.queries} queries, N={args.first}")
+
+
+if __name__ == '__main__':
+    main()
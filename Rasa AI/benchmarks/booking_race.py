@@ -0,0 +1,159 @@
+"""
+Concurrency check for booking confirmation.
+
+Many users confirm the same handyman slot at the same moment, against the
+in-memory database (actions/fake_rtdb.py) with a simulated round-trip
+latency. Exactly one of them must get the booking; everyone else must be told
+the slot was taken, and no fee may be charged without a job. Each round
+races for a new slot, then cancels the booking and checks that the slot can
+be booked again.
+
+Run from the "Rasa AI" directory:
+
+    python -m benchmarks.booking_race
+    python -m benchmarks.booking_race --users 50 --rounds 20 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from rasa_sdk import Tracker
+from rasa_sdk.executor import CollectingDispatcher
+
+from actions import actions as handygo_actions
+from actions import rtdb
+from actions.booking_writes import slot_lock_path
+from actions.booking_config import reset_booking_config
+from actions.fake_rtdb import FakeDatabase
+from actions.handyman_directory import reset_handyman_directory
+from actions.handyman_summary import summary_tree
+from actions.job_index import reset_busy_slot_index
+from actions.user_profiles import reset_user_profiles
+
+SLOTS = ["Slot 1", "Slot 2", "Slot 3"]
+
+
+def seed(users):
+    data = {
+        "handymen": {"h1": {"name": "Ali Plumb", "expertise": ["Plumber"], "status": "active", "city": "Cheras"}},
+        "users": {},
+        "fare": {"amount": 20},
+    }
+    for i in range(users):
+        data["users"][f"u{i}"] = {"name": f"User {i}", "wallet": 100, "primaryAddress": {"city": "Cheras"}}
+    data["handymenSummary"] = summary_tree(data["handymen"])
+    return data
+
+
+def confirm_tracker(sender, day, slot):
+    slots = {"handyman_name": "Ali Plumb", "handyman_id": "h1", "chosen_date": day,
+             "chosen_slot": slot, "problem": "plumber"}
+    latest = {"text": "", "intent": {"name": "confirm_booking", "confidence": 0.9}, "entities": []}
+    return Tracker(sender, slots, latest, [], False, None, {}, "action_listen")
+
+
+def race(users, day, slot):
+    """Confirm the same slot from every user at once; return {sender: booking_id or None}"""
+    barrier = threading.Barrier(users)
+    outcomes = {}
+
+    def confirm(sender):
+        dispatcher = CollectingDispatcher()
+        barrier.wait()
+        events = handygo_actions.ActionConfirmBooking().run_sync(dispatcher, confirm_tracker(sender, day, slot), {})
+        booked = [e["value"] for e in events if e.get("name") == "booking_id"]
+        outcomes[sender] = booked[0] if booked else None
+
+    threads = [threading.Thread(target=confirm, args=(f"u{i}",)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def cancel(booking_id):
+    dispatcher = CollectingDispatcher()
+    slots = {"booking_id": booking_id}
+    tracker = Tracker("u0", slots, {"text": "", "intent": {}, "entities": []}, [], False, None, {}, "action_listen")
+    handygo_actions.ActionCancelBooking().run_sync(dispatcher, tracker, {})
+
+
+def check_round(database, outcomes, day, slot):
+    """Return a list of problems with the database after one race"""
+    problems = []
+    winners = [b for b in outcomes.values() if b]
+    jobs = database.reference("/jobs").get() or {}
+    live = [j for j, job in jobs.items()
+            if job.get("status") == "Pending" and job.get("starttimestamp", "").startswith(day)
+            and job.get("assigned_slot") == slot]
+    txns = database.reference("/walletTransactions").get() or {}
+    fees = [t for t in txns.values() if t.get("bookingId") in jobs]
+
+    if len(winners) != 1:
+        problems.append(f"{len(winners)} users were told they booked {day} {slot}")
+    if len(live) != 1:
+        problems.append(f"{len(live)} pending jobs for {day} {slot}")
+    if len(fees) != len(txns):
+        problems.append(f"{len(txns) - len(fees)} fees charged without a job")
+    lock = database.reference("/" + slot_lock_path("h1", day, slot)).get() or {}
+    if winners and (lock.get("booking_id") != winners[0] or not lock.get("confirmed")):
+        problems.append(f"lock for {day} {slot} is {lock}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help="Users racing for each slot")
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.01, help="Seconds per database round trip")
+    args = parser.parse_args()
+
+    database = FakeDatabase(seed(args.users), latency=args.latency)
+    rtdb.use_backend(database)
+    reset_handyman_directory()
+    reset_busy_slot_index()
+    reset_booking_config()
+    reset_user_profiles()
+
+    start_day = datetime.now().date() + timedelta(days=1)
+    failures = 0
+    print(f"{args.users} users per slot, {args.rounds} rounds, {args.latency * 1000:.0f} ms per round trip")
+    print(f"{'round':>5} {'slot':>20} {'booked':>7} {'taken':>6} {'time':>8}  result")
+    for n in range(args.rounds):
+        day = (start_day + timedelta(days=n // len(SLOTS))).isoformat()
+        slot = SLOTS[n % len(SLOTS)]
+
+        began = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcomes = race(args.users, day, slot)
+        elapsed = time.perf_counter() - began
+        problems = check_round(database, outcomes, day, slot)
+
+        # The slot must be free again once the winner cancels
+        winner = next((b for b in outcomes.values() if b), None)
+        if winner:
+            with contextlib.redirect_stdout(io.StringIO()):
+                cancel(winner)
+                rebooked = race(1, day, slot)
+            if not rebooked["u0"]:
+                problems.append("slot could not be booked again after cancelling")
+            else:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    cancel(rebooked["u0"])
+
+        booked = sum(1 for b in outcomes.values() if b)
+        failures += bool(problems)
+        print(f"{n:>5} {day + ' ' + slot:>20} {booked:>7} {len(outcomes) - booked:>6} "
+              f"{elapsed * 1000:>6.0f}ms  {'; '.join(problems) or 'ok'}", flush=True)
+
+    print(f"{args.rounds - failures}/{args.rounds} rounds ok")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Benchmark the city proximity graph build.
+
+Compares the original row-by-row build (pandas iterrows over every pair of
+towns) with the vectorized build in actions/map_cal.py on synthetic towns
+spread over Peninsular Malaysia.
+
+The row-by-row build is quadratic, so above --full-limit towns it is timed on
+a sample of outer rows and extrapolated to the full size (marked with ~).
+Dense inputs can have tens of millions of neighbour pairs; the dict graph is
+only built (and counted in the speedup) below --graph-pair-limit pairs,
+otherwise the speedup is for the CSR arrays alone.
+
+Run from the "Rasa AI" directory:
+
+    python -m benchmarks.city_graph
+    python -m benchmarks.city_graph --sizes 100 10000 50000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from actions import map_cal
+
+
+def synthetic_towns(n, seed=0):
+    """DataFrame of n towns with Town/Lat/Lon columns"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Town': [f"Town {i}" for i in range(n)],
+        'Lat': rng.uniform(1.3, 6.7, n),
+        'Lon': rng.uniform(100.1, 104.3, n),
+    })
+
+
+def rowwise_build(df, radius_km=50, outer_rows=None):
+    """The original build, optionally limited to the first outer_rows rows"""
+    city_graph = {}
+    for i, row in df.iterrows():
+        if outer_rows is not None and i >= outer_rows:
+            break
+        city = row['Town'].lower()
+        city_graph[city] = {}
+        for j, other in df.iterrows():
+            if i == j:
+                continue
+            distance = map_cal.haversine(row['Lat'], row['Lon'], other['Lat'], other['Lon'])
+            if distance <= radius_km:
+                city_graph[city][other['Town'].lower()] = round(distance, 2)
+    return city_graph
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 50000])
+    parser.add_argument('--radius', type=float, default=50)
+    parser.add_argument('--full-limit', type=int, default=500,
+                        help="Largest size the row-by-row build is run on in full")
+    parser.add_argument('--graph-pair-limit', type=int, default=5_000_000,
+                        help="Skip building the dict graph when there are more neighbour pairs than this")
+    parser.add_argument('--sample-rows', type=int, default=20,
+                        help="Outer rows timed when extrapolating the row-by-row build")
+    args = parser.parse_args()
+
+    print(f"{'towns':>8} {'row-by-row':>14} {'arrays':>10} {'graph':>10} {'pairs':>12} {'speedup':>10}")
+    for n in args.sizes:
+        df = synthetic_towns(n)
+
+        if n <= args.full_limit:
+            old_time, old_graph = time_call(rowwise_build, df, args.radius)
+            old_label = f"{old_time:.3f}s"
+        else:
+            sample = min(args.sample_rows, n)
+            sample_time, _ = time_call(rowwise_build, df, args.radius, outer_rows=sample)
+            old_time, old_graph = sample_time * n / sample, None
+            old_label = f"~{old_time:.1f}s"
+
+        array_time, (indptr, indices, distances) = time_call(
+            map_cal.build_neighbour_arrays, df['Lat'], df['Lon'], args.radius)
+        del indptr, distances
+        pairs = len(indices)
+        del indices
+
+        if pairs <= args.graph_pair_limit:
+            graph_time, new_graph = time_call(
+                map_cal.build_city_graph, df['Town'], df['Lat'], df['Lon'], args.radius)
+            graph_label = f"{graph_time:.3f}s"
+            if old_graph is not None and old_graph != new_graph:
+                print(f"  WARNING: graphs differ for {n} towns")
+            del new_graph
+        else:
+            graph_time, graph_label = array_time, "skipped"
+
+        print(f"{n:>8} {old_label:>14} {array_time:>9.3f}s {graph_label:>10} "
+              f"{pairs:>12} {old_time / graph_time:>9.0f}x", flush=True)
+
+
+if __name__ == '__main__':
+    main()
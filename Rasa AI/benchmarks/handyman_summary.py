@@ -0,0 +1,138 @@
+"""
+Bytes read from the database per turn, with the handyman directory loading
+the full /handymen records or the /handymenSummary projection.
+
+Seeds the in-memory database (actions/fake_rtdb.py) with handymen that carry
+the fields the backend stores on top of what matching reads (contact details,
+password hash, bank details, wallet, availability flags, FCM token...),
+builds the projection, and replays the same generated conversations (see
+benchmarks/replay.py) once per source. Read sizes come from the
+handygo_rtdb_payload_bytes metric, so they cover every read the actions make.
+
+Run from the "Rasa AI" directory:
+
+    python -m benchmarks.handyman_summary
+    python -m benchmarks.handyman_summary --handymen 5000 --conversations 500 --poll
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+from collections import defaultdict
+from datetime import datetime
+
+from actions import actions as handygo_actions
+from actions import metrics, rtdb
+from actions.booking_config import reset_booking_config
+from actions.expertise_index import reset_expertise_index
+from actions.fake_rtdb import FakeDatabase
+from actions.handyman_directory import reset_handyman_directory
+from actions.handyman_summary import summary_tree
+from actions.job_index import reset_busy_slot_index
+from actions.spatial_index import reset_handyman_spatial_index
+from actions.user_profiles import reset_user_profiles
+from benchmarks.load_actions import seed
+from benchmarks.replay import (
+    ExampleClassifier, action_registry, cast_message, entity_slots, nlu_examples, replay, story_conversations,
+)
+
+STATES = ["Selangor", "Kuala Lumpur", "Johor", "Penang"]
+BANKS = ["Maybank", "CIMB", "Public Bank", "RHB"]
+
+
+def backend_fields(handyman_id, rng):
+    """Fields the handyman backend and app keep on a record that matching never reads"""
+    return {
+        "phone": f"01{rng.randrange(10**8, 10**9)}",
+        "email": f"{handyman_id}@example.com",
+        "password": "$2b$10$" + "".join(rng.choices("./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789", k=53)),
+        "state": rng.choice(STATES),
+        "availability": rng.random() < 0.5,
+        "isAvailable": rng.random() < 0.5,
+        "bankName": rng.choice(BANKS),
+        "accountNumber": str(rng.randrange(10**11, 10**12)),
+        "wallet": round(rng.uniform(0, 2000), 2),
+        "profileImage": f"https://firebasestorage.googleapis.com/v0/b/handygo/o/profiles%2F{handyman_id}.jpg"
+                        f"?alt=media&token={rng.getrandbits(128):032x}",
+        "fcmToken": "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-:", k=163)),
+        "lastSeen": 1748000000000 + rng.randrange(10**9),
+        "lastStatusUpdate": 1748000000000 + rng.randrange(10**9),
+    }
+
+
+def run_source(source, data, conversations, users, actions, mappings, poll):
+    """Replay conversations with the directory on source; return (turns, bytes per path)"""
+    os.environ['HANDYMAN_SOURCE'] = source
+    if poll:
+        # Every turn checks the node again, as a short cache TTL would
+        os.environ['HANDYMAN_CACHE_MODE'] = 'poll'
+        os.environ['HANDYMAN_CACHE_TTL'] = '0'
+    rtdb.use_backend(FakeDatabase(data))
+    reset_handyman_directory()
+    reset_busy_slot_index()
+    reset_booking_config()
+    reset_user_profiles()
+    reset_expertise_index()
+    reset_handyman_spatial_index()
+    metrics.clear()
+    # Every read counts here, however the server samples them
+    metrics.PAYLOAD_SAMPLE_RATE = 1
+
+    _, timings, _ = asyncio.run(replay(conversations, users, actions, mappings, 1))
+    turns = sum(len(values) for values in timings.values())
+    by_path = defaultdict(lambda: [0, 0])
+    for (_, path), (count, total) in metrics.RTDB_PAYLOAD.snapshot().items():
+        by_path[path][0] += count
+        by_path[path][1] += total
+    return turns, dict(by_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handymen', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--jobs', type=int, default=5000)
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--poll', action='store_true',
+                        help="Poll the directory node every turn instead of following it with a listener")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger("actions").setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    actions = action_registry()
+    examples = nlu_examples()
+    handygo_actions.classify_text_with_rasa_server = ExampleClassifier(examples, sorted(handygo_actions.expertise_mapping))
+
+    data = seed(args.handymen, args.users, args.jobs, random.Random(args.seed),
+                expertise=sorted(set(handygo_actions.expertise_mapping.values())))
+    for handyman_id, record in data["handymen"].items():
+        record.update(backend_fields(handyman_id, rng))
+    data["handymenSummary"] = summary_tree(data["handymen"])
+
+    today = datetime.now().date()
+    handyman_ids = sorted(data["handymen"])
+    conversations = [
+        [(cast_message(message, handyman_ids, rng, today), names) for message, names in exchanges]
+        for exchanges in story_conversations(args.conversations, examples, actions, rng)
+    ]
+    mappings = entity_slots()
+
+    print(f"{len(conversations)} conversations, {args.handymen} handymen, "
+          f"{'polling' if args.poll else 'listening to'} the directory node")
+    print(f"{'source':>8} {'turns':>6} {'handyman bytes':>15} {'other bytes':>12} {'total bytes':>12} {'bytes/turn':>11}")
+    results = {}
+    for source in ("full", "summary"):
+        turns, by_path = run_source(source, data, conversations, args.users, actions, mappings, args.poll)
+        handyman_bytes = sum(total for path, (_, total) in by_path.items() if path.startswith("/handymen"))
+        total_bytes = sum(total for _, total in by_path.values())
+        results[source] = total_bytes / turns if turns else 0
+        print(f"{source:>8} {turns:>6} {handyman_bytes:>15,} {total_bytes - handyman_bytes:>12,} "
+              f"{total_bytes:>12,} {results[source]:>11,.0f}")
+    if results["full"]:
+        print(f"Bytes per turn down {1 - results['summary'] / results['full']:.0%} with the summary node")
+
+
+if __name__ == '__main__':
+    main()
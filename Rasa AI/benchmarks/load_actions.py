@@ -0,0 +1,177 @@
+"""
+Concurrent-conversation load test for the action server.
+
+Runs many conversations at once against the in-memory database
+(actions/fake_rtdb.py) with a simulated round-trip latency on every read and
+write. All conversations start together; the report shows turn throughput
+and the time each conversation took to complete, in two modes:
+
+    blocking  each action body runs directly on the event loop, as the
+              synchronous run() methods did before
+    async     each action awaits run(), which moves the body to the shared
+              I/O pool (actions/io_pool.py)
+
+The NLU call inside ActionEasyBook is replaced by a stand-in that sleeps for
+--nlu-latency seconds, so the test doesn't need a running Rasa server.
+
+Run from the "Rasa AI" directory:
+
+    python -m benchmarks.load_actions
+    python -m benchmarks.load_actions --conversations 200 --latency 0.03
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from rasa_sdk import Tracker
+from rasa_sdk.executor import CollectingDispatcher
+
+from actions import actions as handygo_actions
+from actions import rtdb
+from actions.booking_config import reset_booking_config
+from actions.fake_rtdb import FakeDatabase
+from actions.handyman_directory import reset_handyman_directory
+from actions.handyman_summary import summary_tree
+from actions.job_index import reset_busy_slot_index
+from actions.user_profiles import reset_user_profiles
+
+CITIES = [
+    ("Cheras", 3.0586, 101.7405),
+    ("Petaling Jaya", 3.1073, 101.6067),
+    ("Shah Alam", 3.0738, 101.5183),
+    ("Ampang", 3.1500, 101.7600),
+    ("Kajang", 2.9935, 101.7870),
+]
+EXPERTISE = ["Plumber", "Electrician", "AC Repair", "Carpenter", "Painter"]
+SLOTS = ["Slot 1", "Slot 2", "Slot 3"]
+
+
+def seed(handymen, users, jobs, rng, expertise=EXPERTISE):
+    """Build database contents with the shapes the actions read (handymen get two of expertise)"""
+    data = {"handymen": {}, "users": {}, "jobs": {}, "fare": {"amount": 20}}
+    for i in range(handymen):
+        city, lat, lon = rng.choice(CITIES)
+        data["handymen"][f"h{i}"] = {
+            "name": f"Handyman {i}",
+            "expertise": rng.sample(expertise, 2),
+            "status": "active",
+            "city": city,
+            "rating": rng.randint(1, 5),
+            "latitude": lat + rng.uniform(-0.05, 0.05),
+            "longitude": lon + rng.uniform(-0.05, 0.05),
+        }
+    for i in range(users):
+        city, lat, lon = rng.choice(CITIES)
+        data["users"][f"u{i}"] = {
+            "name": f"User {i}",
+            "wallet": 100,
+            "primaryAddress": {"city": city, "streetName": "Jalan 1", "latitude": lat, "longitude": lon},
+        }
+    today = datetime.now().date()
+    for i in range(jobs):
+        day = today + timedelta(days=rng.randint(0, 6))
+        data["jobs"][f"j{i}"] = {
+            "assigned_to": f"h{rng.randrange(handymen)}",
+            "status": "Pending",
+            "starttimestamp": f"{day.isoformat()}T13:00:00.000Z",
+            "assigned_slot": rng.choice(SLOTS),
+        }
+    # The actions read handymen through the summary node
+    data["handymenSummary"] = summary_tree(data["handymen"])
+    return data
+
+
+def make_tracker(sender, text, slots=None, intent="easy_book"):
+    latest = {"text": text, "intent": {"name": intent, "confidence": 0.9}, "entities": [], "intent_ranking": []}
+    return Tracker(sender, slots or {}, latest, [], False, None, {}, "action_listen")
+
+
+def conversation_turns(sender, rng):
+    """A short conversation: easy booking, a suggestion and a schedule check"""
+    handyman = f"Handyman {rng.randrange(10)}"
+    return [
+        (handygo_actions.ActionEasyBook(), make_tracker(sender, "I want to book a plumber tomorrow at 2pm")),
+        (handygo_actions.ActionSuggestHandyman(), make_tracker(sender, "my pipe leaks", intent="report_issue_plumber")),
+        (handygo_actions.ActionCheckHandymanSchedule(), make_tracker(sender, "", {"handyman_name": handyman})),
+    ]
+
+
+async def run_turn(action, tracker, mode):
+    dispatcher = CollectingDispatcher()
+    if mode == "blocking":
+        return action.run_sync(dispatcher, tracker, {})
+    return await action.run(dispatcher, tracker, {})
+
+
+async def run_conversation(sender, mode, rng, start, latencies):
+    # Every conversation arrives at start, so the time to finish includes any
+    # time spent waiting behind other conversations
+    for action, tracker in conversation_turns(sender, rng):
+        await run_turn(action, tracker, mode)
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_load(mode, conversations, users, seed_value):
+    """Return (wall seconds, seconds each conversation took to complete)"""
+    rng = random.Random(seed_value)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_conversation(f"u{i % users}", mode, random.Random(rng.random()), start, latencies)
+        for i in range(conversations)
+    ))
+    return time.perf_counter() - start, latencies
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--handymen', type=int, default=500)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds per database round trip")
+    parser.add_argument('--nlu-latency', type=float, default=0.05, help="Seconds per NLU parse")
+    parser.add_argument('--modes', nargs='+', default=["blocking", "async"], choices=["blocking", "async"])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    def classify(text):
+        time.sleep(args.nlu_latency)
+        return "report_issue_plumber", 0.9
+
+    handygo_actions.classify_text_with_rasa_server = classify
+    data = seed(args.handymen, args.users, args.jobs, random.Random(args.seed))
+
+    print(f"{args.conversations} conversations x 3 turns, {args.latency * 1000:.0f} ms per database "
+          f"round trip, {args.nlu_latency * 1000:.0f} ms per NLU parse")
+    print(f"{'':>30} conversation completion")
+    print(f"{'mode':>10} {'wall':>9} {'turns/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for mode in args.modes:
+        # Fresh database and caches so both modes start cold
+        rtdb.use_backend(FakeDatabase(data, latency=args.latency))
+        reset_handyman_directory()
+        reset_busy_slot_index()
+        reset_booking_config()
+        reset_user_profiles()
+
+        # The actions print a lot; keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            wall, latencies = asyncio.run(run_load(mode, args.conversations, args.users, args.seed))
+        turns = 3 * len(latencies)
+        print(f"{mode:>10} {wall:>8.2f}s {turns / wall:>9.1f} "
+              f"{statistics.median(latencies) * 1000:>7.0f}ms {percentile(latencies, 0.95) * 1000:>7.0f}ms "
+              f"{percentile(latencies, 0.99) * 1000:>7.0f}ms", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark easy-book message parsing.
+
+Compares the original parsing in ActionEasyBook (pattern lists rebuilt per
+message and applied one re.sub()/re.search() at a time) with
+actions/message_parser.py on the NLU examples, and checks that both give the
+same result for every example.
+
+Run from the "Rasa AI" directory:
+
+    python -m benchmarks.parse_messages
+    python -m benchmarks.parse_messages --corpus data/nlu_booking.yml --repeat 50
+"""
+import argparse
+import re
+import time
+from datetime import datetime, timedelta
+
+from actions.message_parser import parse_booking_message
+
+DEFAULT_CORPUS = "data/nlu_easy_book.yml"
+
+
+def load_nlu_examples(path):
+    """Example texts of every intent in a Rasa NLU YAML file"""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith("- ") and not stripped.startswith(("- intent:", "- synonym:", "- regex:", "- lookup:")):
+                examples.append(stripped[2:])
+    return examples
+
+
+def original_parse(user_message, now):
+    """The original parsing steps of ActionEasyBook, without the prints"""
+    date_time_patterns = [
+        r'\d{1,2}[/-]\d{1,2}',
+        r'\d{1,2}(?::\d{2})?\s*(?:am|pm|AM|PM)?',
+        r'(?:at|on)\s+\d{1,2}[/-]\d{1,2}',
+        r'(?:at|on)\s+\d{1,2}(?::\d{2})?\s*(?:am|pm|AM|PM)?',
+        r'tomorrow',
+        r'today',
+        r'next week',
+        r'next month'
+    ]
+    original_message = user_message
+    problem_only_text = user_message
+    for pattern in date_time_patterns:
+        problem_only_text = re.sub(pattern, '', problem_only_text, flags=re.IGNORECASE)
+
+    booking_phrases = [
+        r'i want to book', r'i wanna book', r'i need to book', r'book a', r'book an',
+        r'schedule a', r'schedule an', r'i want to schedule', r'i need a handyman', r'i need a',
+        r'please book' r'please schedule', r'Book Handyman', r'Book a handyman', r'Book an expert',
+        r'Book a service', r'Book a technician', r'Book a repair',
+    ]
+    for phrase in booking_phrases:
+        problem_only_text = re.sub(phrase, '', problem_only_text, flags=re.IGNORECASE)
+    problem_only_text = re.sub(r'\s+', ' ', problem_only_text).strip()
+
+    date_match = re.search(r'(\d{1,2})[/-](\d{1,2})', original_message)
+    extracted_date = None
+    if date_match:
+        day, month = int(date_match.group(1)), int(date_match.group(2))
+        try:
+            extracted_date = datetime(now.year, month, day).strftime('%Y-%m-%d')
+        except ValueError:
+            try:
+                extracted_date = datetime(now.year, day, month).strftime('%Y-%m-%d')
+            except ValueError:
+                pass
+    if not extracted_date:
+        extracted_date = (now + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    time_match = re.search(r'\b(\d{1,2})(?::(\d{2}))?\s*([aApP][mM])\b', original_message)
+    if not time_match:
+        time_match = re.search(r'\b(\d{1,2}):(\d{2})\b', original_message)
+    slot = None
+    extracted_time = None
+    if time_match:
+        hour = int(time_match.group(1))
+        if len(time_match.groups()) > 2 and time_match.group(3):
+            minute = int(time_match.group(2)) if time_match.group(2) else 0
+            am_pm = time_match.group(3)
+        else:
+            minute = int(time_match.group(2))
+            am_pm = None
+        if am_pm and am_pm.lower() == 'pm' and hour < 12:
+            hour += 12
+        elif am_pm and am_pm.lower() == 'am' and hour == 12:
+            hour = 0
+        period = "AM" if hour < 12 else "PM"
+        display_hour = hour if hour <= 12 else hour - 12
+        display_hour = 12 if display_hour == 0 else display_hour
+        extracted_time = f"{display_hour}:{minute:02d} {period}"
+        if 8 <= hour < 12:
+            slot = "Slot 1"
+        elif 12 <= hour < 17:
+            slot = "Slot 2"
+        elif 17 <= hour < 22:
+            slot = "Slot 3"
+    if not slot:
+        slot = "Slot 2"
+    return problem_only_text, extracted_date, extracted_time, slot
+
+
+def compiled_parse(user_message, now):
+    parsed = parse_booking_message(user_message, now)
+    return parsed.problem_text, parsed.date, parsed.time, parsed.slot
+
+
+def time_parser(parse, examples, now, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in examples:
+            parse(text, now)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="Rasa NLU YAML file with the examples")
+    parser.add_argument('--repeat', type=int, default=200, help="Passes over the examples")
+    args = parser.parse_args()
+
+    examples = load_nlu_examples(args.corpus)
+    now = datetime.now()
+
+    mismatches = [text for text in examples if original_parse(text, now) != compiled_parse(text, now)]
+    for text in mismatches[:10]:
+        print(f"MISMATCH {text!r}: {original_parse(text, now)} != {compiled_parse(text, now)}")
+
+    calls = len(examples) * args.repeat
+    old_time = time_parser(original_parse, examples, now, args.repeat)
+    new_time = time_parser(compiled_parse, examples, now, args.repeat)
+    print(f"{len(examples)} examples from {args.corpus} x {args.repeat}, {len(mismatches)} mismatches")
+    print(f"{'parser':>10} {'total':>9} {'per msg':>10}")
+    print(f"{'original':>10} {old_time:>8.3f}s {old_time / calls * 1e6:>8.1f}us")
+    print(f"{'compiled':>10} {new_time:>8.3f}s {new_time / calls * 1e6:>8.1f}us")
+    print(f"speedup {old_time / new_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,457 @@
+"""
+Offline replay benchmark for the actions.
+
+Replays conversations against the custom actions with the in-memory database
+(actions/fake_rtdb.py) seeded with synthetic /handymen, /jobs, /users and
+/fare data, and reports latency percentiles per action and turn throughput.
+Nothing goes over the network (the NLU call inside ActionEasyBook is answered
+from the NLU training examples), so it runs in CI.
+
+Conversations come from:
+
+    stories   generated from data/stories.yml and data/rules.yml, with the
+              user messages taken from the NLU examples (default)
+    tracker   the recorded conversations of a tracker store (--tracker-store,
+              default the SQLite rasa.db), each replayed --repeat times
+
+Each user message fills slots through the from_entity mappings of domain.yml
+and the slots an action returns carry over to the next turn, as they do in
+Rasa. Handyman names and booking dates in the messages are swapped for
+synthetic handymen and dates in the coming week, so the turns find data.
+
+Run from the "Rasa AI" directory:
+
+    python -m benchmarks.replay
+    python -m benchmarks.replay --source tracker --scale medium
+    python -m benchmarks.replay --handymen 20000 --jobs 200000 --concurrency 16
+
+To catch regressions, save a report and compare later runs against it; the
+run exits with status 1 if an action's p95 or the throughput got worse than
+--tolerance allows:
+
+    python -m benchmarks.replay --output replay-baseline.json
+    python -m benchmarks.replay --baseline replay-baseline.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from rasa_sdk import Action, Tracker
+from rasa_sdk.executor import CollectingDispatcher
+from ruamel.yaml import YAML
+
+from actions import actions as handygo_actions
+from actions import rtdb
+from actions.booking_config import reset_booking_config
+from actions.expertise_index import reset_expertise_index
+from actions.fake_rtdb import FakeDatabase
+from actions.handyman_directory import reset_handyman_directory
+from actions.job_index import reset_busy_slot_index
+from actions.spatial_index import reset_handyman_spatial_index
+from actions.user_profiles import reset_user_profiles
+from benchmarks.load_actions import SLOTS, percentile, seed
+from scripts.tracker_stores import open_store
+
+# handymen, users, jobs
+SCALES = {
+    "small": (200, 100, 1_000),
+    "medium": (2_000, 1_000, 20_000),
+    "large": (20_000, 10_000, 200_000),
+}
+
+DATA_DIR = "data"
+DOMAIN_PATH = "domain.yml"
+
+# [text](entity) or [text]{"entity": "name", ...} in NLU examples
+ANNOTATION = re.compile(r'\[([^\]]+)\](?:\((\w+)\)|\{[^}]*"entity"\s*:\s*"(\w+)"[^}]*\})')
+WORD = re.compile(r"\w+")
+
+_yaml = YAML(typ="safe")
+
+
+def load_yaml(path):
+    with open(path, encoding="utf-8") as f:
+        return _yaml.load(f) or {}
+
+
+def user_message(text, intent, entities=(), metadata=None):
+    """latest_message of a user turn, shaped like Rasa's parse data"""
+    return {
+        "text": text,
+        "intent": {"name": intent, "confidence": 1.0},
+        "entities": [{"entity": e["entity"], "value": e["value"]} for e in entities],
+        "intent_ranking": [],
+        "metadata": dict(metadata or {}),
+    }
+
+
+# Domain and training data
+
+def action_registry():
+    """{action name: action instance} for every custom action in actions.py"""
+    registry = {}
+    for value in vars(handygo_actions).values():
+        if isinstance(value, type) and issubclass(value, Action) and value is not Action:
+            action = value()
+            registry[action.name()] = action
+    return registry
+
+
+def entity_slots(domain_path=DOMAIN_PATH):
+    """{entity: [slots it fills]} from the from_entity mappings of the domain"""
+    mappings = defaultdict(list)
+    for slot, spec in (load_yaml(domain_path).get("slots") or {}).items():
+        for mapping in (spec or {}).get("mappings") or []:
+            if mapping.get("type") == "from_entity" and mapping.get("entity"):
+                mappings[mapping["entity"]].append(slot)
+    return dict(mappings)
+
+
+def parse_example(example):
+    """(text, entities) of an annotated NLU example"""
+    entities = [
+        {"entity": match.group(2) or match.group(3), "value": match.group(1)}
+        for match in ANNOTATION.finditer(example)
+    ]
+    return ANNOTATION.sub(lambda match: match.group(1), example), entities
+
+
+def nlu_examples(data_dir=DATA_DIR):
+    """{intent: [(text, entities)]} from every nlu*.yml in data_dir"""
+    examples = defaultdict(list)
+    for path in sorted(glob.glob(os.path.join(data_dir, "nlu*.yml"))):
+        for item in load_yaml(path).get("nlu") or []:
+            if "intent" not in item:
+                continue
+            for line in (item.get("examples") or "").splitlines():
+                line = line.strip()
+                if line.startswith("- "):
+                    examples[item["intent"]].append(parse_example(line[2:]))
+    return dict(examples)
+
+
+class ExampleClassifier:
+    """
+    Offline stand-in for the Rasa NLU server.
+
+    Answers with the issue intent whose NLU examples share the most words with
+    the text (confidence is the share of the text's words matched), or
+    ("unknown", 0) if none do. Sleeps latency seconds per call.
+    """
+
+    def __init__(self, examples, intents, latency=0.0):
+        self.latency = latency
+        self._vocabulary = {
+            intent: {word for text, _ in examples.get(intent, ()) for word in WORD.findall(text.lower())}
+            for intent in intents
+        }
+
+    def __call__(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        words = set(WORD.findall((text or "").lower()))
+        if not words:
+            return "unknown", 0
+        scores = [(len(words & vocabulary), intent) for intent, vocabulary in self._vocabulary.items()]
+        matched, intent = max(scores, default=(0, None))
+        if not matched:
+            return "unknown", 0
+        return intent, matched / len(words)
+
+
+# Conversations
+#
+# A conversation is a list of exchanges: (user message, [custom actions the
+# message triggered]).
+
+def recorded_conversations(url, actions):
+    """Conversations of a tracker store, as lists of exchanges"""
+    store = open_store(url)
+    try:
+        for sender_id in store.senders():
+            exchanges = []
+            for event in store.load(sender_id):
+                kind = event.get("event")
+                if kind == "user":
+                    parse_data = event.get("parse_data") or {}
+                    intent = (parse_data.get("intent") or {}).get("name")
+                    exchanges.append((user_message(event.get("text") or "", intent, parse_data.get("entities") or ()), []))
+                elif kind == "rewind" and exchanges:
+                    # The message was rejected (fallback); Rasa forgets it
+                    exchanges.pop()
+                elif kind == "action" and exchanges and event.get("name") in actions:
+                    exchanges[-1][1].append(event["name"])
+            exchanges = [exchange for exchange in exchanges if exchange[1]]
+            if exchanges:
+                yield exchanges
+    finally:
+        store.close()
+
+
+def story_flows(data_dir=DATA_DIR):
+    """Step lists of every story and rule"""
+    flows = []
+    for name, key in (("stories.yml", "stories"), ("rules.yml", "rules")):
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path):
+            flows.extend(item["steps"] for item in load_yaml(path).get(key) or [] if item.get("steps"))
+    return flows
+
+
+def generated_conversation(flow, examples, actions, rng):
+    """Walk one story or rule, picking a branch of each 'or' and an example for each intent"""
+    exchanges = []
+    for step in flow:
+        if "or" in step:
+            step = rng.choice(step["or"])
+        if "intent" in step:
+            intent = step["intent"]
+            if examples.get(intent):
+                text, entities = rng.choice(examples[intent])
+            else:
+                text, entities = f"/{intent}", []
+            # Entities the story names but the example lacks get placeholder values
+            present = {entity["entity"] for entity in entities}
+            for entity in step.get("entities") or ():
+                name, value = next(iter(entity.items())) if isinstance(entity, dict) else (entity, entity)
+                if name not in present:
+                    entities = entities + [{"entity": name, "value": str(value)}]
+            exchanges.append((user_message(text, intent, entities), []))
+        elif step.get("action") in actions and exchanges:
+            exchanges[-1][1].append(step["action"])
+    return [exchange for exchange in exchanges if exchange[1]]
+
+
+def story_conversations(count, examples, actions, rng, data_dir=DATA_DIR):
+    """count conversations generated from the stories and rules (empty ones dropped)"""
+    flows = story_flows(data_dir)
+    conversations = [generated_conversation(rng.choice(flows), examples, actions, rng) for _ in range(count)]
+    return [exchanges for exchanges in conversations if exchanges]
+
+
+def cast_message(message, handymen, rng, today):
+    """
+    Point a message at the synthetic data: handyman names and ids become
+    synthetic handymen, booking dates fall in the coming week and slots are
+    real slot names.
+    """
+    message = dict(message, entities=[dict(entity) for entity in message["entities"]])
+    handyman_id = rng.choice(handymen)
+    for entity in message["entities"]:
+        old = entity["value"]
+        if entity["entity"] == "handyman_name":
+            entity["value"] = handyman_name(handyman_id)
+        elif entity["entity"] == "handyman_id":
+            entity["value"] = handyman_id
+        elif entity["entity"] == "chosen_date":
+            entity["value"] = (today + timedelta(days=rng.randint(1, 6))).isoformat()
+        elif entity["entity"] == "chosen_slot" and old not in SLOTS:
+            entity["value"] = rng.choice(SLOTS)
+        if isinstance(old, str) and old and old != entity["value"]:
+            message["text"] = message["text"].replace(old, str(entity["value"]))
+    return message
+
+
+def handyman_name(handyman_id):
+    # Same names as benchmarks.load_actions.seed
+    return f"Handyman {handyman_id[1:]}"
+
+
+# Replay
+
+def apply_events(slots, events):
+    """Update slots with the events an action returned"""
+    for event in events or ():
+        kind = event.get("event")
+        if kind == "slot":
+            slots[event.get("name")] = event.get("value")
+        elif kind in ("reset_slots", "restart"):
+            slots.clear()
+
+
+async def replay_conversation(exchanges, sender_id, actions, mappings, timings, errors):
+    slots = {}
+    for message, action_names in exchanges:
+        for entity in message["entities"]:
+            for slot in mappings.get(entity["entity"], ()):
+                slots[slot] = entity["value"]
+        for name in action_names:
+            tracker = Tracker(sender_id, dict(slots), message, [], False, None, {}, "action_listen")
+            start = time.perf_counter()
+            try:
+                events = await actions[name].run(CollectingDispatcher(), tracker, {})
+            except Exception as e:
+                errors[name].append(f"{type(e).__name__}: {e}")
+                continue
+            finally:
+                timings[name].append(time.perf_counter() - start)
+            apply_events(slots, events)
+
+
+async def replay(conversations, users, actions, mappings, concurrency):
+    """Replay every conversation, concurrency at a time; return (wall, timings, errors)"""
+    timings = defaultdict(list)
+    errors = defaultdict(list)
+    gate = asyncio.Semaphore(concurrency)
+
+    async def run(i, exchanges):
+        async with gate:
+            await replay_conversation(exchanges, f"u{i % users}", actions, mappings, timings, errors)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(i, exchanges) for i, exchanges in enumerate(conversations)))
+    return time.perf_counter() - start, timings, errors
+
+
+# Report
+
+def summarize(wall, timings, errors, config):
+    per_action = {}
+    for name in sorted(timings):
+        values = timings[name]
+        per_action[name] = {
+            "turns": len(values),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "mean_ms": statistics.fmean(values) * 1000,
+            "errors": len(errors.get(name, ())),
+        }
+    turns = sum(len(values) for values in timings.values())
+    return {
+        "config": config,
+        "actions": per_action,
+        "turns": turns,
+        "wall_seconds": wall,
+        "turns_per_second": turns / wall if wall else 0.0,
+    }
+
+
+def print_report(report):
+    print(f"{'action':<34} {'turns':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9} {'errors':>7}")
+    for name, row in report["actions"].items():
+        print(f"{name:<34} {row['turns']:>6} {row['p50_ms']:>7.2f}ms {row['p95_ms']:>7.2f}ms "
+              f"{row['p99_ms']:>7.2f}ms {row['mean_ms']:>7.2f}ms {row['errors']:>7}")
+    print(f"{report['turns']} turns in {report['wall_seconds']:.2f}s, {report['turns_per_second']:.1f} turns/s")
+
+
+def regressions(report, baseline, tolerance, min_delta_ms):
+    """Lines describing where report is worse than baseline by more than tolerance"""
+    found = []
+    for name, row in report["actions"].items():
+        before = baseline.get("actions", {}).get(name)
+        if before is None:
+            continue
+        limit = max(before["p95_ms"] * (1 + tolerance), before["p95_ms"] + min_delta_ms)
+        if row["p95_ms"] > limit:
+            found.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {row['p95_ms']:.2f}ms")
+    before = baseline.get("turns_per_second")
+    if before and report["turns_per_second"] < before * (1 - tolerance):
+        found.append(f"throughput: {before:.1f} -> {report['turns_per_second']:.1f} turns/s")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', choices=["stories", "tracker"], default="stories")
+    parser.add_argument('--tracker-store', default="sqlite:///rasa.db", help="Tracker store URL for --source tracker")
+    parser.add_argument('--conversations', type=int, default=200, help="Conversations generated from the stories")
+    parser.add_argument('--repeat', type=int, default=20, help="Replays of each recorded conversation")
+    parser.add_argument('--scale', choices=sorted(SCALES), default="small",
+                        help="Preset database size (handymen, users, jobs): " +
+                             ", ".join(f"{name}={sizes}" for name, sizes in SCALES.items()))
+    parser.add_argument('--handymen', type=int, help="Override the handymen of --scale")
+    parser.add_argument('--users', type=int, help="Override the users of --scale")
+    parser.add_argument('--jobs', type=int, help="Override the jobs of --scale")
+    parser.add_argument('--concurrency', type=int, default=1, help="Conversations replayed at once")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds per database round trip")
+    parser.add_argument('--nlu-latency', type=float, default=0.0, help="Seconds per NLU parse")
+    parser.add_argument('--warmup', type=int, default=5, help="Conversations replayed before timing")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default="WARNING", help="Level of the actions' logs during the run")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    parser.add_argument('--baseline', help="JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown against --baseline")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="p95 increases smaller than this never count as regressions")
+    args = parser.parse_args()
+
+    logging.getLogger("actions").setLevel(args.log_level.upper())
+    handymen, users, jobs = SCALES[args.scale]
+    handymen = args.handymen or handymen
+    users = args.users or users
+    jobs = args.jobs or jobs
+    rng = random.Random(args.seed)
+
+    actions = action_registry()
+    examples = nlu_examples()
+    issue_intents = sorted(handygo_actions.expertise_mapping)
+    handygo_actions.classify_text_with_rasa_server = ExampleClassifier(examples, issue_intents, args.nlu_latency)
+
+    data = seed(handymen, users, jobs, random.Random(args.seed),
+                expertise=sorted(set(handygo_actions.expertise_mapping.values())))
+    handyman_ids = sorted(data["handymen"])
+    today = datetime.now().date()
+
+    if args.source == "tracker":
+        recorded = list(recorded_conversations(args.tracker_store, actions))
+        if not recorded:
+            sys.exit(f"No conversations with custom actions in {args.tracker_store}")
+        conversations = [exchanges for _ in range(args.repeat) for exchanges in recorded]
+    else:
+        conversations = story_conversations(args.conversations, examples, actions, rng)
+    conversations = [
+        [(cast_message(message, handyman_ids, rng, today), names) for message, names in exchanges]
+        for exchanges in conversations
+    ]
+
+    rtdb.use_backend(FakeDatabase(data, latency=args.latency))
+    reset_handyman_directory()
+    reset_busy_slot_index()
+    reset_booking_config()
+    reset_user_profiles()
+    reset_expertise_index()
+    reset_handyman_spatial_index()
+    mappings = entity_slots()
+
+    print(f"{len(conversations)} {args.source} conversations against {handymen} handymen, {users} users, "
+          f"{jobs} jobs; concurrency {args.concurrency}, {args.latency * 1000:.0f} ms per database round trip")
+    if args.warmup:
+        asyncio.run(replay(conversations[:args.warmup], users, actions, mappings, args.concurrency))
+    wall, timings, errors = asyncio.run(replay(conversations, users, actions, mappings, args.concurrency))
+
+    config = {
+        "source": args.source, "conversations": len(conversations), "handymen": handymen, "users": users,
+        "jobs": jobs, "concurrency": args.concurrency, "latency": args.latency, "nlu_latency": args.nlu_latency,
+    }
+    report = summarize(wall, timings, errors, config)
+    print_report(report)
+    for name, messages in sorted(errors.items()):
+        print(f"{name} raised {len(messages)} times, first: {messages[0]}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.tolerance, args.min_delta_ms)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""
+Throughput of the pre-forked action server at 1, 2, 4 and 8 workers.
+
+For each worker count the benchmark starts the real HTTP server
+(actions/server.py in pre-fork mode, see actions/prefork.py) on the
+in-memory database (actions/fake_rtdb.py) seeded with synthetic data, and
+drives it with client processes that replay conversations generated from the
+stories (see benchmarks/replay.py) through POST /webhook, as the Rasa server
+would. Each client opens a new connection per conversation, so SO_REUSEPORT
+spreads the conversations over the workers.
+
+Reported per worker count: turns per second, the speedup over one worker,
+webhook latency percentiles, and the memory of the workers. RSS counts
+every page a worker maps, PSS divides shared pages between the processes
+sharing them, so the gap between the two is what copy-on-write sharing of
+the parent's indexes saves.
+
+Every worker gets its own copy-on-write copy of the in-memory database, so
+bookings made through one worker aren't seen by the others. The speedup is
+bounded by the cores available to the benchmark (the clients need some too).
+
+Run from the "Rasa AI" directory:
+
+    python -m benchmarks.worker_scaling
+    python -m benchmarks.worker_scaling --workers 1 2 4 --clients 32 --duration 20 --handymen 5000
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import rasa_sdk
+
+from benchmarks.load_actions import percentile
+
+HOST = "127.0.0.1"
+
+
+# Server
+
+def serve(args):
+    """Seed the in-memory database and run the pre-forked server (in a subprocess)"""
+    from actions import actions as handygo_actions
+    from actions import prefork, rtdb
+    from actions.fake_rtdb import FakeDatabase
+    from actions.handyman_summary import summary_tree
+    from actions.server import serve_worker
+    from benchmarks.load_actions import seed
+    from benchmarks.replay import ExampleClassifier, nlu_examples
+
+    handygo_actions.classify_text_with_rasa_server = ExampleClassifier(
+        nlu_examples(), sorted(handygo_actions.expertise_mapping))
+    data = seed(args.handymen, args.users, args.jobs, random.Random(args.seed),
+                expertise=sorted(set(handygo_actions.expertise_mapping.values())))
+    data["handymenSummary"] = summary_tree(data["handymen"])
+    rtdb.use_backend(FakeDatabase(data, latency=args.latency))
+
+    server_args = argparse.Namespace(
+        actions_module=None, actions="actions", cors="*", endpoints=None,
+        ssl_certificate=None, ssl_keyfile=None, ssl_password=None,
+    )
+    prefork.serve(lambda sock: serve_worker(server_args, sock), args.serve, HOST, args.port)
+
+
+def start_server(args, workers):
+    command = [
+        sys.executable, "-m", "benchmarks.worker_scaling", "--serve", str(workers), "--port", str(args.port),
+        "--handymen", str(args.handymen), "--users", str(args.users), "--jobs", str(args.jobs),
+        "--latency", str(args.latency), "--seed", str(args.seed), "--log-level", args.log_level,
+    ]
+    # The workers configure their logging from the environment
+    env = dict(os.environ, LOG_LEVEL=args.log_level.upper())
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL if args.quiet else None)
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"The server exited with status {process.returncode}")
+        if len(worker_pids(process.pid)) >= workers and healthy(args.port):
+            return process
+        time.sleep(0.2)
+    stop_server(process)
+    sys.exit(f"The server didn't start within {args.startup_timeout}s")
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def healthy(port):
+    try:
+        connection = http.client.HTTPConnection(HOST, port, timeout=2)
+        connection.request("GET", "/health")
+        return connection.getresponse().status == 200
+    except OSError:
+        return False
+
+
+def worker_pids(pid):
+    """PIDs of the children of pid (Linux; empty elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def memory_kb(pid):
+    """(RSS, PSS) of a process in kB from /proc/<pid>/smaps_rollup, or None"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["Rss"].split()[0]), int(fields["Pss"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+# Clients
+
+def action_call(sender_id, slots, message, action_name):
+    """Webhook request body for one action, as the Rasa server sends it"""
+    return {
+        "next_action": action_name,
+        "sender_id": sender_id,
+        "tracker": {
+            "sender_id": sender_id,
+            "slots": dict(slots),
+            "latest_message": message,
+            "events": [],
+            "paused": False,
+            "followup_action": None,
+            "active_loop": {},
+            "latest_action_name": "action_listen",
+        },
+        "domain": {},
+        "version": rasa_sdk.__version__,
+    }
+
+
+def run_client(number, conversations, users, mappings, port, warmup, duration, results):
+    """Replay conversations in a loop for warmup + duration seconds; report (turns, latencies, errors)"""
+    from benchmarks.replay import apply_events
+
+    latencies = []
+    turns = errors = 0
+    start = time.monotonic()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+    i = number
+    while time.monotonic() < stop_at:
+        exchanges = conversations[i % len(conversations)]
+        sender_id = f"u{i % users}"
+        i += 1
+        connection = http.client.HTTPConnection(HOST, port, timeout=30)
+        slots = {}
+        for message, action_names in exchanges:
+            for entity in message["entities"]:
+                for slot in mappings.get(entity["entity"], ()):
+                    slots[slot] = entity["value"]
+            for name in action_names:
+                body = json.dumps(action_call(sender_id, slots, message, name))
+                sent = time.monotonic()
+                try:
+                    connection.request("POST", "/webhook", body, {"Content-Type": "application/json"})
+                    response = connection.getresponse()
+                    payload = response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    ok, payload = False, b""
+                    connection.close()
+                    connection = http.client.HTTPConnection(HOST, port, timeout=30)
+                done = time.monotonic()
+                if sent >= measure_from and done <= stop_at:
+                    turns += 1
+                    latencies.append(done - sent)
+                    errors += 0 if ok else 1
+                if ok:
+                    apply_events(slots, json.loads(payload).get("events"))
+        connection.close()
+    results.put((turns, latencies, errors))
+
+
+def drive(args, conversations, mappings):
+    """Run the clients against the server; return (turns, latencies, errors)"""
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    clients = [
+        context.Process(target=run_client, args=(
+            number, conversations, args.users, mappings, args.port, args.warmup, args.duration, results))
+        for number in range(args.clients)
+    ]
+    for client in clients:
+        client.start()
+    turns, latencies, errors = 0, [], 0
+    for _ in clients:
+        client_turns, client_latencies, client_errors = results.get()
+        turns += client_turns
+        latencies.extend(client_latencies)
+        errors += client_errors
+    for client in clients:
+        client.join()
+    return turns, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--clients', type=int, default=16, help="Client processes sending conversations")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds measured per worker count")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Seconds of load before measuring")
+    parser.add_argument('--conversations', type=int, default=200, help="Conversations generated from the stories")
+    parser.add_argument('--handymen', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--jobs', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds per database round trip")
+    parser.add_argument('--port', type=int, default=5155)
+    parser.add_argument('--startup-timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default="WARNING", help="Level of the actions' logs in the server")
+    parser.add_argument('--quiet', action='store_true', help="Hide the server's output")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    from actions import actions as handygo_actions
+    from benchmarks.load_actions import seed
+    from benchmarks.replay import action_registry, cast_message, entity_slots, nlu_examples, story_conversations
+
+    # The same conversations the server's data was seeded for
+    rng = random.Random(args.seed)
+    data = seed(args.handymen, args.users, args.jobs, random.Random(args.seed),
+                expertise=sorted(set(handygo_actions.expertise_mapping.values())))
+    handyman_ids = sorted(data["handymen"])
+    today = datetime.now().date()
+    conversations = [
+        [(cast_message(message, handyman_ids, rng, today), names) for message, names in exchanges]
+        for exchanges in story_conversations(args.conversations, nlu_examples(), action_registry(), rng)
+    ]
+    mappings = entity_slots()
+    del data
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{len(conversations)} conversations, {args.clients} clients, {args.duration:.0f}s per run, "
+          f"{args.handymen} handymen, {args.jobs} jobs; {cores} cores available")
+    if cores < max(args.workers):
+        print(f"Fewer cores than workers: throughput can't scale past {cores} workers here")
+
+    results = []
+    for workers in args.workers:
+        server = start_server(args, workers)
+        try:
+            turns, latencies, errors = drive(args, conversations, mappings)
+            memory = [memory_kb(pid) for pid in worker_pids(server.pid)]
+            memory = [m for m in memory if m]
+        finally:
+            stop_server(server)
+        results.append({
+            "workers": workers,
+            "turns": turns,
+            "turns_per_s": turns / args.duration,
+            "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+            "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+            "errors": errors,
+            "rss_mb": sum(rss for rss, _ in memory) / 1024 if memory else None,
+            "pss_mb": sum(pss for _, pss in memory) / 1024 if memory else None,
+        })
+
+    base = results[0]["turns_per_s"] or 1
+    print(f"{'workers':>7} {'turns/s':>9} {'speedup':>8} {'p50':>9} {'p95':>9} {'errors':>7} "
+          f"{'RSS MB':>8} {'PSS MB':>8}")
+    for row in results:
+        memory = (f"{row['rss_mb']:>8.1f} {row['pss_mb']:>8.1f}" if row["rss_mb"] is not None
+                  else f"{'-':>8} {'-':>8}")
+        p50 = f"{row['p50_ms']:.1f}ms" if row["p50_ms"] is not None else "-"
+        p95 = f"{row['p95_ms']:.1f}ms" if row["p95_ms"] is not None else "-"
+        print(f"{row['workers']:>7} {row['turns_per_s']:>9.1f} {row['turns_per_s'] / base:>7.2f}x "
+              f"{p50:>9} {p95:>9} {row['errors']:>7} {memory}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cores": cores, "clients": args.clients, "duration": args.duration, "results": results},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Backfill the composite 'assigned_to_date' key on existing /jobs.
+
+New bookings made by the action server carry the key (see
+actions/job_queries.py); this adds or corrects it on every other job, a page
+at a time, with one multi-path update per page.
+
+Run from the "Rasa AI" directory:
+
+    python -m scripts.backfill_assigned_to_date --dry-run
+    python -m scripts.backfill_assigned_to_date --page-size 500
+"""
+import argparse
+
+from actions import rtdb
+from actions.job_queries import job_assigned_to_date
+
+
+def iter_job_pages(page_size):
+    """Yield {job_id: job} pages of /jobs in key order"""
+    last_key = None
+    while True:
+        query = rtdb.reference('/jobs').order_by_key()
+        if last_key is None:
+            page = query.limit_to_first(page_size).get() or {}
+        else:
+            page = query.start_at(last_key).limit_to_first(page_size + 1).get() or {}
+            page.pop(last_key, None)
+        if not page:
+            return
+        yield page
+        last_key = list(page)[-1]
+
+
+def backfill(page_size=500, dry_run=False):
+    """
+    Add or correct assigned_to_date on every job.
+
+    Returns:
+        dict: Counts of scanned, updated, unchanged and skipped jobs
+    """
+    counts = {"scanned": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    for page in iter_job_pages(page_size):
+        updates = {}
+        for job_id, job in page.items():
+            counts["scanned"] += 1
+            if not isinstance(job, dict):
+                counts["skipped"] += 1
+                continue
+            key = job_assigned_to_date(job)
+            if job.get("assigned_to_date") == key:
+                counts["unchanged"] += 1
+            elif key is None:
+                # Not assigned or no start time: drop a stale key
+                updates[f"{job_id}/assigned_to_date"] = None
+                counts["skipped"] += 1
+            else:
+                updates[f"{job_id}/assigned_to_date"] = key
+                counts["updated"] += 1
+        if updates and not dry_run:
+            rtdb.reference('/jobs').update(updates)
+        print(f"Scanned {counts['scanned']} jobs, {counts['updated']} to update so far")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=500, help="jobs read per query")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+
+    rtdb.initialize_firebase()
+    counts = backfill(args.page_size, args.dry_run)
+    print(("Dry run: " if args.dry_run else "") + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    print('Make sure the rules index the key: "jobs": {".indexOn": ["assigned_to", "assigned_to_date"]}')
+
+
+if __name__ == "__main__":
+    main()
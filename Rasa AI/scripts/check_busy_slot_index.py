@@ -0,0 +1,134 @@
+"""
+Check that the busy-slot index sees jobs written by another process.
+
+The booking actions write their own jobs through to the index; jobs created
+or cancelled by the app, the backend or another action server only reach it
+through the database. For the default JOBS_INDEX_MODE (query) and for
+mirror, the script loads the index on the in-memory database, then writes a
+job straight to the database as another client would and checks:
+
+- is_busy(): at once in mirror mode; in query mode it keeps the old answer
+  until JOBS_INDEX_TTL has passed (the clock is moved forward), the
+  staleness documented in actions/job_index.py
+- is_busy_fresh() sees it at once, and book_slot() gives SLOT_TAKEN even
+  while the cached answer is stale
+- the same again after the other client cancels the job, and that the slot
+  can then be booked
+
+Any failed check is printed and the script exits with status 1.
+
+Run from the "Rasa AI" directory:
+
+    python -m scripts.check_busy_slot_index
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import date, timedelta
+
+from actions import booking_writes, job_index, rtdb
+from actions.fake_rtdb import FakeDatabase
+from actions.job_index import get_busy_slot_index, reset_busy_slot_index
+from actions.slot_schedule import DEFAULT_SCHEDULE
+from actions.user_profiles import reset_user_profiles
+
+HANDYMAN = "h1"
+SLOT = "Slot 2"
+
+
+def job_record(day, user_id, status="Pending"):
+    start, end = DEFAULT_SCHEDULE.timestamps(SLOT, day.isoformat())
+    return {"assigned_to": HANDYMAN, "status": status, "assigned_slot": SLOT, "starttimestamp": start,
+            "endtimestamp": end, "user_id": user_id, "assigned_to_date": f"{HANDYMAN}_{day.isoformat()}"}
+
+
+class Clock:
+    """time.monotonic for job_index that can be moved forward"""
+
+    def __init__(self):
+        self.offset = 0.0
+        self._monotonic = job_index.time.monotonic
+
+    def __call__(self):
+        return self._monotonic() + self.offset
+
+
+def check_mode(mode, clock):
+    """Run the checks with JOBS_INDEX_MODE=mode (None for the default); return the failures"""
+    failures = []
+
+    def expect(name, actual, expected):
+        if actual != expected:
+            failures.append(f"{mode or 'default'}: {name} was {actual!r}, expected {expected!r}")
+
+    if mode is None:
+        os.environ.pop("JOBS_INDEX_MODE", None)
+    else:
+        os.environ["JOBS_INDEX_MODE"] = mode
+    day = date.today() + timedelta(days=2)
+    rtdb.use_backend(FakeDatabase({"jobs": {"old": job_record(day - timedelta(days=1), "u0")}}))
+    reset_busy_slot_index()
+    reset_user_profiles()
+    index = get_busy_slot_index()
+    following = index._mirror is not None
+    expect("mirror mode", following, mode == "mirror")
+
+    def expect_cached(change, busy):
+        # Query mode keeps the old answer until JOBS_INDEX_TTL has passed
+        if not following:
+            expect(f"is_busy within the ttl after {change}", index.is_busy(HANDYMAN, day, SLOT), not busy)
+            clock.offset += index.ttl + 1
+        expect(f"is_busy after {change}", index.is_busy(HANDYMAN, day, SLOT), busy)
+
+    # Load the index, then let another client book the slot behind its back
+    expect("is_busy before the other booking", index.is_busy(HANDYMAN, day, SLOT), False)
+    rtdb.reference("/jobs/other").set(job_record(day, "u1"))
+    expect_cached("the other booking", True)
+    expect("is_busy_fresh after the other booking", index.is_busy_fresh(HANDYMAN, day, SLOT), True)
+
+    # With the index loaded before the other booking, book_slot still finds the slot taken
+    rtdb.reference("/jobs/other").delete()
+    clock.offset += index.ttl + 1
+    expect("is_busy after the other booking is deleted", index.is_busy(HANDYMAN, day, SLOT), False)
+    rtdb.reference("/jobs/other").set(job_record(day, "u1"))
+    expect("book_slot after the other booking",
+           booking_writes.book_slot("mine", job_record(day, "u2"), "txn-mine", {"amount": -1}),
+           booking_writes.SLOT_TAKEN)
+    expect("job written despite SLOT_TAKEN", rtdb.reference("/jobs/mine").get(), None)
+
+    # Reload the index, then the other client cancels: the slot frees up the same way
+    clock.offset += index.ttl + 1
+    index.is_busy(HANDYMAN, day, SLOT)
+    rtdb.reference("/jobs/other/status").set("Cancelled")
+    expect_cached("the cancellation", False)
+    expect("is_busy_fresh after the cancellation", index.is_busy_fresh(HANDYMAN, day, SLOT), False)
+    expect("book_slot after the cancellation",
+           booking_writes.book_slot("mine", job_record(day, "u2"), "txn-mine", {"amount": -1}),
+           booking_writes.BOOKED)
+    expect("is_busy after booking", index.is_busy(HANDYMAN, day, SLOT), True)
+    reset_busy_slot_index()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    logging.getLogger("actions").setLevel(logging.WARNING)
+    clock = Clock()
+    job_index.time.monotonic = clock
+    failures = []
+    try:
+        for mode in (None, "mirror"):
+            failures += check_mode(mode, clock)
+    finally:
+        job_index.time.monotonic = clock._monotonic
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print(f"Default (query) and mirror modes: {len(failures)} failed checks")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Check ActionEasyBook's handyman selection and the busy-slot index against full scans.
+
+ActionEasyBook used to read all of /handymen and /jobs, compute a distance to
+every matching handyman, sort them all and take the first one without a job
+in the requested slot. It now pulls candidates lazily from the spatial and
+expertise indexes (heapq.merge of two ranked streams) and asks BusySlotIndex
+for each candidate's schedule. For randomized directories and job tables
+(ties in distance and rating, missing or unusable coordinates, handymen
+without a city, busy slots, jobs in every status) the script runs the action
+on the in-memory database and compares:
+
+- the handyman it picks (and the distance it reports) with that full scan
+- BusySlotIndex.busy_slots() and is_busy_fresh() with a full /jobs read,
+  after random job changes written straight to the database (as the app and
+  the backend write them), in both JOBS_INDEX_MODE=query and mirror
+
+Any difference is printed and the script exits with status 1.
+
+Run from the "Rasa AI" directory:
+
+    python -m scripts.check_easybook_selection
+    python -m scripts.check_easybook_selection --directories 500 --seed 7
+"""
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+from datetime import datetime, timedelta
+
+from rasa_sdk import Tracker
+from rasa_sdk.executor import CollectingDispatcher
+
+from actions import actions as handygo_actions
+from actions import rtdb
+from actions.booking_config import reset_booking_config
+from actions.expertise_index import reset_expertise_index
+from actions.fake_rtdb import FakeDatabase
+from actions.handyman_directory import reset_handyman_directory
+from actions.job_index import BusySlotIndex, get_busy_slot_index, job_slot_key, reset_busy_slot_index
+from actions.message_parser import parse_booking_message
+from actions.slot_schedule import DEFAULT_SCHEDULE
+from actions.spatial_index import reset_handyman_spatial_index
+from actions.user_profiles import reset_user_profiles
+from scripts.check_spatial_index import CITIES, CLUSTERS, random_handyman
+
+# Intents the classifier is made to return, and the expertise each asks for
+INTENTS = ["report_issue_plumber", "report_issue_electrician", "report_issue_AC", "report_issue_painter",
+           "report_issue_carpenter"]
+STATUSES = ["Pending", "Pending", "In-Progress", "Completed", "Rejected", "Cancelled"]
+SENDER = "checker"
+DAYS = 4
+
+
+def random_directory(rng, size):
+    """Handymen as scripts/check_spatial_index.py draws them, with numeric ratings
+
+    Both the old scan and ActionEasyBook negate the rating, so a string rating
+    fails in either; that case isn't what this script compares.
+    """
+    handymen = {f"h{i}": random_handyman(rng, i) for i in range(size)}
+    for record in handymen.values():
+        if isinstance(record.get("rating"), str):
+            record["rating"] = float(record["rating"])
+    return handymen
+
+
+def random_jobs(rng, handyman_ids, first_day, busy_share):
+    """/jobs with a share of the handymen booked on the days after first_day"""
+    jobs = {}
+    for handyman_id in handyman_ids:
+        if rng.random() >= busy_share:
+            continue
+        for _ in range(rng.randint(1, 4)):
+            jobs[f"j{len(jobs)}"] = random_job(rng, handyman_id, first_day)
+    return jobs
+
+
+def random_job(rng, handyman_id, first_day):
+    day = first_day + timedelta(days=rng.randrange(DAYS))
+    slot = rng.choice(DEFAULT_SCHEDULE.names)
+    start, _ = DEFAULT_SCHEDULE.timestamps(slot, day.isoformat())
+    job = {"assigned_to": handyman_id, "status": rng.choice(STATUSES), "assigned_slot": slot,
+           "starttimestamp": start, "assigned_to_date": f"{handyman_id}_{day.isoformat()}"}
+    if rng.random() < 0.03:
+        job["starttimestamp"] = ""
+    return job
+
+
+def random_user(rng):
+    address = {"streetName": "Jalan 1"}
+    city = rng.choice(CITIES)
+    if city:
+        address["city"] = city
+    if rng.random() < 0.7:
+        latitude, longitude = rng.choice(CLUSTERS)
+        address["latitude"] = round(latitude + rng.uniform(-0.2, 0.2), rng.choice([2, 4]))
+        address["longitude"] = round(longitude + rng.uniform(-0.2, 0.2), rng.choice([2, 4]))
+    return {"name": "Checker", "wallet": 100, "primaryAddress": address}
+
+
+def use_database(data):
+    rtdb.use_backend(FakeDatabase(data))
+    reset_handyman_directory()
+    reset_handyman_spatial_index()
+    reset_expertise_index()
+    reset_busy_slot_index()
+    reset_booking_config()
+    reset_user_profiles()
+
+
+# Reference: the full scans ActionEasyBook used to run
+
+def scan_busy_slots(jobs):
+    """{(handyman_id, date): set of slots} from every job in /jobs"""
+    busy = {}
+    for job in jobs.values():
+        key = job_slot_key(job)
+        if key is not None:
+            busy.setdefault(key[:2], set()).add(key[2])
+    return busy
+
+
+def scan_selection(action, handymen, jobs, user, expertise, booking_date, slot):
+    """(handyman_id, distance) the full scan picks, or None if nobody is free"""
+    address = user.get("primaryAddress", {})
+    user_city = address.get("city")
+    user_latitude, user_longitude = address.get("latitude"), address.get("longitude")
+    nearby, other = [], []
+    for h_id, record in handymen.items():
+        h_data = dict(record, id=h_id)
+        if not (h_data.get("expertise") and h_data.get("status") == "active"
+                and isinstance(h_data["expertise"], list)
+                and any(expertise.lower() in exp.lower() for exp in h_data["expertise"] if isinstance(exp, str))):
+            continue
+        if user_latitude and user_longitude and h_data.get("latitude") and h_data.get("longitude"):
+            try:
+                distance = action.haversine(float(user_latitude), float(user_longitude),
+                                            float(h_data["latitude"]), float(h_data["longitude"]))
+                h_data["distance"] = round(distance, 2)
+                nearby.append(h_data)
+                continue
+            except (ValueError, TypeError):
+                pass
+        action._add_handyman_with_city_distance(h_data, user_city, nearby, other)
+
+    busy = scan_busy_slots(jobs)
+
+    def first_free(candidates):
+        for candidate in candidates:
+            if slot not in busy.get((candidate["id"], booking_date), ()):
+                return candidate["id"], candidate.get("distance")
+        return None
+
+    rating = lambda h: h.get("average_rating", 0) or h.get("rating", 0)
+    if nearby:
+        nearby.sort(key=lambda h: (h.get("distance", 100), -rating(h)))
+        return first_free(nearby) or first_free(other)
+    other.sort(key=rating, reverse=True)
+    return first_free(other)
+
+
+def action_selection(action, text, intent):
+    """(handyman_id, distance) ActionEasyBook picks, or None"""
+    handygo_actions.classify_text_with_rasa_server = lambda _: (intent, 0.9)
+    latest = {"text": text, "intent": {"name": "easy_book", "confidence": 0.9}, "entities": [],
+              "intent_ranking": []}
+    tracker = Tracker(SENDER, {}, latest, [], False, None, {}, "action_listen")
+    dispatcher = CollectingDispatcher()
+    events = action.run_sync(dispatcher, tracker, {})
+    handyman_ids = [event["value"] for event in events if event.get("name") == "handyman_id"]
+    if not handyman_ids:
+        return None
+    distance = re.search(r"\(([\d.]+) km away\)|([\d.]+) km away", dispatcher.messages[-1]["text"])
+    distance = float(distance.group(1) or distance.group(2)) if distance else None
+    return handyman_ids[0], distance
+
+
+def same_selection(expected, actual):
+    if expected is None or actual is None:
+        return expected == actual
+    # The reply only shows a distance for handymen with one
+    expected_distance = expected[1] if expected[1] not in (None, float("inf")) else None
+    return expected[0] == actual[0] and expected_distance == actual[1]
+
+
+def check_busy_index(rng, handymen, jobs, first_day, label):
+    """Change jobs behind the index's back and compare it with a full read; return the differences"""
+    failures = 0
+    index = get_busy_slot_index()
+    uncached = BusySlotIndex(ttl=0)
+    days = [first_day + timedelta(days=i) for i in range(DAYS)]
+    handyman_ids = list(handymen) or ["h0"]
+    for handyman_id in handyman_ids:
+        # Load the index before the changes so stale entries would show
+        index.busy_slots(handyman_id, days[0])
+
+    for _ in range(rng.randint(5, 30)):
+        roll = rng.random()
+        if roll < 0.4 or not jobs:
+            job_id = f"x{rng.getrandbits(32)}"
+            jobs[job_id] = random_job(rng, rng.choice(handyman_ids), first_day)
+            rtdb.reference(f"/jobs/{job_id}").set(jobs[job_id])
+        elif roll < 0.8:
+            job_id = rng.choice(list(jobs))
+            jobs[job_id]["status"] = rng.choice(STATUSES)
+            rtdb.reference(f"/jobs/{job_id}/status").set(jobs[job_id]["status"])
+        else:
+            job_id = rng.choice(list(jobs))
+            del jobs[job_id]
+            rtdb.reference(f"/jobs/{job_id}").delete()
+
+    busy = scan_busy_slots(jobs)
+    following = index._mirror is not None
+    # Every fake query filters all of /jobs, so look at a sample of the handymen
+    for handyman_id in rng.sample(handyman_ids, min(len(handyman_ids), 12)):
+        for day in days:
+            expected = busy.get((handyman_id, day), set())
+            lookups = [("busy_slots (ttl 0)", uncached.busy_slots(handyman_id, day))]
+            if following:
+                lookups.append(("busy_slots (mirror)", index.busy_slots(handyman_id, day)))
+            for name, actual in lookups:
+                if actual != expected:
+                    failures += 1
+                    print(f"FAIL {label} {name}({handyman_id}, {day}): expected {sorted(expected)}, "
+                          f"got {sorted(actual)}")
+            for slot in DEFAULT_SCHEDULE.names:
+                if index.is_busy_fresh(handyman_id, day, slot) != (slot in expected):
+                    failures += 1
+                    print(f"FAIL {label} is_busy_fresh({handyman_id}, {day}, {slot})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directories', type=int, default=200, help="Randomized directories to check")
+    parser.add_argument('--bookings', type=int, default=6, help="EasyBook requests per directory")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger("actions").setLevel(logging.WARNING)
+    action = handygo_actions.ActionEasyBook()
+    first_day = datetime.now().date() + timedelta(days=1)
+    failures = selections = 0
+    for number in range(args.directories):
+        rng = random.Random(args.seed * 100003 + number)
+        os.environ["JOBS_INDEX_MODE"] = "mirror" if number % 2 else "query"
+        size = rng.choice([0, 1, 5, 30, 150])
+        handymen = random_directory(rng, size)
+        jobs = random_jobs(rng, handymen, first_day, busy_share=rng.choice([0.2, 0.6, 0.95]))
+        user = random_user(rng)
+        use_database({"handymen": handymen, "jobs": jobs, "users": {SENDER: user}, "fare": {"amount": 20}})
+
+        for _ in range(args.bookings):
+            day = first_day + timedelta(days=rng.randrange(DAYS))
+            hour = rng.choice([9, 14, 19])
+            text = f"book a handyman on {day.day}/{day.month} at {hour}:00"
+            intent = rng.choice(INTENTS)
+            parsed = parse_booking_message(text)
+            booking_date = datetime.strptime(parsed.date, "%Y-%m-%d").date()
+            expected = scan_selection(action, handymen, jobs, user, handygo_actions.expertise_mapping[intent],
+                                      booking_date, parsed.slot)
+            actual = action_selection(action, text, intent)
+            selections += 1
+            if not same_selection(expected, actual):
+                failures += 1
+                print(f"FAIL directory {number} ({os.environ['JOBS_INDEX_MODE']}) {text!r} {intent}: "
+                      f"expected {expected}, got {actual}")
+
+        failures += check_busy_index(rng, handymen, jobs, first_day,
+                                     f"directory {number} ({os.environ['JOBS_INDEX_MODE']})")
+        reset_busy_slot_index()
+
+    print(f"{args.directories} directories, {selections} selections: {failures} differences from the full scans")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Check the leaderboards of actions/expertise_index.py against sorted().
+
+For randomized directories (see scripts/check_spatial_index.py) the script
+compares every lookup of ExpertiseIndex with the scan-and-sort the actions
+used before: ids() against the matching handymen in directory order, and
+top() against sorted() by rating (ties in directory order), for random
+combinations of k, status and city filters. It checks again after random
+changes of rating, status, city and expertise, additions and removals. Half
+of the directories use an index that tracks only two expertise names, so the
+untracked path (sorting on each call) is covered too. Any difference is
+printed and the script exits with status 1.
+
+Run from the "Rasa AI" directory:
+
+    python -m scripts.check_expertise_index
+    python -m scripts.check_expertise_index --directories 500 --seed 7
+"""
+import argparse
+import random
+import sys
+
+from actions.expertise_index import ExpertiseIndex, handyman_rating
+from scripts.check_spatial_index import CITIES, NEEDLES, mutate, random_handyman
+
+# Cities asked for, in the spellings users type
+CITY_QUERIES = ["Cheras", "CHERAS", "Ampang", "Ipoh", "Nowhere", ""]
+
+
+# Reference: scan the directory, then sort
+
+def scan_ids(records, needle, active=None, city=None, exclude_city=None):
+    """ids() by testing every record, in directory order"""
+    needle = needle.lower()
+    ids = []
+    for handyman_id, record in records.items():
+        expertise = record.get("expertise")
+        if not expertise or not isinstance(expertise, list):
+            continue
+        names = [exp.lower() for exp in expertise if isinstance(exp, str)]
+        if not any(needle in name for name in names):
+            continue
+        if active is not None and (record.get("status") == "active") != active:
+            continue
+        handyman_city = record.get("city")
+        handyman_city = handyman_city.lower() if isinstance(handyman_city, str) else ''
+        if city is not None and handyman_city != city.lower():
+            continue
+        if exclude_city is not None and handyman_city == exclude_city.lower():
+            continue
+        ids.append(handyman_id)
+    return ids
+
+
+def scan_top(records, needle, k=None, active=None, city=None, exclude_city=None):
+    """top() as the actions computed it: a stable sort of the scan by rating"""
+    ids = scan_ids(records, needle, active, city, exclude_city)
+    return sorted(ids, key=lambda handyman_id: -handyman_rating(records[handyman_id]))[:k]
+
+
+def random_filters(rng):
+    """Filters of one lookup, including the combinations the actions use"""
+    return {
+        "active": rng.choice([None, True, True, False]),
+        "city": rng.choice([None, None] + CITY_QUERIES),
+        "exclude_city": rng.choice([None, None, None] + CITY_QUERIES),
+    }
+
+
+def check(index, records, rng, label, lookups=4):
+    """Compare lookups per needle with the scan; return the number of differences"""
+    failures = 0
+    for needle in NEEDLES:
+        for _ in range(lookups):
+            filters = random_filters(rng)
+            expected = scan_ids(records, needle, **filters)
+            if index.ids(needle, **filters) != expected:
+                failures += 1
+                print(f"FAIL {label} ids({needle!r}, {filters})")
+            k = rng.choice([None, 1, 3, 5])
+            expected = scan_top(records, needle, k, **filters)
+            actual = index.top(needle, k, **filters)
+            if actual != expected:
+                failures += 1
+                print(f"FAIL {label} top({needle!r}, {k}, {filters})\n"
+                      f"  expected {expected[:8]}\n  got      {actual[:8]}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directories', type=int, default=200, help="Randomized directories to check")
+    parser.add_argument('--changes', type=int, default=50, help="Random changes applied to each directory")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failures = 0
+    for number in range(args.directories):
+        rng = random.Random(args.seed * 100003 + number)
+        size = rng.choice([0, 1, 5, 50, 300])
+        records = {f"h{i}": random_handyman(rng, i) for i in range(size)}
+        index = ExpertiseIndex(max_tracked=2 if number % 2 else 64)
+        for handyman_id, record in records.items():
+            index.insert(handyman_id, record)
+        failures += check(index, records, rng, f"directory {number}")
+
+        next_number = size
+        for _ in range(args.changes):
+            handyman_id, record = mutate(rng, records, next_number)
+            next_number += 1
+            if record is None:
+                index.remove(handyman_id)
+            else:
+                if rng.random() < 0.2:
+                    record["city"] = rng.choice(CITIES[:-1]).upper()
+                index.insert(handyman_id, record)
+            # Lookups between changes check the leaderboards are updated in place
+            if rng.random() < 0.1:
+                failures += check(index, records, rng, f"directory {number} during changes", lookups=1)
+        failures += check(index, records, rng, f"directory {number} after changes")
+
+    print(f"{args.directories} directories: {failures} differences from scan and sorted()")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
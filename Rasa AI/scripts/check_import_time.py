@@ -0,0 +1,129 @@
+"""
+Check the import-time budget of the actions package.
+
+Importing actions.actions (what the action server's executor does) must
+load no heavy dependency: firebase_admin, numpy, requests and the google
+and cryptography packages behind them are imported where they are first
+used, and warmup.py loads them in the background once the server is up.
+The script runs a fresh interpreter with `python -X importtime`, imports
+rasa_sdk and sanic (which the server needs anyway), then actions.actions
+and actions.server, and fails if:
+
+- any module of HEAVY_MODULES is imported by the actions
+- the actions' own import time (the "self" time of every module they add)
+  is over --budget-ms
+
+With --server it also starts `python -m actions.server` and fails if GET
+/health doesn't answer 200 within --startup-budget seconds.
+
+Run from the "Rasa AI" directory:
+
+    python -m scripts.check_import_time
+    python -m scripts.check_import_time --server --port 5155
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+# Top-level packages the actions must not import
+HEAVY_MODULES = ("firebase_admin", "google", "numpy", "pandas", "requests", "urllib3", "cryptography", "grpc")
+
+MARKER = "-- actions --"
+IMPORTS = (
+    "import sys, rasa_sdk.endpoint, sanic; "
+    f"sys.stderr.write({MARKER!r} + chr(10)); sys.stderr.flush(); "
+    "import actions.actions, actions.server"
+)
+
+
+def actions_import_times():
+    """[(module, self µs)] of the modules importing the actions adds, in import order"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORTS],
+                            capture_output=True, text=True, check=True)
+    lines = result.stderr.splitlines()
+    modules = []
+    for line in lines[lines.index(MARKER) + 1:]:
+        # "import time:       312 |        512 |   actions.rtdb"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            continue
+        modules.append((fields[2].strip(), int(fields[0])))
+    return modules
+
+
+def time_to_healthy(port, timeout):
+    """Seconds from starting the action server until GET /health returns 200, or None"""
+    command = [sys.executable, "-m", "actions.server", "--actions", "actions", "--port", str(port)]
+    start = time.monotonic()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.monotonic() - start < timeout:
+            if process.poll() is not None:
+                return None
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                connection.request("GET", "/health")
+                if connection.getresponse().status == 200:
+                    return time.monotonic() - start
+            except OSError:
+                pass
+            time.sleep(0.02)
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=100.0,
+                        help="Import time the actions may add on top of rasa_sdk and sanic")
+    parser.add_argument('--top', type=int, default=10, help="Slowest modules to list")
+    parser.add_argument('--server', action='store_true', help="Also time the server until /health answers")
+    parser.add_argument('--startup-budget', type=float, default=1.0, help="Seconds until /health answers")
+    parser.add_argument('--port', type=int, default=5155)
+    args = parser.parse_args()
+
+    failures = 0
+    modules = actions_import_times()
+    total_ms = sum(us for _, us in modules) / 1000
+    print(f"The actions import {len(modules)} modules in {total_ms:.1f}ms (budget {args.budget_ms:.0f}ms)")
+    for name, us in sorted(modules, key=lambda m: -m[1])[:args.top]:
+        print(f"  {us / 1000:>8.1f}ms  {name}")
+
+    heavy = Counter(name.split(".")[0] for name, _ in modules if name.split(".")[0] in HEAVY_MODULES)
+    if heavy:
+        failures += 1
+        print("FAIL heavy modules imported with the actions: "
+              + ", ".join(f"{package} ({count} modules)" for package, count in sorted(heavy.items())))
+    if total_ms > args.budget_ms:
+        failures += 1
+        print(f"FAIL import time {total_ms:.1f}ms is over the budget of {args.budget_ms:.0f}ms")
+
+    if args.server:
+        # The server only needs to answer /health; the warm-up would compete for the CPU
+        os.environ.setdefault("ACTION_SERVER_WARMUP", "0")
+        seconds = time_to_healthy(args.port, timeout=max(30.0, args.startup_budget * 10))
+        if seconds is None:
+            failures += 1
+            print("FAIL the action server didn't answer /health")
+        else:
+            print(f"/health answered after {seconds:.2f}s (budget {args.startup_budget:.1f}s)")
+            if seconds > args.startup_budget:
+                failures += 1
+                print(f"FAIL startup took {seconds:.2f}s, over the budget of {args.startup_budget:.1f}s")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Check actions/message_parser.py against pinned outputs.
+
+scripts/fixtures/message_parser_pinned.json holds, for every example in
+data/nlu_easy_book.yml plus a few edge cases, the problem text, date, time
+and slot that ActionEasyBook extracted before the parser was introduced
+(parsed as of PINNED_NOW). Any difference is printed and the script exits
+with status 1.
+
+Run from the "Rasa AI" directory:
+
+    python -m scripts.check_message_parser
+    python -m scripts.check_message_parser --update   # after an intended change
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from actions.message_parser import parse_booking_message
+from benchmarks.parse_messages import DEFAULT_CORPUS, load_nlu_examples
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "message_parser_pinned.json")
+
+# Fixed "now" so dates without a year and the default date (tomorrow) don't drift
+PINNED_NOW = datetime(2025, 5, 1, 12, 0)
+
+# Messages outside the NLU examples that exercise the pattern order
+EDGE_CASES = [
+    "Book an electrician tomorrow at 12am",
+    "I want to schedule a plumber next week",
+    "I want to schedule plumbing for 31/2 at 15:30",
+    "i need a handyman, please book a cleaner at 12pm on 13/13",
+    "Book Handyman 9:45 PM aircond not cold",
+    "please bookplease schedule a painter today 7 AM",
+    "Need a carpenter on 5-6 at 22:00",
+    "",
+]
+
+
+def parse(text):
+    parsed = parse_booking_message(text, PINNED_NOW)
+    return {"problem_text": parsed.problem_text, "date": parsed.date, "time": parsed.time, "slot": parsed.slot}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--update', action='store_true', help="Rewrite the fixture from the current parser")
+    args = parser.parse_args()
+
+    if args.update:
+        texts = load_nlu_examples(DEFAULT_CORPUS) + EDGE_CASES
+        pinned = [dict(text=text, **parse(text)) for text in texts]
+        os.makedirs(os.path.dirname(FIXTURE_PATH), exist_ok=True)
+        with open(FIXTURE_PATH, "w", encoding="utf-8") as f:
+            json.dump(pinned, f, indent=1, ensure_ascii=False)
+            f.write("\n")
+        print(f"Pinned {len(pinned)} messages in {FIXTURE_PATH}")
+        return 0
+
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        pinned = json.load(f)
+
+    failures = 0
+    for case in pinned:
+        expected = {k: case[k] for k in ("problem_text", "date", "time", "slot")}
+        actual = parse(case["text"])
+        if actual != expected:
+            failures += 1
+            print(f"FAIL {case['text']!r}\n  expected {expected}\n  got      {actual}")
+    print(f"{len(pinned) - failures}/{len(pinned)} pinned messages parse the same")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Check actions/spatial_index.py against a full scan.
+
+For randomized directories (clusters of handymen around Kuala Lumpur, points
+spread over the globe, duplicated coordinates, missing or unusable
+coordinates, inactive handymen, odd expertise lists) the script compares
+every lookup of HandymanSpatialIndex with the linear scan it replaced: a
+haversine to every active handyman with a matching expertise, sorted by
+distance. It checks nearest() with and without k and radius limits,
+matching() and unlocated(), then applies random inserts, moves and removals
+through insert()/remove() and checks again. Any difference is printed and
+the script exits with status 1.
+
+Run from the "Rasa AI" directory:
+
+    python -m scripts.check_spatial_index
+    python -m scripts.check_spatial_index --directories 500 --seed 7
+"""
+import argparse
+import math
+import random
+import sys
+
+from actions.map_cal import haversine
+from actions.spatial_index import HandymanSpatialIndex
+
+EXPERTISE = ["Plumber", "Senior Plumber", "Electrician", "AC Repair", "Painter", "Handyman", "Carpenter"]
+NEEDLES = ["Plumber", "plumb", "ELECTRICIAN", "ac", "Painter", "Handyman", "Roofer"]
+CITIES = ["Cheras", "cheras", "Petaling Jaya", "Ampang", "Kajang", "Ipoh", "Kuantan", None]
+
+# Query points: around the clusters, elsewhere in Malaysia, far away
+CLUSTERS = [(3.14, 101.69), (3.07, 101.52), (4.60, 101.08), (1.49, 103.74)]
+
+
+def random_point(rng):
+    """A coordinate pair, mostly near a cluster, sometimes anywhere"""
+    if rng.random() < 0.8:
+        latitude, longitude = rng.choice(CLUSTERS)
+        spread = rng.choice([0.01, 0.1, 1.0])
+        latitude += rng.uniform(-spread, spread)
+        longitude += rng.uniform(-spread, spread)
+    else:
+        latitude, longitude = rng.uniform(-60, 60), rng.uniform(-170, 170)
+    # Rounded coordinates put several handymen at the same distance
+    digits = rng.choice([2, 3, 6])
+    return round(latitude, digits), round(longitude, digits)
+
+
+def random_handyman(rng, number):
+    """A /handymen record with the edge cases the directory really holds"""
+    record = {"name": f"Handyman {number}", "status": rng.choice(["active", "active", "active", "inactive"])}
+    roll = rng.random()
+    if roll < 0.85:
+        record["expertise"] = rng.sample(EXPERTISE, rng.randint(1, 3))
+        if rng.random() < 0.05:
+            record["expertise"].append(5)
+    elif roll < 0.9:
+        record["expertise"] = []
+    elif roll < 0.95:
+        record["expertise"] = "Plumber"
+    city = rng.choice(CITIES)
+    if city:
+        record["city"] = city
+    roll = rng.random()
+    if roll < 0.7:
+        record["latitude"], record["longitude"] = random_point(rng)
+    elif roll < 0.75:
+        record["latitude"], record["longitude"] = str(random_point(rng)[0]), str(random_point(rng)[1])
+    elif roll < 0.8:
+        record["latitude"], record["longitude"] = "unknown", 101.7
+    elif roll < 0.85:
+        record["latitude"], record["longitude"] = 0, 101.7
+    rating = rng.choice([1, 2, 3, 4, 5, 4.5, 0, None, "4"])
+    if rating is not None:
+        record["rating"] = rating
+    if rng.random() < 0.3:
+        record["average_rating"] = rng.choice([0, 3.2, 4.5, 5])
+    return record
+
+
+def mutate(rng, records, next_number):
+    """Apply one random change to records; return (handyman_id, new record or None)"""
+    roll = rng.random()
+    if roll < 0.3 or not records:
+        handyman_id = f"h{next_number}"
+        record = random_handyman(rng, next_number)
+    elif roll < 0.5:
+        handyman_id = rng.choice(list(records))
+        record = None
+    else:
+        handyman_id = rng.choice(list(records))
+        record = dict(records[handyman_id])
+        change = rng.choice(["move", "status", "expertise", "coordinates", "rating", "city"])
+        if change == "move":
+            record["latitude"], record["longitude"] = random_point(rng)
+        elif change == "status":
+            record["status"] = "inactive" if record.get("status") == "active" else "active"
+        elif change == "expertise":
+            record["expertise"] = rng.sample(EXPERTISE, rng.randint(0, 2))
+        elif change == "coordinates":
+            record.pop("latitude", None)
+            record.pop("longitude", None)
+        elif change == "rating":
+            record["rating"] = rng.choice([1, 2, 3, 4, 5])
+        else:
+            record["city"] = rng.choice(CITIES[:-1])
+    if record is None:
+        records.pop(handyman_id, None)
+    else:
+        records[handyman_id] = record
+    return handyman_id, record
+
+
+# Reference: the full scan
+
+def scan_matches(records, needle):
+    """(id, record) of active handymen whose expertise contains needle, in directory order"""
+    needle = needle.lower()
+    for handyman_id, record in records.items():
+        expertise = record.get("expertise")
+        if record.get("status") != "active" or not expertise or not isinstance(expertise, list):
+            continue
+        if any(needle in exp.lower() for exp in expertise if isinstance(exp, str)):
+            yield handyman_id, record
+
+
+def scan_coordinates(record):
+    latitude, longitude = record.get("latitude"), record.get("longitude")
+    if not (latitude and longitude):
+        return None
+    try:
+        coords = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    return coords if all(math.isfinite(c) for c in coords) else None
+
+
+def scan_nearest(records, latitude, longitude, needle, k=None, radius_km=None):
+    """nearest() by computing every distance and sorting"""
+    distances = []
+    for handyman_id, record in scan_matches(records, needle):
+        coords = scan_coordinates(record)
+        if coords is not None:
+            distances.append((haversine(latitude, longitude, *coords), handyman_id))
+    distances.sort()
+    if radius_km is not None:
+        distances = [(d, h) for d, h in distances if d <= radius_km]
+    return [(handyman_id, round(distance, 2)) for distance, handyman_id in distances[:k]]
+
+
+def check(index, records, rng, queries, label):
+    """Compare the index with the scan; return the number of differences"""
+    failures = 0
+    for needle in NEEDLES:
+        expected = sorted(h for h, _ in scan_matches(records, needle))
+        if sorted(index.matching(needle)) != expected:
+            failures += 1
+            print(f"FAIL {label} matching({needle!r})")
+        expected = sorted(h for h, r in scan_matches(records, needle) if scan_coordinates(r) is None)
+        if sorted(index.unlocated(needle)) != expected:
+            failures += 1
+            print(f"FAIL {label} unlocated({needle!r})")
+    for _ in range(queries):
+        latitude, longitude = random_point(rng)
+        needle = rng.choice(NEEDLES)
+        k = rng.choice([None, 1, 3, 10])
+        radius_km = rng.choice([None, None, 1.0, 5.0, 25.0, 500.0])
+        expected = scan_nearest(records, latitude, longitude, needle, k, radius_km)
+        actual = index.nearest(latitude, longitude, needle, k=k, radius_km=radius_km)
+        if actual != expected:
+            failures += 1
+            print(f"FAIL {label} nearest({latitude}, {longitude}, {needle!r}, k={k}, radius_km={radius_km})\n"
+                  f"  expected {expected[:5]}{' ...' if len(expected) > 5 else ''}\n"
+                  f"  got      {actual[:5]}{' ...' if len(actual) > 5 else ''}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directories', type=int, default=200, help="Randomized directories to check")
+    parser.add_argument('--queries', type=int, default=40, help="nearest() lookups per check")
+    parser.add_argument('--changes', type=int, default=50, help="Random changes applied to each directory")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failures = 0
+    lookups = 0
+    for number in range(args.directories):
+        rng = random.Random(args.seed * 100003 + number)
+        size = rng.choice([0, 1, 5, 50, 300])
+        records = {f"h{i}": random_handyman(rng, i) for i in range(size)}
+        index = HandymanSpatialIndex(cell_deg=rng.choice([0.01, 0.1, 1.0]))
+        for handyman_id, record in records.items():
+            index.insert(handyman_id, record)
+        failures += check(index, records, rng, args.queries, f"directory {number}")
+
+        next_number = size
+        for _ in range(args.changes):
+            handyman_id, record = mutate(rng, records, next_number)
+            next_number += 1
+            if record is None:
+                index.remove(handyman_id)
+            else:
+                index.insert(handyman_id, record)
+        failures += check(index, records, rng, args.queries, f"directory {number} after changes")
+        lookups += 2 * (args.queries + 2 * len(NEEDLES))
+
+    print(f"{args.directories} directories, {lookups} lookups: {failures} differences from the full scan")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
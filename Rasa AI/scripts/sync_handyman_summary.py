@@ -0,0 +1,115 @@
+"""
+Build /handymenSummary from /handymen and keep it consistent.
+
+An action server started with HANDYMAN_SOURCE=summary reads handymen from
+the /handymenSummary projection (see actions/handyman_summary.py). This job reconciles the projection with
+/handymen, a page of handymen at a time with one multi-path update per page,
+and deletes summaries of handymen that no longer exist. With --follow it then
+listens to /handymen and writes every change that affects a summary, so
+registrations, approvals, rating and location updates made by the backend
+reach the action server.
+
+Run from the "Rasa AI" directory:
+
+    python -m scripts.sync_handyman_summary --dry-run
+    python -m scripts.sync_handyman_summary
+    python -m scripts.sync_handyman_summary --follow --reconcile-every 3600
+
+Build the projection once, then keep `--follow` running for as long as any
+action server reads it with HANDYMAN_SOURCE=summary.
+"""
+import argparse
+import time
+
+from actions import rtdb
+from actions.handyman_summary import HANDYMEN_PATH, SUMMARY_PATH, SummarySync, summary_updates
+from actions.rtdb import TreeMirror
+
+
+def iter_handyman_pages(page_size):
+    """Yield {handyman_id: record} pages of /handymen in key order"""
+    last_key = None
+    while True:
+        query = rtdb.reference(HANDYMEN_PATH).order_by_key()
+        if last_key is None:
+            page = query.limit_to_first(page_size).get() or {}
+        else:
+            page = query.start_at(last_key).limit_to_first(page_size + 1).get() or {}
+            page.pop(last_key, None)
+        if not page:
+            return
+        yield page
+        last_key = list(page)[-1]
+
+
+def reconcile(page_size=500, dry_run=False):
+    """
+    Make /handymenSummary match /handymen.
+
+    Returns:
+        dict: Counts of scanned handymen and written, deleted and unchanged summaries
+    """
+    summaries = rtdb.reference(SUMMARY_PATH).get() or {}
+    counts = {"scanned": 0, "written": 0, "deleted": 0, "unchanged": 0}
+    seen = set()
+    for page in iter_handyman_pages(page_size):
+        counts["scanned"] += len(page)
+        seen.update(page)
+        page_summaries = {handyman_id: summaries[handyman_id] for handyman_id in page if handyman_id in summaries}
+        updates = summary_updates(page, page_summaries)
+        counts["written"] += sum(1 for summary in updates.values() if summary is not None)
+        counts["deleted"] += sum(1 for summary in updates.values() if summary is None)
+        counts["unchanged"] += len(page) - len(updates)
+        if updates and not dry_run:
+            rtdb.reference(SUMMARY_PATH).update(updates)
+
+    # Summaries of handymen that were removed
+    stale = {handyman_id: None for handyman_id in summaries if handyman_id not in seen}
+    counts["deleted"] += len(stale)
+    if stale and not dry_run:
+        rtdb.reference(SUMMARY_PATH).update(stale)
+    return counts
+
+
+def follow(reconcile_every, page_size):
+    """Write summary changes as /handymen changes, reconciling every reconcile_every seconds"""
+    mirror = TreeMirror(HANDYMEN_PATH, use_listener=True)
+    # Load first and subscribe after: reconcile() already wrote what the load would report
+    mirror.records()
+    sync = SummarySync(mirror)
+    print(f"Following {HANDYMEN_PATH} ({mirror.mode} mode, {len(mirror.records())} handymen)")
+    last_reconcile = time.monotonic()
+    try:
+        while True:
+            time.sleep(min(mirror.ttl, 10))
+            # In poll mode this re-reads /handymen when its ETag changed
+            mirror.records()
+            if reconcile_every and time.monotonic() - last_reconcile > reconcile_every:
+                counts = reconcile(page_size)
+                print("Reconciled: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+                last_reconcile = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mirror.close()
+        print("Follow: " + ", ".join(f"{k}={v}" for k, v in sync.counts.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=500, help="handymen read per query")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--follow", action="store_true", help="keep the summary in step with /handymen")
+    parser.add_argument("--reconcile-every", type=float, default=0,
+                        help="with --follow, seconds between full reconciles (0 = never)")
+    args = parser.parse_args()
+
+    rtdb.initialize_firebase()
+    counts = reconcile(args.page_size, args.dry_run)
+    print(("Dry run: " if args.dry_run else "") + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    if args.follow and not args.dry_run:
+        follow(args.reconcile_every, args.page_size)
+
+
+if __name__ == "__main__":
+    main()